@@ -9,6 +9,7 @@ from qtpy.QtWidgets import *
 from qtpy.QtCore import *
 from qtpy.QtGui import *
 import qtawesome as qta
+import numpy as np
 import pyqtgraph as qtg
 import pyqtgraph.exporters
 
@@ -449,8 +450,20 @@ class LevelWidget(QWidget):
 
 
 class Level(QFrame):
+    """
+    Level and graph of the last x_size imu samples.
+
+    setAngles only stores the sample in a ring buffer, so it is cheap and
+    safe to call from any thread for every sample. The widgets are redrawn
+    on the gui thread by a timer at ``redraw_rate``, when there is something
+    new to draw.
+    """
+
+    # largest graph length the spinner allows
+    MAX_POINTS = 1000
+
     # noinspection PyArgumentList
-    def __init__(self, palette, parent=None):
+    def __init__(self, palette, parent=None, redraw_rate: float = 30):
         super(Level, self).__init__(parent)
 
         self.yaw_text = "Yaw: {}°"
@@ -458,6 +471,15 @@ class Level(QFrame):
         self.roll_text = "Roll: {}°"
         self.x_size = 200
 
+        # roll, pitch, yaw rows, every sample is written twice, capacity
+        # apart, so the newest x_size samples are always one slice. One spare
+        # slot, the one written next is never drawn.
+        self._capacity = self.MAX_POINTS + 1
+        self._samples = np.zeros((3, 2 * self._capacity))
+        # samples ever set, the next one goes to count % capacity
+        self._count = 0
+        self._drawn = 0
+
         if utils.detect_dark(
             (
                 QColor(palette.color(QPalette.Window)).getRgb()[0],
@@ -492,25 +514,16 @@ class Level(QFrame):
         color = palette.color(QPalette.Window)
         self.graph.setBackground(color)
 
-        self.x_roll = list(range(self.x_size))
-        self.y_roll = [0 for _ in range(self.x_size)]
+        x, y = self._window()
 
         pen = qtg.mkPen(color="#F44336")
-        self.roll_line = self.graph.plot(self.x_roll, self.y_roll, pen=pen, name="Roll")
-
-        self.x_pitch = list(range(self.x_size))
-        self.y_pitch = [0 for _ in range(self.x_size)]
+        self.roll_line = self.graph.plot(x, y[0], pen=pen, name="Roll")
 
         pen = qtg.mkPen(color="#FFEB3B")
-        self.pitch_line = self.graph.plot(
-            self.x_pitch, self.y_pitch, pen=pen, name="Pitch"
-        )
-
-        self.x_yaw = list(range(self.x_size))
-        self.y_yaw = [0 for _ in range(self.x_size)]
+        self.pitch_line = self.graph.plot(x, y[1], pen=pen, name="Pitch")
 
         pen = qtg.mkPen(color="#4CAF50")
-        self.yaw_line = self.graph.plot(self.x_yaw, self.y_yaw, pen=pen, name="Yaw")
+        self.yaw_line = self.graph.plot(x, y[2], pen=pen, name="Yaw")
 
         self.settings_layout = QHBoxLayout()
         self._layout.addLayout(self.settings_layout)
@@ -521,7 +534,7 @@ class Level(QFrame):
 
         self.x_len = QSpinner()
         self.x_len.setMinimum(20)
-        self.x_len.setMaximum(1000)
+        self.x_len.setMaximum(self.MAX_POINTS)
         self.x_len.setValue(self.x_size)
         self.x_len.setSingleStep(20)
         self.x_len.spinbox.valueChanged.connect(self._update_graph_len)
@@ -563,39 +576,42 @@ class Level(QFrame):
         self.roll_label.setObjectName("Kevinbot3_RemoteUI_SensorData")
         self.details_layout.addWidget(self.roll_label)
 
+        self._redraw_timer = QTimer(self)
+        self._redraw_timer.timeout.connect(self.redraw)
+        self._redraw_timer.start(round(1000 / redraw_rate))
+
     def setAngles(self, angles):
+        index = self._count % self._capacity
+        self._samples[:, index] = angles
+        self._samples[:, index + self._capacity] = angles
+        self._count += 1
+
+    def redraw(self):
+        count = self._count
+        if count == self._drawn:
+            return
+        self._drawn = count
+
+        x, y = self._window(count)
+        self.roll_line.setData(x, y[0], skipFiniteCheck=True)
+        self.pitch_line.setData(x, y[1], skipFiniteCheck=True)
+        self.yaw_line.setData(x, y[2], skipFiniteCheck=True)
+
+        angles = y[:, -1].tolist()
         self._level.setAngle(angles[0])
         self.yaw_label.setText(self.yaw_text.format(angles[0]))
         self.pitch_label.setText(self.pitch_text.format(angles[1]))
         self.roll_label.setText(self.roll_text.format(angles[2]))
 
-        self.x_roll = self.x_roll[1:]  # Remove the first y element.
-        self.x_roll.append(
-            self.x_roll[-1] + 1
-        )  # Add a new value 1 higher than the last.
-
-        self.y_roll = self.y_roll[1:]  # Remove the first
-        self.y_roll.append(angles[0])  # Add a new random value.
-
-        self.roll_line.setData(self.x_roll, self.y_roll)  # Update the data.
-
-        self.x_pitch = self.x_pitch[1:]  # Remove the first y element.
-        self.x_pitch.append(
-            self.x_pitch[-1] + 1
-        )  # Add a new value 1 higher than the last.
-
-        self.y_pitch = self.y_pitch[1:]  # Remove the first
-        self.y_pitch.append(angles[1])  # Add a new random value.
-
-        self.pitch_line.setData(self.x_pitch, self.y_pitch)  # Update the data.
-
-        self.x_yaw = self.x_yaw[1:]  # Remove the first y element.
-        self.x_yaw.append(self.x_yaw[-1] + 1)  # Add a new value 1 higher than the last.
-
-        self.y_yaw = self.y_yaw[1:]  # Remove the first
-        self.y_yaw.append(angles[2])  # Add a new random value.
-
-        self.yaw_line.setData(self.x_yaw, self.y_yaw)  # Update the data.
+    def _window(self, count: int = None) -> tuple[np.ndarray, np.ndarray]:
+        # sample numbers and a copy of the newest x_size samples, before the
+        # first sample the graph is flat at 0
+        count = self._count if count is None else count
+        end = (count - 1) % self._capacity + self._capacity + 1
+        return (
+            np.arange(count - self.x_size, count, dtype=float),
+            self._samples[:, end - self.x_size : end].copy(),
+        )
 
     def setLineColor(self, color):
         self._level.setLineColor(color)
@@ -610,21 +626,9 @@ class Level(QFrame):
         self._level.setBackgroundColor(color)
 
     def _update_graph_len(self, value):
-        self.x_roll = list(range(value))
-        self.x_yaw = list(range(value))
-        self.x_pitch = list(range(value))
-
-        if value < self.x_size:
-            self.y_roll = self.y_roll[self.x_size - value :]
-            self.y_yaw = self.y_yaw[self.x_size - value :]
-            self.y_pitch = self.y_pitch[self.x_size - value :]
-
-        if value > self.x_size:
-            self.y_roll = ([0] * (value - self.x_size)) + self.y_roll
-            self.y_pitch = ([0] * (value - self.x_size)) + self.y_pitch
-            self.y_yaw = ([0] * (value - self.x_size)) + self.y_yaw
-
-        self.x_size = value
+        # the buffer always holds MAX_POINTS, a longer graph shows older samples
+        self.x_size = min(value, self.MAX_POINTS)
+        self._drawn = -1
 
     def take_image(self):
         exporter = qtg.exporters.ImageExporter(self.graph.plotItem)
@@ -0,0 +1,208 @@
+#!/usr/bin/python
+
+"""
+asyncio XBee link for Kevinbot v3
+Reads the serial port from the event loop instead of a reader thread
+
+    async with AsyncLink("/dev/ttyS0") as link:
+        await link.send("core.ping=1")
+        async for frame in link:
+            ...
+
+Frames are the same dicts the xbee library produces, so they can be passed
+to com.router.dispatch. Run it directly for a headless monitor:
+    python3 aiocom.py --port /dev/ttyS0
+"""
+
+import argparse
+import asyncio
+import os
+from typing import Callable, Optional, Union
+
+import serial
+
+import xbee_frames
+
+BAUD = 460800
+
+
+class AsyncLink:
+    """
+    XBee link driven by loop.add_reader on the serial file descriptor.
+
+    Received bytes are parsed incrementally and the frames are either handed
+    to ``callback`` or queued for ``async for``. Writes go straight to the
+    descriptor, whatever doesn't fit is flushed by loop.add_writer. Posix
+    only, the port has to be a real file descriptor.
+    """
+
+    def __init__(
+        self,
+        port: str,
+        baud: int = BAUD,
+        callback: Optional[Callable[[dict], None]] = None,
+        max_queue: int = 1024,
+    ):
+        self.port = port
+        self.baud = baud
+        self.callback = callback
+
+        self.frames_in = 0
+        self.frames_out = 0
+        self.frames_dropped = 0
+
+        self.ser: Optional[serial.Serial] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reader = xbee_frames.FrameReader()
+        self._frames: asyncio.Queue = asyncio.Queue(max_queue)
+        self._pending = bytearray()
+        self._drained: Optional[asyncio.Future] = None
+        self._closed = True
+
+    async def open(self):
+        self._loop = asyncio.get_running_loop()
+        self.ser = serial.Serial(self.port, self.baud, timeout=0)
+        self.ser.nonblocking()
+        self._closed = False
+        self._loop.add_reader(self.ser.fileno(), self._on_readable)
+
+    async def close(self):
+        self._shutdown()
+
+    def _shutdown(self):
+        if self._closed:
+            return
+        self._closed = True
+        fd = self.ser.fileno()
+        self._loop.remove_reader(fd)
+        self._loop.remove_writer(fd)
+        if self._drained and not self._drained.done():
+            self._drained.set_exception(ConnectionError("Link closed"))
+        self.ser.close()
+        # wake up anyone waiting in __anext__
+        if self._frames.full():
+            self._frames.get_nowait()
+        self._frames.put_nowait(None)
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        frame = await self.read_frame()
+        if frame is None:
+            raise StopAsyncIteration
+        return frame
+
+    async def read_frame(self) -> Optional[dict]:
+        # None once the link is closed
+        if self._closed and self._frames.empty():
+            return None
+        return await self._frames.get()
+
+    async def send(
+        self,
+        data: Union[str, bytes],
+        dest_addr: bytes = b"\x00\x00",
+        frame_id: int = 0,
+    ):
+        if isinstance(data, str):
+            data = bytes(data + "\r", "utf-8")
+        await self.write(xbee_frames.tx(data, dest_addr, frame_id))
+
+    async def send_at(self, command: bytes, parameter: bytes = b"", frame_id: int = 1):
+        await self.write(xbee_frames.at(command, parameter, frame_id))
+
+    async def write(self, frame: bytes):
+        # returns once the frame has been handed to the os
+        if self._closed:
+            raise ConnectionError("Link closed")
+        self.frames_out += 1
+        if self._pending:
+            self._pending += frame
+        else:
+            try:
+                sent = os.write(self.ser.fileno(), frame)
+            except BlockingIOError:
+                sent = 0
+            if sent == len(frame):
+                return
+            self._pending += frame[sent:]
+            self._drained = self._loop.create_future()
+            self._loop.add_writer(self.ser.fileno(), self._on_writable)
+        await asyncio.shield(self._drained)
+
+    def stats(self) -> dict:
+        return {
+            "frames_in": self.frames_in,
+            "frames_out": self.frames_out,
+            "frames_dropped": self.frames_dropped,
+            "bad_frames": self._reader.bad_frames,
+            "queued": self._frames.qsize(),
+        }
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.ser.fileno(), 4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            # the port went away
+            self._shutdown()
+            return
+        for raw in self._reader.feed(data):
+            frame = xbee_frames.parse(raw)
+            if frame is None:
+                continue
+            self.frames_in += 1
+            if self.callback:
+                self.callback(frame)
+            elif self._frames.full():
+                # nobody is reading, keep the newest frames
+                self._frames.get_nowait()
+                self._frames.put_nowait(frame)
+                self.frames_dropped += 1
+            else:
+                self._frames.put_nowait(frame)
+
+    def _on_writable(self):
+        try:
+            sent = os.write(self.ser.fileno(), self._pending)
+        except BlockingIOError:
+            return
+        del self._pending[:sent]
+        if not self._pending:
+            self._loop.remove_writer(self.ser.fileno())
+            self._drained.set_result(None)
+
+
+async def monitor(port: str, baud: int):
+    async with AsyncLink(port, baud) as link:
+        await link.send("core.remotes.get_full")
+        async for frame in link:
+            if "rf_data" in frame:
+                for record in frame["rf_data"].decode("utf-8").split("\r"):
+                    if record:
+                        print(record)
+            else:
+                print(frame)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kevinbot v3 headless monitor")
+    parser.add_argument("--port", required=True, help="XBee serial port")
+    parser.add_argument("--baud", type=int, default=BAUD)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(monitor(args.port, args.baud))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,294 @@
+"""
+Telemetry alarms for Kevinbot v3
+
+Rules come from settings.json, e.g.
+    {"name": "left_motor_hot", "key": "temps", "field": "left", "above": 50,
+     "hysteresis": 3, "severity": "critical",
+     "actions": ["stop_motors", "modal:motor_temp", "style:left_temp"]}
+
+A rule raises once ``field`` (or the worst of a list of fields) has been past
+its threshold for ``debounce`` seconds, and clears once it has been back by
+more than ``hysteresis`` for as long. Actions run once per transition, the
+engine doesn't know what they do, the remote registers them by name. An
+action written "name:arg" gets arg, e.g. the widget to restyle.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Iterable, Optional, Union
+
+from loguru import logger
+
+import telemetry
+
+WARNING = "warning"
+CRITICAL = "critical"
+SEVERITIES = (WARNING, CRITICAL)
+
+
+class Alarm:
+    """One rule and its state, updated by AlarmEngine under its lock."""
+
+    def __init__(
+        self,
+        name: str,
+        key: str,
+        field: Union[str, Iterable[str]],
+        above: Optional[float] = None,
+        below: Optional[float] = None,
+        hysteresis: float = 0.0,
+        debounce: float = 0.0,
+        absolute: bool = False,
+        severity: str = CRITICAL,
+        actions: Iterable[str] = (),
+    ):
+        if (above is None) == (below is None):
+            raise ValueError(f"Alarm {name} needs either above or below")
+        if severity not in SEVERITIES:
+            raise ValueError(f"Alarm {name} has unknown severity {severity}")
+        self.name = name
+        self.key = key
+        self.fields = (field,) if isinstance(field, str) else tuple(field)
+        self.above = above
+        self.below = below
+        self.hysteresis = hysteresis
+        self.debounce = debounce
+        self.absolute = absolute
+        self.severity = severity
+        # "modal:battery" -> ("modal", "battery")
+        self.actions = [tuple(action.partition(":")[::2]) for action in actions]
+
+        self.active = False
+        # time.monotonic() of the last transition
+        self.since: Optional[float] = None
+        self.value: Optional[float] = None
+        self.raised = 0
+        self._pending: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, entry: dict) -> "Alarm":
+        alarm = cls(**entry)
+        names = [field[0] for field in telemetry.SCHEMA[alarm.key]]
+        for field in alarm.fields:
+            if field not in names:
+                raise ValueError(f"{alarm.key} has no field {field}")
+        return alarm
+
+    def has_action(self, name: str, arg: Optional[str] = None) -> bool:
+        return any(n == name and (arg is None or a == arg) for n, a in self.actions)
+
+    def update(self, record: telemetry.Record, now: float) -> bool:
+        # True if the alarm was raised or cleared
+        values = [getattr(record, field) for field in self.fields]
+        if self.absolute:
+            values = [abs(value) for value in values]
+        self.value = max(values) if self.above is not None else min(values)
+
+        if self._past(self.value) == self.active:
+            self._pending = None
+            return False
+        if self._pending is None:
+            self._pending = now
+        if now - self._pending < self.debounce:
+            return False
+        self._pending = None
+        self.active = not self.active
+        self.since = now
+        self.raised += self.active
+        return True
+
+    def _past(self, value: float) -> bool:
+        # an active alarm has to come back by hysteresis to clear
+        if self.above is not None:
+            return value > self.above - (self.hysteresis if self.active else 0)
+        return value < self.below + (self.hysteresis if self.active else 0)
+
+    def __repr__(self):
+        state = "active" if self.active else "clear"
+        return f"Alarm({self.name!r}, {state}, value={self.value})"
+
+
+class AlarmEngine:
+    """
+    Evaluates alarms as telemetry arrives, as a com router handler for
+    every key that has one. Actions and listeners run on that thread.
+    """
+
+    def __init__(self, alarms: Iterable[Alarm] = ()):
+        self.alarms: dict[str, Alarm] = {}
+        self._by_key: dict[str, list[Alarm]] = {}
+        self._actions: dict[str, Callable[[Alarm, bool, str], Any]] = {}
+        self._listeners: list[Callable[[Alarm], Any]] = []
+        self._lock = threading.Lock()
+        self.evaluations = 0
+        self.transitions = 0
+        self.bad_values = 0
+        for alarm in alarms:
+            self.add(alarm)
+
+    def add(self, alarm: Alarm):
+        if alarm.name in self.alarms:
+            raise ValueError(f"Duplicate alarm {alarm.name}")
+        self.alarms[alarm.name] = alarm
+        self._by_key.setdefault(alarm.key, []).append(alarm)
+
+    def keys(self) -> list[str]:
+        return list(self._by_key)
+
+    def add_action(self, name: str, func: Callable[[Alarm, bool, str], Any]):
+        # func(alarm, active, arg) on every transition of an alarm naming it
+        self._actions[name] = func
+
+    def add_listener(self, func: Callable[[Alarm], Any]):
+        self._listeners.append(func)
+
+    def on_message(self, message: Any):
+        try:
+            record = message.record
+        except (KeyError, ValueError, IndexError):
+            self.bad_values += 1
+            return
+        self.update(record)
+
+    def update(self, record: telemetry.Record, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            changed = []
+            for alarm in self._by_key.get(record.key, ()):
+                self.evaluations += 1
+                if alarm.update(record, now):
+                    changed.append(alarm)
+            self.transitions += len(changed)
+        for alarm in changed:
+            self._fire(alarm)
+
+    def active(self, action: Optional[str] = None) -> list[Alarm]:
+        # raised alarms, oldest first, only those with ``action`` if given
+        alarms = [
+            alarm
+            for alarm in self.alarms.values()
+            if alarm.active and (action is None or alarm.has_action(action))
+        ]
+        return sorted(alarms, key=lambda alarm: alarm.since)
+
+    def is_active(self, name: str) -> bool:
+        return self.alarms[name].active
+
+    def stats(self) -> dict:
+        return {
+            "alarms": len(self.alarms),
+            "active": [alarm.name for alarm in self.active()],
+            "evaluations": self.evaluations,
+            "transitions": self.transitions,
+            "bad_values": self.bad_values,
+        }
+
+    def _fire(self, alarm: Alarm):
+        if alarm.active:
+            logger.warning(f"Alarm {alarm.name} raised at {alarm.value}")
+        else:
+            logger.info(f"Alarm {alarm.name} cleared at {alarm.value}")
+        for name, arg in alarm.actions:
+            func = self._actions.get(name)
+            if func is None:
+                logger.error(f"Alarm {alarm.name} has unknown action {name}")
+                continue
+            # noinspection PyBroadException
+            try:
+                func(alarm, alarm.active, arg)
+            except Exception:
+                logger.exception(f"Alarm action {name} of {alarm.name} failed")
+        for listener in self._listeners:
+            # noinspection PyBroadException
+            try:
+                listener(alarm)
+            except Exception:
+                logger.exception(f"Alarm listener {listener} failed")
+
+
+def default_rules(settings: dict) -> list[dict]:
+    # the checks the remote had built in, with the old settings keys
+    voltage = settings.get("warning_voltage", 10)
+    motor_temp = settings.get("motor_temp_warning", 50)
+    return [
+        {
+            "name": "battery1_low",
+            "key": "bms.voltages",
+            "field": "volt1",
+            "below": voltage,
+            "hysteresis": 0.3,
+            "debounce": 2,
+            "actions": ["style:battery1_label"],
+        },
+        {
+            "name": "battery2_low",
+            "key": "bms.voltages",
+            "field": "volt2",
+            "below": voltage,
+            "hysteresis": 0.3,
+            "debounce": 2,
+            "actions": ["style:battery2_label"],
+        },
+        {
+            "name": "battery_critical",
+            "key": "bms.voltages",
+            "field": ["volt1", "volt2"],
+            "below": 11,
+            "hysteresis": 0.3,
+            "debounce": 2,
+            "actions": ["disable", "modal:battery"],
+        },
+        {
+            "name": "left_motor_hot",
+            "key": "temps",
+            "field": "left",
+            "above": motor_temp,
+            "hysteresis": 3,
+            "actions": ["stop_motors", "modal:motor_temp", "style:left_temp"],
+        },
+        {
+            "name": "right_motor_hot",
+            "key": "temps",
+            "field": "right",
+            "above": motor_temp,
+            "hysteresis": 3,
+            "actions": ["stop_motors", "modal:motor_temp", "style:right_temp"],
+        },
+        {
+            "name": "inside_hot",
+            "key": "temps",
+            "field": "inside",
+            "above": 45,
+            "hysteresis": 2,
+            "actions": ["style:robot_temp"],
+        },
+        {
+            "name": "tilt_warning",
+            "key": "imu",
+            "field": "roll",
+            "absolute": True,
+            "above": 10,
+            "hysteresis": 1,
+            "severity": WARNING,
+            "actions": ["style:level"],
+        },
+        {
+            "name": "tilt_critical",
+            "key": "imu",
+            "field": "roll",
+            "absolute": True,
+            "above": 18,
+            "hysteresis": 1,
+            "actions": ["style:level"],
+        },
+    ]
+
+
+def load(entries: Iterable[dict]) -> AlarmEngine:
+    engine = AlarmEngine()
+    for entry in entries:
+        try:
+            engine.add(Alarm.from_dict(entry))
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"Skipping alarm {entry.get('name', entry)}, {e!r}")
+    return engine
@@ -0,0 +1,2 @@
+# Benchmarks for the Kevinbot v3 Remote
+# Run from the repository root, e.g. python3 -m benchmarks.joystick_latency
@@ -0,0 +1,138 @@
+"""
+Serial broker overhead: frame latency with and without broker.py in the path
+
+The simulated robot sits on a pty. Frames are timed from the write until
+the other end has read them, once on the port directly and once through
+the broker's Unix socket, in both directions. The last run goes through
+com.init, which finds the broker by itself and reads it with the rx
+reader's timeout, timing rx to the router and counting reconnects.
+
+    python3 -m benchmarks.broker_latency --frames 2000
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+# com finds the broker through the environment, keep off a real one
+os.environ["KEVINBOT_BROKER"] = os.path.join(tempfile.mkdtemp(), "broker.sock")
+
+import serial  # noqa: E402
+
+import broker  # noqa: E402
+import com  # noqa: E402
+import xbee_frames  # noqa: E402
+from benchmarks.common import quiet_logs, percentiles, print_table  # noqa: E402
+from simulator import RobotSimulator  # noqa: E402
+
+
+def read_frame(port) -> bytes:
+    while port.read(1) != bytes((xbee_frames.START_BYTE,)):
+        pass
+    header = port.read(2)
+    length = (header[0] << 8) | header[1]
+    return port.read(length + 1)
+
+
+def measure(port, simulator: RobotSimulator, frames: int) -> tuple[list, list]:
+    arrived = threading.Event()
+    simulator.on_command = lambda key, value: arrived.set()
+    tx = []
+    for i in range(frames):
+        frame = xbee_frames.tx(f"bench={i}\r".encode())
+        arrived.clear()
+        start = time.perf_counter()
+        port.write(frame)
+        arrived.wait(1)
+        tx.append((time.perf_counter() - start) * 1000)
+    simulator.on_command = None
+
+    rx = []
+    for i in range(frames):
+        start = time.perf_counter()
+        simulator.send(f"bench={i}")
+        read_frame(port)
+        rx.append((time.perf_counter() - start) * 1000)
+    return tx, rx
+
+
+def measure_com(simulator: RobotSimulator, frames: int) -> tuple[list, list]:
+    arrived = threading.Event()
+    simulator.on_command = lambda key, value: arrived.set()
+    tx = []
+    for i in range(frames):
+        arrived.clear()
+        start = time.perf_counter()
+        com.txstr(f"bench={i}", force=True)
+        arrived.wait(1)
+        tx.append((time.perf_counter() - start) * 1000)
+    simulator.on_command = None
+
+    received = threading.Event()
+    com.router.add_monitor(lambda message: received.set())
+    rx = []
+    for i in range(frames):
+        received.clear()
+        start = time.perf_counter()
+        simulator.send(f"bench={i}")
+        received.wait(1)
+        rx.append((time.perf_counter() - start) * 1000)
+        # idle gaps, where the rx reader waits out its timeout
+        if i % 100 == 0:
+            time.sleep(0.3)
+    return tx, rx
+
+
+def row(path: str, direction: str, samples: list[float]) -> list:
+    stats = percentiles(samples)
+    return [
+        path,
+        direction,
+        len(samples),
+        stats["p50"],
+        stats["p95"],
+        stats["p99"],
+        stats["max"],
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--frames", type=int, default=2000)
+    args = parser.parse_args()
+
+    # no telemetry, only the benchmark frames are on the link
+    simulator = RobotSimulator({})
+    simulator.start()
+    rows = []
+
+    direct = serial.Serial(simulator.port, 460800)
+    tx, rx = measure(direct, simulator, args.frames)
+    rows += [row("direct", "tx", tx), row("direct", "rx", rx)]
+
+    serial_broker = broker.SerialBroker(direct)
+    serial_broker.start()
+    client = broker.BrokerPort()
+    tx, rx = measure(client, simulator, args.frames)
+    rows += [row("broker", "tx", tx), row("broker", "rx", rx)]
+    client.close()
+
+    quiet_logs()
+    com.init()
+    tx, rx = measure_com(simulator, args.frames)
+    rows += [row("com", "tx", tx), row("com", "rx", rx)]
+    supervisor = com.supervisor.stats()
+    com.halt()
+    com.radio.ser.close()
+
+    serial_broker.stop()
+    direct.close()
+    simulator.close()
+
+    print_table(["path", "dir", "frames", "p50 ms", "p95 ms", "p99 ms", "max ms"], rows)
+    print(
+        f"com through the broker: {supervisor['errors']} read errors, "
+        f"{supervisor['reconnects']} reconnects"
+    )
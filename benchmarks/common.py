@@ -0,0 +1,50 @@
+# Shared helpers for the benchmarks
+import os
+import statistics
+
+import log
+
+
+def offscreen():
+    # must run before the QApplication is created
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+def quiet_logs(level: int = 30):
+    # per-frame trace logging would dominate the numbers
+    log.setup("benchmark", level)
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    if len(samples) < 2:
+        value = samples[0] if samples else float("nan")
+        return {"p50": value, "p95": value, "p99": value, "max": value}
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98], "max": max(samples)}
+
+
+def print_table(columns: list[str], rows: list[list]):
+    cells = [
+        [f"{c:.2f}" if isinstance(c, float) else str(c) for c in row] for row in rows
+    ]
+    widths = [
+        max(len(columns[i]), *(len(row[i]) for row in cells))
+        for i in range(len(columns))
+    ]
+    print("  ".join(c.rjust(w) for c, w in zip(columns, widths)))
+    for row in cells:
+        print("  ".join(c.rjust(w) for c, w in zip(row, widths)))
+
+
+def load_remote_ui(app):
+    """
+    Import remote-ui.py as a module. The script expects the QApplication
+    in a module global named app, so it is set before the module runs.
+    """
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location("remote_ui", "remote-ui.py")
+    module = importlib.util.module_from_spec(spec)
+    module.app = app
+    spec.loader.exec_module(module)
+    return module
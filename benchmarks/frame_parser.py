@@ -0,0 +1,145 @@
+"""
+RX parsing cost: xbee library + str splitting vs xbee_frames.FrameReader views
+
+Both paths turn the same byte stream of telemetry frames into routed
+Messages. The xbee path is what com did before RxReader: xbee.XBee reads
+the frame into a dict, rf_data is decoded and split as str. The in-tree
+path parses memoryview slices in place and splits records on bytes.
+
+    python3 -m benchmarks.frame_parser --frames 20000
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import xbee
+
+import com
+import xbee_frames
+from benchmarks.common import quiet_logs, print_table
+
+RECORDS = (
+    "imu=1.25,-3.50,187.25",
+    "bms.voltages=123,121",
+    "temps=31.5,30.2,33.0",
+    "bme=21.4,70.5,45,1013",
+    "core.uptime=1234",
+)
+
+
+class BytesPort:
+    """Just enough of serial.Serial for xbee.XBee to read from memory."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def inWaiting(self) -> int:
+        return len(self.data) - self.pos
+
+    def read(self, size: int = 1) -> bytes:
+        chunk = self.data[self.pos : self.pos + size]
+        self.pos += size
+        return chunk
+
+
+def make_frames(count: int, per_frame: int) -> list[bytes]:
+    frames = []
+    for i in range(count):
+        records = [RECORDS[(i + j) % len(RECORDS)] for j in range(per_frame)]
+        frames.append(xbee_frames.rx(("\r".join(records) + "\r").encode()))
+    return frames
+
+
+def make_router(read_value: bool) -> com.Router:
+    router = com.Router()
+    if read_value:
+        handler = lambda message: message.value
+    else:
+        handler = lambda message: message.key
+    for record in RECORDS:
+        router.register(record.split("=")[0], handler)
+    return router
+
+
+def legacy_dispatch(router: com.Router, frame: dict):
+    # Router.dispatch before records were split on bytes
+    for record in frame["rf_data"].decode("utf-8").split(com.DELIMITER):
+        record = record.strip("\r\n")
+        if not record:
+            continue
+        key, _, value = record.partition("=")
+        router.route(com.Message(key, value, record, frame))
+
+
+def run_xbee(frames: list[bytes], router: com.Router):
+    port = BytesPort(b"".join(frames))
+    xb = xbee.XBee(port, escaped=False)
+    for _ in frames:
+        legacy_dispatch(router, xb.wait_read_frame())
+
+
+def run_views(frames: list[bytes], router: com.Router, chunk: int = 256):
+    reader = xbee_frames.FrameReader()
+    data = b"".join(frames)
+    for start in range(0, len(data), chunk):
+        for view in reader.views(data[start : start + chunk]):
+            router.dispatch_frame(view)
+
+
+def peak_per_frame(frames: list[bytes], router: com.Router, path: str) -> float:
+    # largest transient allocation while handling one frame, averaged
+    tracemalloc.start()
+    total = 0
+    if path == "xbee":
+        xb = xbee.XBee(BytesPort(b"".join(frames)), escaped=False)
+        for _ in frames:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            legacy_dispatch(router, xb.wait_read_frame())
+            total += tracemalloc.get_traced_memory()[1] - base
+    else:
+        reader = xbee_frames.FrameReader()
+        for frame in frames:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            for view in reader.views(frame):
+                router.dispatch_frame(view)
+            total += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return total / len(frames)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument(
+        "--records", type=int, default=1, help="records packed into each frame"
+    )
+    args = parser.parse_args()
+
+    quiet_logs()
+    frames = make_frames(args.frames, args.records)
+    rows = []
+    for read_value in (False, True):
+        for path, run in (("xbee", run_xbee), ("views", run_views)):
+            router = make_router(read_value)
+            start = time.perf_counter()
+            run(frames, router)
+            elapsed = time.perf_counter() - start
+            sample = frames[: min(2000, len(frames))]
+            rows.append(
+                [
+                    path,
+                    "value" if read_value else "key only",
+                    args.frames,
+                    args.frames / elapsed,
+                    elapsed / args.frames * 1e6,
+                    peak_per_frame(sample, make_router(read_value), path),
+                ]
+            )
+    print_table(
+        ["path", "handlers read", "frames", "frames/s", "us/frame", "peak B/frame"],
+        rows,
+    )
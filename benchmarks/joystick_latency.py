@@ -0,0 +1,186 @@
+"""
+End-to-end drive latency: Joystick mouse move to frame on the wire
+
+Synthetic QMouseEvents are sent to a Joystick under the offscreen Qt
+platform. Stick positions go through com the same way RemoteUI.motor_action
+does and are timed until the simulated robot reads the motor frame from the
+pty. Meanwhile the simulator floods the RX side with telemetry.
+
+    python3 -m benchmarks.joystick_latency --rx-rate 0 --rx-rate 500 --rx-rate 2000
+"""
+
+import argparse
+import time
+
+from benchmarks.common import offscreen, quiet_logs, percentiles, print_table
+
+offscreen()
+
+from qtpy.QtCore import QEvent, QPointF, Qt
+from qtpy.QtGui import QMouseEvent
+from qtpy.QtWidgets import QApplication
+
+import com
+import telemetry
+import Joystick.Joystick as Joystick
+from simulator import RobotSimulator
+
+TELEMETRY_KEYS = ("imu", "bms.voltages", "temps", "bme")
+
+
+def stick_path(count: int, reach: int = 50) -> list[tuple[int, int]]:
+    # serpentine walk over a grid inside the stick, every position is unique
+    path = []
+    for row, y in enumerate(range(-reach, reach + 1)):
+        xs = range(-reach, reach + 1)
+        for x in xs if row % 2 == 0 else reversed(xs):
+            path.append((x, y))
+            if len(path) == count:
+                return path
+    return path
+
+
+def mouse_event(kind: QEvent.Type, pos: QPointF, buttons) -> QMouseEvent:
+    return QMouseEvent(kind, pos, Qt.MouseButton.LeftButton, buttons, Qt.NoModifier)
+
+
+def run(app: QApplication, rx_rate: float, events: int, event_rate: float, mode: str):
+    rates = {key: rx_rate / len(TELEMETRY_KEYS) for key in TELEMETRY_KEYS}
+    simulator = RobotSimulator(rates)
+    simulator.start()
+
+    received = 0
+    arrivals = []
+    left = None
+
+    def on_command(key: str, value: str):
+        nonlocal left
+        if key == "left_motor":
+            left = int(value)
+        elif key == "right_motor":
+            arrivals.append((time.perf_counter(), (left, int(value))))
+
+    def on_message(message: com.Message):
+        nonlocal received
+        received += 1
+        if message.key in telemetry.codec:
+            telemetry.decode(message.key, message.value)
+
+    simulator.on_command = on_command
+    com.router.add_monitor(on_message)
+    com.init(port=simulator.port)
+    drive_before = com.drive.stats()
+
+    stick = Joystick.Joystick(max_distance=80)
+    stick.resize(200, 200)
+    stick.show()
+    center = QPointF(100, 100)
+
+    submitted_at = {}
+    event_time = 0.0
+
+    def motor_action():
+        x, y = stick.getXY()
+        vals = (1500 + x, 1500 + y)
+        submitted_at[vals] = event_time
+        if mode == "direct":
+            com.txmot(vals)
+        else:
+            com.txdrive(vals)
+
+    stick.posChanged.connect(motor_action)
+    QApplication.sendEvent(
+        stick, mouse_event(QEvent.MouseButtonPress, center, Qt.MouseButton.LeftButton)
+    )
+
+    start = time.perf_counter()
+    next_event = start
+    for x, y in stick_path(events):
+        now = time.perf_counter()
+        if next_event > now:
+            time.sleep(next_event - now)
+        next_event += 1 / event_rate
+        event_time = time.perf_counter()
+        QApplication.sendEvent(
+            stick,
+            mouse_event(
+                QEvent.MouseMove, center + QPointF(x, y), Qt.MouseButton.LeftButton
+            ),
+        )
+        app.processEvents()
+    duration = time.perf_counter() - start
+
+    # let the scheduler and writer drain
+    time.sleep(0.25)
+    stick.posChanged.disconnect(motor_action)
+    com.halt()
+    com.radio.ser.close()
+    com.router.remove_monitor(on_message)
+    simulator.close()
+
+    latencies = [
+        (arrived - submitted_at[vals]) * 1000
+        for arrived, vals in arrivals
+        if vals in submitted_at
+    ]
+    drive = com.drive.stats()
+    stats = percentiles(latencies)
+    return [
+        rx_rate,
+        mode,
+        events,
+        len(arrivals),
+        len(arrivals) / duration,
+        received / duration,
+        stats["p50"],
+        stats["p95"],
+        stats["p99"],
+        stats["max"],
+        drive["coalesced"] - drive_before["coalesced"],
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--rx-rate",
+        type=float,
+        action="append",
+        help="telemetry messages/s from the robot, repeat to sweep (default 0, 200, 1000)",
+    )
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument(
+        "--event-rate", type=float, default=500, help="mouse move events per second"
+    )
+    parser.add_argument(
+        "--mode",
+        choices=("scheduled", "direct", "both"),
+        default="both",
+        help="scheduled uses com.txdrive, direct calls com.txmot per event",
+    )
+    args = parser.parse_args()
+
+    quiet_logs()
+    app = QApplication([])
+    modes = ("scheduled", "direct") if args.mode == "both" else (args.mode,)
+    rows = [
+        run(app, rx_rate, args.events, args.event_rate, mode)
+        for rx_rate in args.rx_rate or [0, 200, 1000]
+        for mode in modes
+    ]
+    print_table(
+        [
+            "rx/s",
+            "mode",
+            "events",
+            "frames",
+            "frames/s",
+            "rx msg/s",
+            "p50 ms",
+            "p95 ms",
+            "p99 ms",
+            "max ms",
+            "coalesced",
+        ],
+        rows,
+    )
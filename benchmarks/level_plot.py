@@ -0,0 +1,108 @@
+"""
+Level graph cost on the gui thread: per-sample list slicing vs ring buffer
+
+The list path is what Level.setAngles did before the ring buffer: slice
+and append six lists and setData all three lines for every imu sample.
+The ring buffer path stores every sample and lets the redraw timer draw.
+Both run against the same Level, offscreen, while samples arrive at
+``--rate``.
+
+    python3 -m benchmarks.level_plot --rate 50 --rate 200 --points 200 --points 1000
+"""
+
+import argparse
+import math
+import time
+
+from benchmarks.common import offscreen, quiet_logs, print_table
+
+offscreen()
+
+from qtpy.QtWidgets import QApplication
+
+from QCustomWidgets import Level
+
+
+class ListPlot:
+    # Level.setAngles before the ring buffer
+    def __init__(self, level: Level, points: int):
+        self.level = level
+        self.x = [list(range(points)) for _ in range(3)]
+        self.y = [[0] * points for _ in range(3)]
+        self.lines = (level.roll_line, level.pitch_line, level.yaw_line)
+
+    def set_angles(self, angles):
+        self.level._level.setAngle(angles[0])
+        self.level.yaw_label.setText(self.level.yaw_text.format(angles[0]))
+        self.level.pitch_label.setText(self.level.pitch_text.format(angles[1]))
+        self.level.roll_label.setText(self.level.roll_text.format(angles[2]))
+        for i, line in enumerate(self.lines):
+            self.x[i] = self.x[i][1:]
+            self.x[i].append(self.x[i][-1] + 1)
+            self.y[i] = self.y[i][1:]
+            self.y[i].append(angles[i])
+            line.setData(self.x[i], self.y[i])
+
+
+def run(app: QApplication, path: str, rate: float, points: int, seconds: float):
+    level = Level(app.palette())
+    level.resize(500, 320)
+    level.show()
+    level.x_len.setValue(points)
+    level._update_graph_len(points)
+    if path == "lists":
+        level._redraw_timer.stop()
+        set_angles = ListPlot(level, points).set_angles
+    else:
+        set_angles = level.setAngles
+
+    busy = 0.0
+    samples = 0
+    start = time.monotonic()
+    due = start
+    while time.monotonic() - start < seconds:
+        now = time.monotonic()
+        if now >= due:
+            angle = math.sin(samples / 20) * 20
+            begin = time.perf_counter()
+            set_angles((angle, angle / 2, angle * 3))
+            busy += time.perf_counter() - begin
+            samples += 1
+            due += 1 / rate
+        begin = time.perf_counter()
+        app.processEvents()
+        busy += time.perf_counter() - begin
+        time.sleep(0.0005)
+    level.close()
+    return [path, rate, points, samples, busy / seconds * 1000, busy / samples * 1e6]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--rate",
+        type=float,
+        action="append",
+        help="imu samples/s, repeat to sweep (default 50, 200)",
+    )
+    parser.add_argument(
+        "--points",
+        type=int,
+        action="append",
+        help="graph length, repeat to sweep (default 200, 1000)",
+    )
+    parser.add_argument("--seconds", type=float, default=3)
+    args = parser.parse_args()
+
+    quiet_logs()
+    app = QApplication([])
+    rows = [
+        run(app, path, rate, points, args.seconds)
+        for rate in args.rate or [50, 200]
+        for points in args.points or [200, 1000]
+        for path in ("lists", "ring buffer")
+    ]
+    print_table(
+        ["path", "samples/s", "points", "samples", "gui ms/s", "us/sample"],
+        rows,
+    )
@@ -0,0 +1,129 @@
+"""
+Link-loss failsafe: time from the last frame heard to the robot stopping
+
+The simulated robot streams telemetry while the remote drives it. Each
+trial mutes the simulator at a random point, so the remote stops hearing
+the robot while commands still reach it. The remote's own radio keeps
+answering with no ack tx_status frames, which must not count as the robot.
+Times are measured from the last frame the remote received until the
+watchdog trips, and until the stop command arrives at the robot.
+
+    python3 -m benchmarks.link_failsafe --trials 50 --rx-rate 10 --rx-rate 200
+"""
+
+import argparse
+import random
+import threading
+import time
+
+import com
+from benchmarks.common import quiet_logs, percentiles, print_table
+from simulator import RobotSimulator
+
+
+def run(rx_rate: float, trials: int, deadline: float) -> list:
+    simulator = RobotSimulator({"imu": rx_rate})
+    simulator.start()
+
+    last_rx = 0.0
+    stopped_at = 0.0
+    stopped = threading.Event()
+    tripped = threading.Event()
+
+    def on_message(_):
+        nonlocal last_rx
+        last_rx = time.monotonic()
+
+    def on_command(key: str, _):
+        nonlocal stopped_at
+        if key == "stop" and not stopped.is_set():
+            stopped_at = time.monotonic()
+            stopped.set()
+
+    def on_state(state: com.LinkState):
+        if state is com.LinkState.LOST:
+            tripped.set()
+
+    com.watchdog.deadline = deadline
+    com.watchdog.add_listener(on_state)
+    com.router.add_monitor(on_message)
+    simulator.on_command = on_command
+    com.init(port=simulator.port)
+
+    detect = []
+    stop = []
+    missed = 0
+    for i in range(trials):
+        simulator.muted = False
+        # the previous trial's stop may still be retrying
+        while (
+            com.watchdog.state is not com.LinkState.CONNECTED
+            or com.deliveries.stats()["in_flight"]
+        ):
+            time.sleep(0.01)
+        stopped.clear()
+        tripped.clear()
+        # keep the drive lane busy so the stop has to get past it
+        com.txdrive((1500 + i % 100, 1600))
+        time.sleep(random.uniform(0.1, 0.3))
+        simulator.muted = True
+        if not tripped.wait(deadline * 4) or not stopped.wait(1):
+            missed += 1
+            continue
+        detect.append(com.watchdog.last_detection * 1000)
+        stop.append((stopped_at - last_rx) * 1000)
+
+    simulator.muted = False
+    com.halt()
+    com.radio.ser.close()
+    com.router.remove_monitor(on_message)
+    com.watchdog.remove_listener(on_state)
+    simulator.close()
+
+    d, s = percentiles(detect), percentiles(stop)
+    return [
+        rx_rate,
+        deadline * 1000,
+        len(detect),
+        missed,
+        d["p50"],
+        d["max"],
+        s["p50"],
+        s["p99"],
+        s["max"],
+        s["max"] - deadline * 1000,
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--rx-rate",
+        type=float,
+        action="append",
+        help="telemetry messages/s from the robot, repeat to sweep (default 10, 200)",
+    )
+    parser.add_argument("--trials", type=int, default=30)
+    parser.add_argument("--deadline", type=float, default=com.LINK_DEADLINE)
+    args = parser.parse_args()
+
+    quiet_logs(40)
+    rows = [
+        run(rx_rate, args.trials, args.deadline)
+        for rx_rate in args.rx_rate or [10, 200]
+    ]
+    print_table(
+        [
+            "rx/s",
+            "deadline ms",
+            "trials",
+            "missed",
+            "detect p50",
+            "detect max",
+            "stop p50",
+            "stop p99",
+            "stop max",
+            "worst over deadline",
+        ],
+        rows,
+    )
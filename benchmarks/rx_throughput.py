@@ -0,0 +1,351 @@
+"""
+RX throughput of the RemoteUI handlers and the get_updater UI path
+
+Synthetic frames of each message type are dispatched through com.router
+from a feeder thread, the way the xbee reader thread delivers them, into a
+real RemoteUI under the offscreen Qt platform. The global ThreadUpdater,
+the window's ViewModel and the Level graph's redraw are instrumented to
+count queued, coalesced (dropped) and late UI updates and time them on the
+GUI thread per message type.
+
+    python3 -m benchmarks.rx_throughput --rate 2000 --duration 3
+"""
+
+import argparse
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from benchmarks.common import (
+    offscreen,
+    quiet_logs,
+    print_table,
+    load_remote_ui,
+)
+
+offscreen()
+
+from qtpy.QtCore import QEventLoop, QTimer
+from qtpy.QtWidgets import QApplication
+import qt_thread_updater
+from qt_thread_updater import ThreadUpdater
+
+import viewmodel
+from simulator import RobotSimulator
+
+# a UI call is late when it runs more than this long after it was queued
+LATE_AFTER = 0.1
+
+SAMPLES = {
+    "bms.voltages": lambda: f"{random.randint(115, 125)},{random.randint(115, 125)}",
+    "temps": lambda: f"{random.uniform(20, 40):.1f},{random.uniform(20, 40):.1f},"
+    f"{random.uniform(25, 35):.1f}",
+    "imu": lambda: f"{random.uniform(-8, 8):.2f},{random.uniform(-8, 8):.2f},"
+    f"{random.uniform(0, 360):.2f}",
+    "bme": lambda: f"{random.uniform(18, 24):.1f},{random.uniform(64, 75):.1f},"
+    f"{random.randint(30, 60)},{random.randint(1000, 1020)}",
+    "core.uptime": lambda: str(random.randint(0, 100000)),
+    "os_uptime": lambda: str(random.randint(0, 100000)),
+    "remote.disableui": lambda: random.choice(("true", "false")),
+    "eye_settings.display.backlight": lambda: str(random.randint(0, 100)),
+    "eye_settings.motions.speed": lambda: str(random.randint(1, 50)),
+    "eye_settings.states.motion": lambda: random.choice(("1", "2", "3")),
+}
+
+
+class InstrumentedUpdater(ThreadUpdater):
+    """ThreadUpdater that accounts call_latest traffic to the message being routed"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.current = threading.local()
+        self.counters: dict[str, dict[str, float]] = {}
+        self._owners = {}
+
+    def _counter(self, key: str) -> dict[str, float]:
+        if key not in self.counters:
+            self.counters[key] = {
+                "queued": 0,
+                "dropped": 0,
+                "applied": 0,
+                "late": 0,
+                "gui_time": 0.0,
+            }
+        return self.counters[key]
+
+    def key(self) -> str:
+        return getattr(self.current, "key", "other")
+
+    def queued(self, key: str, dropped: bool):
+        with self._lock:
+            counter = self._counter(key)
+            counter["queued"] += 1
+            counter["dropped"] += dropped
+
+    def applied(self, key: str, queued: float, start: float, end: float):
+        with self._lock:
+            counter = self._counter(key)
+            counter["applied"] += 1
+            counter["gui_time"] += end - start
+            if start - queued > LATE_AFTER:
+                counter["late"] += 1
+
+    def call_latest(self, func, *args, **kwargs):
+        key = self.key()
+        with self._lock:
+            counter = self._counter(key)
+            counter["queued"] += 1
+            if func in self._latest_call:
+                counter["dropped"] += 1
+            self._latest_call[func] = (args, kwargs)
+            self._owners[func] = (key, time.perf_counter())
+        self.ensure_running()
+
+    def run_update(self):
+        with self._lock:
+            latest, self._latest_call = self._latest_call, OrderedDict()
+            owners = {func: self._owners.pop(func, ("other", 0.0)) for func in latest}
+            main, self._every_call = self._every_call, OrderedDict()
+
+        for func, (args, kwargs) in latest.items():
+            key, queued = owners[func]
+            start = time.perf_counter()
+            with self.handle_error(func):
+                func(*args, **kwargs)
+            self.applied(key, queued, start, time.perf_counter())
+
+        for func, calls in main.items():
+            for args, kwargs in calls:
+                with self.handle_error(func):
+                    func(*args, **kwargs)
+
+
+class InstrumentedView(viewmodel.ViewModel):
+    """ViewModel that accounts its writes and frames like InstrumentedUpdater"""
+
+    def __init__(self, updater: InstrumentedUpdater, parent=None):
+        super().__init__(parent=parent)
+        self.updater = updater
+        # func -> (message, time of the first write since the last frame)
+        self._owners = {}
+
+    def set(self, setter, value):
+        with self._lock:
+            dropped = (
+                setter in self._pending
+                or self._applied.get(setter, viewmodel._UNSET) == value
+            )
+        self._own(setter, dropped)
+        super().set(setter, value)
+
+    def call(self, func, *args):
+        with self._lock:
+            dropped = func in self._pending
+        self._own(func, dropped)
+        super().call(func, *args)
+
+    def _own(self, func, dropped: bool):
+        key = self.updater.key()
+        self.updater.queued(key, dropped)
+        if not dropped:
+            self._owners[func] = (key, time.perf_counter())
+
+    def apply(self):
+        if not self._pending:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            owners, self._owners = self._owners, {}
+        self.frames += 1
+        for func, (call, args) in pending.items():
+            if not call:
+                if self._applied.get(func, viewmodel._UNSET) == args[0]:
+                    self.unchanged += 1
+                    continue
+                self._applied[func] = args[0]
+            key, queued = owners.get(func, ("other", 0.0))
+            start = time.perf_counter()
+            self.applied += 1
+            with self.updater.handle_error(func):
+                func(*args)
+            self.updater.applied(key, queued, start, time.perf_counter())
+
+
+def instrument_level(level, updater: InstrumentedUpdater):
+    # every sample is plotted, but those arriving between two redraws are
+    # coalesced into one update like a call_latest
+    set_angles, redraw = level.setAngles, level.redraw
+    pending = []
+
+    def timed_set_angles(angles):
+        key = updater.key()
+        updater.queued(key, bool(pending))
+        if not pending:
+            pending.append((key, time.perf_counter()))
+        set_angles(angles)
+
+    def timed_redraw():
+        if not pending:
+            return
+        key, queued = pending.pop()
+        start = time.perf_counter()
+        redraw()
+        updater.applied(key, queued, start, time.perf_counter())
+
+    level.setAngles = timed_set_angles
+    level._redraw_timer.timeout.disconnect()
+    level._redraw_timer.timeout.connect(timed_redraw)
+    return timed_redraw
+
+
+def feed(router, updater, keys: list[str], rate: float, duration: float, counts):
+    period = 1 / rate
+    frames = {
+        key: [
+            {"id": "rx", "rf_data": f"{key}={SAMPLES[key]()}\r".encode()}
+            for _ in range(64)
+        ]
+        for key in keys
+    }
+    start = time.perf_counter()
+    next_frame = start
+    index = 0
+    while time.perf_counter() - start < duration:
+        now = time.perf_counter()
+        if next_frame > now:
+            time.sleep(next_frame - now)
+        # fall behind rather than burst when the handlers can't keep up
+        next_frame = max(next_frame + period, time.perf_counter() - period)
+        key = keys[index % len(keys)]
+        updater.current.key = key
+        router.dispatch(frames[key][index % 64])
+        counts[key] = counts.get(key, 0) + 1
+        index += 1
+    updater.current.key = "other"
+
+
+def run(
+    app, rui, updater, flush, keys: list[str], rate: float, duration: float
+) -> list[list]:
+    import com
+
+    updater.counters.clear()
+    router_before = com.router.stats()
+    counts = {}
+    feeder = threading.Thread(
+        target=feed,
+        args=(com.router, updater, keys, rate * len(keys), duration, counts),
+    )
+    # run a real event loop on the GUI thread until the feeder is done
+    loop = QEventLoop()
+    watcher = QTimer()
+    watcher.timeout.connect(lambda: feeder.is_alive() or loop.quit())
+    watcher.start(50)
+    start = time.perf_counter()
+    feeder.start()
+    loop.exec_()
+    watcher.stop()
+    # apply whatever is still queued
+    updater.run_update()
+    flush()
+    app.processEvents()
+    elapsed = time.perf_counter() - start
+
+    router_after = com.router.stats()
+    rows = []
+    for key in keys:
+        handled = router_after[key]["count"] - router_before.get(key, {}).get(
+            "count", 0
+        )
+        handler_time = router_after[key]["time"] - router_before.get(key, {}).get(
+            "time", 0.0
+        )
+        counter = updater.counters.get(
+            key, {"queued": 0, "dropped": 0, "applied": 0, "late": 0, "gui_time": 0.0}
+        )
+        rows.append(
+            [
+                key,
+                rate,
+                counts.get(key, 0) / elapsed,
+                handler_time / max(handled, 1) * 1e6,
+                counter["queued"],
+                counter["dropped"],
+                counter["applied"],
+                counter["late"],
+                counter["gui_time"] / max(handled, 1) * 1e6,
+                counter["gui_time"] / elapsed * 100,
+            ]
+        )
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--rate", type=float, default=1000, help="messages/s of each message type"
+    )
+    parser.add_argument("--duration", type=float, default=3)
+    parser.add_argument(
+        "--type",
+        action="append",
+        choices=sorted(SAMPLES),
+        help="message types to feed, repeat for several (default all)",
+    )
+    parser.add_argument(
+        "--mixed",
+        action="store_true",
+        help="feed all selected types at once instead of one at a time",
+    )
+    args = parser.parse_args()
+
+    # RemoteUI opens the serial port on start, give it a quiet simulator
+    simulator = RobotSimulator(rates={})
+    simulator.start()
+    os.environ["KEVINBOT_PORT"] = simulator.port
+
+    app = QApplication([])
+    updater = InstrumentedUpdater()
+    qt_thread_updater.set_updater(updater)
+    rui = load_remote_ui(app)
+    quiet_logs()
+    rui.window = rui.RemoteUI()
+    rui.window.view.stop()
+    rui.window.view = InstrumentedView(updater, rui.window)
+    redraw_level = instrument_level(rui.window.level, updater)
+    for _ in range(20):
+        app.processEvents()
+        time.sleep(0.01)
+
+    def flush():
+        rui.window.view.apply()
+        redraw_level()
+
+    keys = args.type or sorted(SAMPLES)
+    rows = []
+    if args.mixed:
+        rows += run(app, rui, updater, flush, keys, args.rate, args.duration)
+    else:
+        for key in keys:
+            rows += run(app, rui, updater, flush, [key], args.rate, args.duration)
+
+    rui.window.close()
+    simulator.close()
+
+    print_table(
+        [
+            "type",
+            "target/s",
+            "msg/s",
+            "handler us",
+            "ui queued",
+            "ui dropped",
+            "ui applied",
+            "ui late",
+            "gui us/msg",
+            "gui %",
+        ],
+        rows,
+    )
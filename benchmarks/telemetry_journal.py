@@ -0,0 +1,119 @@
+"""
+Telemetry journal cost: appends on the rx thread and time range reads
+
+A session of ``--hours`` at the simulator's default telemetry rates is
+written to a scratch directory with synthetic times, then read back. Range
+reads go through the segment index and are compared to filtering every
+record of the journal.
+
+    python3 -m benchmarks.telemetry_journal --hours 3
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import journal
+from benchmarks.common import quiet_logs, percentiles, print_table
+from simulator import DEFAULT_RATES
+
+VALUES = {
+    "imu": (1.25, -3.5, 187.25),
+    "bms.voltages": (12.3, 12.1),
+    "temps": (31.5, 30.2, 33.0),
+    "bme": (21.4, 70.5, 45.0, 1013.0),
+    "core.uptime": (1234,),
+    "os_uptime": (5678,),
+}
+
+
+def session(hours: float) -> list[tuple[float, str]]:
+    start = time.time()
+    samples = []
+    for key, rate in DEFAULT_RATES.items():
+        count = int(hours * 3600 * rate)
+        samples += [(start + i / rate, key) for i in range(count)]
+    samples.sort()
+    return samples
+
+
+def time_appends(directory: str, samples: list, segment_mb: float) -> list:
+    writer = journal.JournalWriter(
+        directory, segment_size=int(segment_mb * 1024 * 1024)
+    )
+    writer.start()
+    start = time.perf_counter()
+    for t, key in samples:
+        writer.append(key, VALUES[key], t)
+    elapsed = time.perf_counter() - start
+    writer.close()
+    size = sum(os.path.getsize(path) for path in journal.segment_paths(directory))
+    return [
+        len(samples),
+        writer.segments,
+        size / 1024 / 1024,
+        size / len(samples),
+        elapsed / len(samples) * 1e6,
+    ]
+
+
+def time_reads(directory: str, repeats: int) -> list[list]:
+    rows = []
+    with journal.JournalReader(directory) as reader:
+        # the naive way, every record of every segment
+        def scan(key, start, end):
+            number = reader.segments[0].channels[key][0]
+            parts = []
+            for segment in reader.segments:
+                rows = segment.records
+                parts.append(
+                    rows[
+                        (rows["channel"] == number)
+                        & (rows["time"] >= start)
+                        & (rows["time"] <= end)
+                    ]
+                )
+            picked = np.concatenate(parts)
+            return picked["time"], picked["values"]
+
+        for key, seconds in (("bms.voltages", 60), ("imu", 60), ("imu", 600)):
+            for name, read in (("index", reader.read), ("scan", scan)):
+                samples = []
+                for i in range(repeats):
+                    # spread the windows over the whole session
+                    start = reader.start + (reader.end - reader.start - seconds) * (
+                        i / repeats
+                    )
+                    begin = time.perf_counter()
+                    result = read(key, start, start + seconds)
+                    samples.append((time.perf_counter() - begin) * 1e3)
+                stats = percentiles(samples)
+                rows.append(
+                    [key, seconds, name, len(result[0]), stats["p50"], stats["max"]]
+                )
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--hours", type=float, default=3)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument(
+        "--segment-mb", type=float, default=journal.SEGMENT_SIZE / 1024 / 1024
+    )
+    args = parser.parse_args()
+
+    quiet_logs()
+    with tempfile.TemporaryDirectory() as directory:
+        print_table(
+            ["records", "segments", "MiB", "B/record", "append us"],
+            [time_appends(directory, session(args.hours), args.segment_mb)],
+        )
+        print()
+        print_table(
+            ["key", "window s", "read", "samples", "p50 ms", "max ms"],
+            time_reads(directory, args.repeats),
+        )
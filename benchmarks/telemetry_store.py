@@ -0,0 +1,102 @@
+"""
+Telemetry store cost: appends from the rx side and queries from the gui side
+
+Appends go through TelemetryStore.on_message the way the com router calls
+it, including the one decode per message, and are compared to decoding
+alone. Queries run on a full channel while a writer thread keeps appending.
+
+    python3 -m benchmarks.telemetry_store --samples 100000
+"""
+
+import argparse
+import threading
+import time
+
+import com
+import telemetry
+from benchmarks.common import quiet_logs, percentiles, print_table
+
+VALUES = {
+    "imu": b"1.25,-3.50,187.25",
+    "bms.voltages": b"123,121",
+    "temps": b"31.5,30.2,33.0",
+    "bme": b"21.4,70.5,45,1013",
+}
+
+
+def time_appends(samples: int) -> list[list]:
+    rows = []
+    for key, value in VALUES.items():
+        messages = [com.Message(key, value) for _ in range(samples)]
+        start = time.perf_counter()
+        for message in messages:
+            telemetry.decode(message.key, message.value)
+        decode = time.perf_counter() - start
+
+        store = telemetry.TelemetryStore()
+        messages = [com.Message(key, value) for _ in range(samples)]
+        start = time.perf_counter()
+        for message in messages:
+            store.on_message(message)
+        append = time.perf_counter() - start
+        rows.append([key, samples, decode / samples * 1e6, append / samples * 1e6])
+    return rows
+
+
+def time_queries(repeats: int, rate: float) -> list[list]:
+    store = telemetry.TelemetryStore()
+    channel = store["imu"]
+    # fill the channel as if imu had been arriving at ``rate`` for a while
+    now = time.monotonic()
+    for i in range(channel.capacity):
+        channel.append((i, -i, i / 2), now - (channel.capacity - i) / rate)
+
+    running = True
+
+    def writer():
+        while running:
+            channel.append((1.0, 2.0, 3.0))
+            time.sleep(1 / rate)
+
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
+    queries = {
+        "snapshot": lambda: channel.snapshot(),
+        "latest": lambda: store.latest("imu"),
+        "window 10 s": lambda: store.window("imu", 10),
+        "stats 60 s": lambda: store.stats("imu", 60),
+        "decimated 500": lambda: store.decimated("imu", 600, 500),
+    }
+    rows = []
+    for name, query in queries.items():
+        samples = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            query()
+            samples.append((time.perf_counter() - start) * 1e6)
+        stats = percentiles(samples)
+        rows.append([name, channel.capacity, stats["p50"], stats["p99"], stats["max"]])
+    running = False
+    thread.join()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--samples", type=int, default=100000)
+    parser.add_argument("--repeats", type=int, default=2000)
+    parser.add_argument(
+        "--rate", type=float, default=200, help="imu samples/s while querying"
+    )
+    args = parser.parse_args()
+
+    quiet_logs()
+    print_table(
+        ["key", "samples", "decode us", "decode+append us"],
+        time_appends(args.samples),
+    )
+    print()
+    print_table(
+        ["query", "channel size", "p50 us", "p99 us", "max us"],
+        time_queries(args.repeats, args.rate),
+    )
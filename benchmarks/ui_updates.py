@@ -0,0 +1,121 @@
+"""
+GUI thread work for telemetry: get_updater().call_latest vs viewmodel.ViewModel
+
+A thread plays the rx side, writing what RemoteUI.rx_temps writes per temps
+frame (three texts, three styles, the stick) into QLabels at ``--rate``.
+Every setter is timed on the gui thread, so the table shows how many updates
+ran there and how long they kept it busy.
+
+    python3 -m benchmarks.ui_updates --rate 10 --rate 100 --rate 1000
+"""
+
+import argparse
+import threading
+import time
+
+from benchmarks.common import offscreen, quiet_logs, print_table
+
+offscreen()
+
+from qtpy.QtWidgets import QApplication, QLabel
+from qt_thread_updater import get_updater
+
+import viewmodel
+
+STYLES = ("", "background-color: #df574d;")
+
+
+class Timed:
+    # one per setter, so both paths key on the same callable
+    def __init__(self, func):
+        self.func = func
+        self.calls = 0
+        self.busy = 0.0
+
+    def __call__(self, *args):
+        start = time.perf_counter()
+        self.func(*args)
+        self.busy += time.perf_counter() - start
+        self.calls += 1
+
+
+def run(app: QApplication, path: str, rate: float, seconds: float) -> list:
+    labels = [QLabel() for _ in range(4)]
+    texts = [Timed(label.setText) for label in labels[:3]]
+    styles = [Timed(label.setStyleSheet) for label in labels[:3]]
+    stick = Timed(labels[3].setDisabled)
+    setters = texts + styles + [stick]
+
+    view = viewmodel.ViewModel()
+    if path == "call_latest":
+        write = call = get_updater().call_latest
+    else:
+        write, call = view.set, view.call
+
+    running = True
+    writes = 0
+
+    def rx():
+        nonlocal writes
+        i = 0
+        while running:
+            temp = 40 + i % 20
+            for text in texts:
+                write(text, f"Left Motor Temp: {temp}℃ ({temp * 1.8 + 32:.1f}℉)")
+            for style in styles:
+                # the label only turns red above 50
+                write(style, STYLES[temp > 50])
+            if temp > 50:
+                call(stick, True)
+            writes += 6 + (temp > 50)
+            i += 1
+            time.sleep(1 / rate)
+
+    thread = threading.Thread(target=rx, daemon=True)
+    start = time.monotonic()
+    thread.start()
+    while time.monotonic() - start < seconds:
+        app.processEvents()
+        time.sleep(0.001)
+    running = False
+    thread.join()
+    # let the last frame through
+    end = time.monotonic() + 0.1
+    while time.monotonic() < end:
+        app.processEvents()
+    view.stop()
+
+    applied = sum(setter.calls for setter in setters)
+    busy = sum(setter.busy for setter in setters)
+    return [
+        path,
+        rate,
+        writes,
+        applied,
+        100 * (1 - applied / writes),
+        busy / seconds * 1000,
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--rate",
+        type=float,
+        action="append",
+        help="temps frames/s, repeat to sweep (default 10, 100, 1000)",
+    )
+    parser.add_argument("--seconds", type=float, default=3)
+    args = parser.parse_args()
+
+    quiet_logs()
+    app = QApplication([])
+    rows = [
+        run(app, path, rate, args.seconds)
+        for rate in args.rate or [10, 100, 1000]
+        for path in ("call_latest", "viewmodel")
+    ]
+    print_table(
+        ["path", "frames/s", "writes", "applied", "saved %", "gui ms/s"],
+        rows,
+    )
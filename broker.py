@@ -0,0 +1,388 @@
+#!/usr/bin/python
+
+"""
+Kevinbot v3 serial broker
+Owns the XBee serial port and shares it with any number of local apps
+
+Start it once, every app that calls com.init() afterwards goes through it:
+    python3 broker.py --port /dev/ttyS0
+    python3 remote-ui.py &
+    python3 terminal.py
+"""
+
+import argparse
+import os
+import select
+import selectors
+import socket
+import tempfile
+import threading
+import time
+from typing import Optional
+
+import serial
+from loguru import logger
+from serial import SerialException
+
+import xbee_frames
+
+# where the broker listens, com looks here before opening the port itself
+SOCKET_PATH = os.environ.get(
+    "KEVINBOT_BROKER", os.path.join(tempfile.gettempdir(), "kevinbot-xbee.sock")
+)
+
+# clients that fall this far behind are disconnected
+MAX_BACKLOG = 1 << 20
+
+# frames carrying a frame id, and the responses that echo it back
+REQUESTS = (xbee_frames.TX, xbee_frames.TX_LONG_ADDR, xbee_frames.AT)
+RESPONSES = (xbee_frames.TX_STATUS, xbee_frames.AT_RESPONSE)
+
+
+class SerialBroker:
+    """
+    Relay XBee API frames between a serial port and Unix socket clients.
+
+    Frames read from the port are sent to every client, frames from a client
+    are written to the port whole, so writes from several apps never
+    interleave. Frames are passed through as bytes and never decoded.
+    Everything runs on a single selector thread.
+
+    Every app numbers its frame ids from 1, so ids of frames written to the
+    port are replaced with the broker's own. The tx status or AT response
+    carrying one goes back to the client that sent the frame only, with
+    the client's id restored.
+
+    If the port fails the broker drops every client and stops listening, so
+    their links fail over instead of waiting on a dead relay. ``error`` holds
+    what happened, a new broker can share the port once it's back.
+    """
+
+    def __init__(self, ser: serial.Serial, path: str = SOCKET_PATH):
+        self.ser = ser
+        self.path = path
+
+        self.frames_in = 0
+        self.frames_out = 0
+        self.bad_frames = 0
+        self.unmatched = 0
+        self.error: Optional[Exception] = None
+
+        self._selector = selectors.DefaultSelector()
+        self._server: Optional[socket.socket] = None
+        # client: (frame reader, unsent bytes)
+        self._clients: dict[
+            socket.socket, tuple[xbee_frames.FrameReader, bytearray]
+        ] = {}
+        self._reader = xbee_frames.FrameReader()
+        # broker frame id: (client, the client's frame id)
+        self._frame_ids: dict[int, tuple[socket.socket, int]] = {}
+        self._next_id = 0
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self._wake_r, self._wake_w = os.pipe()
+
+    @property
+    def clients(self) -> int:
+        return len(self._clients)
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self):
+        if os.path.exists(self.path):
+            # a socket left behind by a broker that didn't exit cleanly
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except ConnectionRefusedError:
+                os.unlink(self.path)
+            else:
+                raise RuntimeError(f"A broker is already running on {self.path}")
+            finally:
+                probe.close()
+
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.path)
+        self._server.listen()
+        self._server.setblocking(False)
+
+        self.ser.timeout = 0
+        self._selector.register(self._server, selectors.EVENT_READ, self._accept)
+        self._selector.register(
+            self.ser.fileno(), selectors.EVENT_READ, self._read_serial
+        )
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name="SerialBroker", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if self._wake_w is None:
+            return
+        self._running = False
+        os.write(self._wake_w, b"\x00")
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        for client in list(self._clients):
+            self._drop(client)
+        self._selector.close()
+        self._close_server()
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+        self._wake_r = self._wake_w = None
+
+    def stats(self) -> dict:
+        return {
+            "clients": self.clients,
+            "frames_in": self.frames_in,
+            "frames_out": self.frames_out,
+            "bad_frames": self.bad_frames + self._reader.bad_frames,
+            "unmatched": self.unmatched,
+        }
+
+    def _close_server(self):
+        if self._server:
+            self._server.close()
+            os.unlink(self.path)
+            self._server = None
+
+    def _run(self):
+        while self._running:
+            for key, events in self._selector.select():
+                if key.data is None:
+                    continue
+                key.data(key.fileobj, events)
+                if not self._running:
+                    break
+
+    def _port_failed(self, error: Exception):
+        # selector thread, nothing can be relayed anymore
+        logger.error(f"Serial port {self.ser.port} failed, dropping clients, {error!r}")
+        self.error = error
+        self._running = False
+        for client in list(self._clients):
+            self._drop(client)
+        self._selector.unregister(self._server)
+        self._close_server()
+
+    def _accept(self, server: socket.socket, _):
+        client, _ = server.accept()
+        client.setblocking(False)
+        self._clients[client] = (xbee_frames.FrameReader(), bytearray())
+        self._selector.register(client, selectors.EVENT_READ, self._client_event)
+
+    def _read_serial(self, *_):
+        try:
+            data = self.ser.read(self.ser.in_waiting or 1)
+        except (SerialException, OSError) as e:
+            self._port_failed(e)
+            return
+        for frame in self._reader.feed(data):
+            self.frames_in += 1
+            if frame[0] in RESPONSES and len(frame) > 1:
+                self._respond(frame)
+                continue
+            frame = xbee_frames.build(frame)
+            for client in list(self._clients):
+                self._send(client, frame)
+
+    def _respond(self, frame: bytes):
+        owner = self._frame_ids.pop(frame[1], None)
+        if owner is None or owner[0] not in self._clients:
+            # sent before the broker started, or by a client that left
+            self.unmatched += 1
+            return
+        client, frame_id = owner
+        self._send(client, xbee_frames.build(bytes((frame[0], frame_id)) + frame[2:]))
+
+    def _request(self, client: socket.socket, frame: bytes) -> bytes:
+        # frame id 0 asks for no response, anything else gets a broker id
+        if frame[0] not in REQUESTS or len(frame) < 2 or not frame[1]:
+            return frame
+        # the oldest id is reused, its response is long overdue by then
+        self._next_id = self._next_id % 255 + 1
+        self._frame_ids[self._next_id] = (client, frame[1])
+        return bytes((frame[0], self._next_id)) + frame[2:]
+
+    def _client_event(self, client: socket.socket, events: int):
+        if client not in self._clients:
+            # dropped earlier in this round of events
+            return
+        if events & selectors.EVENT_WRITE:
+            self._flush(client)
+        if not events & selectors.EVENT_READ or client not in self._clients:
+            return
+        try:
+            data = client.recv(4096)
+        except OSError:
+            data = b""
+        if not data:
+            self._drop(client)
+            return
+        reader = self._clients[client][0]
+        for frame in reader.feed(data):
+            try:
+                self.ser.write(xbee_frames.build(self._request(client, frame)))
+            except (SerialException, OSError) as e:
+                self._port_failed(e)
+                return
+            self.frames_out += 1
+        self.bad_frames += reader.bad_frames
+        reader.bad_frames = 0
+
+    def _send(self, client: socket.socket, frame: bytes):
+        backlog = self._clients[client][1]
+        if backlog:
+            backlog += frame
+        else:
+            try:
+                sent = client.send(frame)
+            except BlockingIOError:
+                sent = 0
+            except OSError:
+                self._drop(client)
+                return
+            if sent < len(frame):
+                backlog += frame[sent:]
+                self._selector.modify(
+                    client,
+                    selectors.EVENT_READ | selectors.EVENT_WRITE,
+                    self._client_event,
+                )
+        if len(backlog) > MAX_BACKLOG:
+            self._drop(client)
+
+    def _flush(self, client: socket.socket):
+        backlog = self._clients[client][1]
+        try:
+            sent = client.send(backlog)
+        except BlockingIOError:
+            return
+        except OSError:
+            self._drop(client)
+            return
+        del backlog[:sent]
+        if not backlog:
+            self._selector.modify(client, selectors.EVENT_READ, self._client_event)
+
+    def _drop(self, client: socket.socket):
+        self._clients.pop(client, None)
+        self._selector.unregister(client)
+        client.close()
+
+
+class BrokerPort:
+    """
+    Client side of the broker, used in place of serial.Serial.
+    Provides the calls xbee.XBee makes on its port.
+    """
+
+    def __init__(self, path: str = SOCKET_PATH):
+        self.path = path
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(path)
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+
+    @property
+    def port(self) -> str:
+        return f"broker:{self.path}"
+
+    @property
+    def timeout(self) -> Optional[float]:
+        return self._sock.gettimeout()
+
+    @timeout.setter
+    def timeout(self, value: Optional[float]):
+        # read() returns what has arrived once this runs out, like pyserial
+        self._sock.settimeout(value)
+
+    def inWaiting(self) -> int:
+        # poll, MSG_DONTWAIT still waits out the timeout on a socket that has one
+        if select.select([self._sock], [], [], 0)[0]:
+            data = self._sock.recv(4096)
+            if not data:
+                raise ConnectionError("Broker closed the connection")
+            self._buffer += data
+        return len(self._buffer)
+
+    in_waiting = property(inWaiting)
+
+    def read(self, size: int = 1) -> bytes:
+        while len(self._buffer) < size:
+            try:
+                data = self._sock.recv(4096)
+            except TimeoutError:
+                break
+            if not data:
+                raise ConnectionError("Broker closed the connection")
+            self._buffer += data
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def write(self, data: bytes) -> int:
+        # xbee writes whole frames, keep concurrent writers from interleaving
+        with self._lock:
+            self._sock.sendall(data)
+        return len(data)
+
+    def close(self):
+        self._sock.close()
+
+
+def available(path: str = SOCKET_PATH) -> bool:
+    return os.path.exists(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kevinbot v3 serial broker")
+    parser.add_argument("--port", required=True, help="XBee serial port")
+    parser.add_argument("--baud", type=int, default=460800)
+    parser.add_argument("--socket", default=SOCKET_PATH, help="Unix socket path")
+    args = parser.parse_args()
+
+    broker = SerialBroker(serial.Serial(args.port, args.baud), args.socket)
+    try:
+        broker.start()
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    print(f"Sharing {args.port} on {args.socket}")
+    try:
+        ticks = 0
+        while True:
+            time.sleep(1)
+            ticks += 1
+            if broker.running:
+                if not ticks % 5:
+                    print(broker.stats())
+                continue
+            if broker.error is not None:
+                # the port failed, share it again once it's back
+                broker.stop()
+                try:
+                    broker.ser.close()
+                except (SerialException, OSError):
+                    pass
+                broker.error = None
+            try:
+                ser = serial.Serial(args.port, args.baud)
+            except (SerialException, OSError):
+                continue
+            broker = SerialBroker(ser, args.socket)
+            broker.start()
+            print(f"Sharing {args.port} on {args.socket} again")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.stop()
+        try:
+            broker.ser.close()
+        except (SerialException, OSError):
+            pass
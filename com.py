@@ -1,6 +1,11 @@
 # XBee Communication wrapper for Kevinbot v3
+import enum
+import itertools
 import os
+import queue
+import threading
 import time
+from collections import deque
 from typing import Iterable, Union, Callable, Any, Optional
 
 import serial
@@ -8,10 +13,17 @@ from serial.serialutil import SerialException
 import xbee as xbee_com
 import platform
 
+import broker
+import discovery
+import journal
 import log
+import telemetry
+import xbee_frames
 
 import sys
 # noinspection PyUnresolvedReferences,PyPackageRequirements
+from qtpy.QtCore import QObject, Signal
+# noinspection PyUnresolvedReferences,PyPackageRequirements
 from qtpy.QtWidgets import QApplication, QMessageBox, QInputDialog
 
 logger = log.setup(os.path.basename(__file__).rstrip(".py"), log.AUTO)
@@ -54,16 +66,1605 @@ else:
         PORT = "/dev/ttyS0"
         logger.debug(f"Using default port, {PORT}")
 
+# point the link at another port, e.g. the one printed by simulator.py
+PORT = os.environ.get("KEVINBOT_PORT", PORT)
+
 BAUD: int = 460800
 
-xb: Optional[xbee_com.XBee] = None
-ser: Optional[serial.Serial] = None
+# probe every serial port for the XBee when the configured one can't be opened
+PORT_DISCOVERY: bool = settings.get("port_discovery", True)
+# where discovery last found the XBee, preferred over the configured port
+if settings.get("ports", {}).get("discovered") and "KEVINBOT_PORT" not in os.environ:
+    PORT = settings["ports"]["discovered"]["port"]
+    BAUD = settings["ports"]["discovered"]["baud"]
+
+# largest rf payload a single tx frame can carry
+MAX_PAYLOAD: int = settings.get("xbee_max_payload", 100)
+# terminates every command, a frame may carry several of them
+DELIMITER = "\r"
+# payloads over MAX_PAYLOAD are sent as "frag:<id>:<index>:<count>=<chunk>"
+# frames, one fragment per frame and never split on DELIMITER
+FRAGMENT_KEY = "frag"
+# incomplete messages are dropped after this many seconds
+FRAGMENT_TIMEOUT: float = settings.get("fragment_timeout", 2.0)
+
+_DELIMITER = DELIMITER.encode("utf-8")
+_FRAGMENT_PREFIX = (FRAGMENT_KEY + ":").encode("utf-8")
+_STRIP = b"\r\n"
+
+# go through a running broker.py instead of opening the port
+USE_BROKER: bool = settings.get("use_broker", True)
+
+# rate at which the latest drive command is sent to the robot
+DRIVE_RATE: float = settings.get("drive_rate", 50)
+
+
+class Lane(enum.IntEnum):
+    # lower values are sent first
+    SAFETY = 0
+    CONTROL = 1
+    BULK = 2
+
+
+# commands are sorted into lanes by the key of the first command in a frame
+SAFETY_KEYS = {"request.estop", "stop", "request.enabled"}
+CONTROL_KEYS = {"left_motor", "right_motor", "head_x", "head_y", "eye.set_position"}
+# queued drive frames become stale once one of these is queued
+DRIVE_KEYS = {"left_motor", "right_motor"}
+
+
+def _first_key(data: str) -> str:
+    return data.split(DELIMITER, 1)[0].split("=", 1)[0]
+
+
+def lane_for(data: str) -> Lane:
+    key = _first_key(data)
+    if key in SAFETY_KEYS:
+        return Lane.SAFETY
+    if key in CONTROL_KEYS:
+        return Lane.CONTROL
+    return Lane.BULK
+
+
+class TxWriter:
+    """
+    Own the serial write side on a dedicated thread.
+
+    Frames are queued by lane, safety frames are always written before
+    control frames and control frames before bulk ones. Frames within a lane
+    keep their order. Drive frames queued before a safety frame are dropped.
+    """
+
+    def __init__(self, write: Callable[[str, int], Any]):
+        self._write = write
+
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._epoch = 0
+
+        self._depth = {lane: 0 for lane in Lane}
+        self._sent = {lane: 0 for lane in Lane}
+        self._dropped = {lane: 0 for lane in Lane}
+        self._latency = {lane: 0.0 for lane in Lane}
+        self._max_latency = {lane: 0.0 for lane in Lane}
+        self.frames = 0
+        self.bytes = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="TxWriter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # frames already queued are written before the thread exits
+        if not self._thread:
+            return
+        self._queue.put((len(Lane), next(self._seq), 0.0, None, 0, False, 0))
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def put(self, data: str, lane: Optional[Lane] = None, frame_id: int = 0):
+        if lane is None:
+            lane = lane_for(data)
+        is_drive = _first_key(data) in DRIVE_KEYS
+        with self._lock:
+            if lane == Lane.SAFETY:
+                self._epoch += 1
+            self._depth[lane] += 1
+            epoch = self._epoch
+        self._queue.put(
+            (lane, next(self._seq), time.monotonic(), data, epoch, is_drive, frame_id)
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                lane.name.lower(): {
+                    "depth": self._depth[lane],
+                    "sent": self._sent[lane],
+                    "dropped": self._dropped[lane],
+                    "mean_latency": self._latency[lane] / self._sent[lane]
+                    if self._sent[lane]
+                    else 0.0,
+                    "max_latency": self._max_latency[lane],
+                }
+                for lane in Lane
+            }
+
+    def _run(self):
+        while True:
+            lane, _, queued, data, epoch, is_drive, frame_id = self._queue.get()
+            if data is None:
+                break
+            lane = Lane(lane)
+
+            with self._lock:
+                self._depth[lane] -= 1
+                if is_drive and epoch != self._epoch:
+                    self._dropped[lane] += 1
+                    continue
+
+            # noinspection PyBroadException
+            try:
+                self._write(data, frame_id)
+            except Exception:
+                logger.exception("Failed to write frame")
+
+            latency = time.monotonic() - queued
+            with self._lock:
+                self._sent[lane] += 1
+                self.frames += 1
+                self.bytes += len(data)
+                self._latency[lane] += latency
+                self._max_latency[lane] = max(self._max_latency[lane], latency)
+
+
+# state keys whose unchanged values are not sent again
+# value: seconds after which an unchanged value is re-sent anyway, None for never
+SEND_ON_CHANGE: dict[str, Optional[float]] = {
+    "head_update": None,
+    "body_update": None,
+    "base_update": None,
+    "cam_brightness": None,
+    "head_color1": None,
+    "head_color2": None,
+    "body_color1": None,
+    "body_color2": None,
+    "base_color1": None,
+    "base_color2": None,
+    "core.speech-engine": None,
+    "eye.set_state": None,
+    "eye.set_motion": None,
+    "eye.set_speed": None,
+    "eye.set_backlight": None,
+    "eye.set_skin_option": None,
+    "eye.set_position": 1.0,
+    "head_x": 1.0,
+    "head_y": 1.0,
+    "arms": 2.0,
+}
+# keys carrying several options, cached per "option:name" prefix of the value
+OPTION_KEYS = {"eye.set_skin_option"}
+
+
+class SendCache:
+    """
+    Per-key cache of the last value sent, used to drop repeated commands.
+    Only keys listed in ``refresh`` are cached.
+    """
+
+    def __init__(self, refresh: dict[str, Optional[float]]):
+        self.refresh = refresh
+        self._last: dict[str, tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+        self.sent = 0
+        self.suppressed = 0
+        self.refreshed = 0
+        self.bytes_saved = 0
+        self.suppressed_keys: dict[str, int] = {}
+
+    def check(self, data: str) -> bool:
+        # returns False when data repeats the last value sent for its key
+        cmd, _, value = data.partition("=")
+        if cmd not in self.refresh:
+            return True
+
+        key = cmd
+        if cmd in OPTION_KEYS:
+            key, _, value = data.rpartition(":")
+
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(key)
+            if last is not None and last[0] == value:
+                refresh = self.refresh[cmd]
+                if refresh is None or now - last[1] < refresh:
+                    self.suppressed += 1
+                    self.bytes_saved += len(data) + len(DELIMITER)
+                    self.suppressed_keys[cmd] = self.suppressed_keys.get(cmd, 0) + 1
+                    return False
+                self.refreshed += 1
+            self._last[key] = (value, now)
+            self.sent += 1
+        return True
+
+    def record(self, cmd: str, value: Any):
+        # the robot reported value for cmd, e.g. set from another remote,
+        # so sending it again is redundant and sending anything else isn't
+        if cmd not in self.refresh:
+            return
+        key, value = cmd, str(value)
+        if cmd in OPTION_KEYS:
+            key, _, value = f"{cmd}={value}".rpartition(":")
+        with self._lock:
+            self._last[key] = (value, time.monotonic())
+
+    def latest(self) -> list[str]:
+        # the last command sent for every cached key, oldest first
+        with self._lock:
+            items = sorted(self._last.items(), key=lambda item: item[1][1])
+        return [
+            f"{key}:{value}" if "=" in key else f"{key}={value}"
+            for key, (value, _) in items
+        ]
+
+    def forget(self, cmd: Optional[str] = None):
+        # drop cached values, e.g. after the robot restarted
+        with self._lock:
+            if cmd is None:
+                self._last.clear()
+            else:
+                for key in [k for k in self._last if k.split("=", 1)[0] == cmd]:
+                    del self._last[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sent": self.sent,
+                "suppressed": self.suppressed,
+                "refreshed": self.refreshed,
+                "bytes_saved": self.bytes_saved,
+                "suppressed_keys": dict(self.suppressed_keys),
+            }
+
+
+send_cache = SendCache(SEND_ON_CHANGE)
+
+# unconfirmed deliveries of these keys are sent again, repeating them is harmless
+RETRY_KEYS = SAFETY_KEYS | set(SEND_ON_CHANGE)
+
+
+def _retryable(data: str) -> bool:
+    # a packed payload is only sent again if every command in it may repeat
+    return all(
+        command.split("=", 1)[0] in RETRY_KEYS
+        for command in data.split(DELIMITER)
+        if command
+    )
+
+# seconds to wait for the radio's tx status before trying again
+CONFIRM_TIMEOUT: float = settings.get("confirm_timeout", 0.5)
+CONFIRM_RETRIES: int = settings.get("confirm_retries", 3)
+
+# tx status codes of the 802.15.4 firmware
+TX_STATUS = {
+    0x00: "success",
+    0x01: "no ack",
+    0x02: "cca failure",
+    0x03: "purged",
+    0x74: "payload too large",
+}
+
+
+class Delivery:
+    """
+    A confirmed send. ``done`` is set once the robot's radio has acked it or
+    every attempt has failed, ``delivered`` tells which.
+    """
+
+    def __init__(self, data: str, lane: Optional[Lane], retries: int):
+        self.data = data
+        self.key = _first_key(data)
+        self.lane = lane
+        self.retries = retries
+        self.frame_id = 0
+        self.attempts = 0
+        self.sent_at: Optional[float] = None
+        self.rtt: Optional[float] = None
+        self.status: Optional[int] = None
+        self.delivered = False
+        self.done = threading.Event()
+        self.callback: Optional[Callable[["Delivery"], Any]] = None
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        self.done.wait(timeout)
+        return self.delivered
+
+    def __repr__(self):
+        if self.done.is_set():
+            state = "delivered" if self.delivered else "failed"
+        else:
+            state = "pending"
+        return f"Delivery({self.data!r}, {state}, attempts={self.attempts})"
+
+
+class DeliveryTracker:
+    """
+    Send commands with a frame id and match the radio's tx_status frames.
+
+    The round trip is timed from the moment the frame is written. Failed or
+    timed out deliveries of RETRY_KEYS are sent again, up to ``retries``
+    times, with a new frame id. Callbacks run on the thread that settled the
+    delivery, the rx reader or the tracker's own timeout thread.
+    """
+
+    def __init__(
+        self, timeout: float = CONFIRM_TIMEOUT, retries: int = CONFIRM_RETRIES
+    ):
+        self.timeout = timeout
+        self.retries = retries
+
+        self._in_flight: dict[int, Delivery] = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.sent = 0
+        self.delivered = 0
+        self.failed = 0
+        self.retried = 0
+        self.timeouts = 0
+        self._rtt_total = 0.0
+        self._rtt_max = 0.0
+        # key: (deliveries, total rtt)
+        self._rtt_by_key: dict[str, tuple[int, float]] = {}
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name="DeliveryTracker", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def send(
+        self,
+        data: str,
+        lane: Optional[Lane] = None,
+        retries: Optional[int] = None,
+        callback: Optional[Callable[[Delivery], Any]] = None,
+    ) -> Delivery:
+        if len((data + DELIMITER).encode("utf-8")) > MAX_PAYLOAD:
+            raise ValueError("Confirmed commands must fit in a single frame")
+        if retries is None:
+            retries = self.retries if _retryable(data) else 0
+        delivery = Delivery(data, lane, retries)
+        delivery.callback = callback
+        with self._lock:
+            self.sent += 1
+        self._transmit(delivery)
+        return delivery
+
+    def mark_sent(self, frame_id: int):
+        # called right before the frame is written
+        with self._lock:
+            delivery = self._in_flight.get(frame_id)
+            if delivery:
+                delivery.sent_at = time.monotonic()
+
+    def on_status(self, frame: dict):
+        # router frame handler for tx_status
+        frame_id = frame["frame_id"][0]
+        status = frame["status"][0]
+        now = time.monotonic()
+        with self._lock:
+            delivery = self._in_flight.pop(frame_id, None)
+        if not delivery:
+            return
+        delivery.status = status
+        if status == 0:
+            delivery.rtt = now - (delivery.sent_at or now)
+            self._finish(delivery, True)
+        else:
+            self._retry_or_fail(delivery)
+
+    def stats(self) -> dict:
+        with self._lock:
+            settled = self.delivered + self.failed
+            return {
+                "sent": self.sent,
+                "delivered": self.delivered,
+                "failed": self.failed,
+                "in_flight": len(self._in_flight),
+                "retries": self.retried,
+                "timeouts": self.timeouts,
+                "delivery_rate": self.delivered / settled if settled else 1.0,
+                "mean_rtt": self._rtt_total / self.delivered if self.delivered else 0.0,
+                "max_rtt": self._rtt_max,
+                "rtt_by_key": {
+                    key: total / count
+                    for key, (count, total) in self._rtt_by_key.items()
+                },
+            }
+
+    def _transmit(self, delivery: Delivery):
+        with self._lock:
+            frame_id = self._allocate()
+            if frame_id:
+                delivery.frame_id = frame_id
+                delivery.attempts += 1
+                delivery.sent_at = None
+                self._in_flight[frame_id] = delivery
+        if not frame_id:
+            logger.warning(f"No free frame id for {delivery.data!r}")
+            self._finish(delivery, False)
+            return
+        _send_data(delivery.data + DELIMITER, delivery.lane, frame_id)
+
+    def _allocate(self) -> int:
+        # frame id 0 asks for no tx status, 1-255 cycle
+        for _ in range(255):
+            frame_id = self._next_id
+            self._next_id = self._next_id % 255 + 1
+            if frame_id not in self._in_flight:
+                return frame_id
+        return 0
+
+    def _retry_or_fail(self, delivery: Delivery):
+        if _retryable(delivery.data) and delivery.attempts <= delivery.retries:
+            with self._lock:
+                self.retried += 1
+            self._transmit(delivery)
+        else:
+            self._finish(delivery, False)
+
+    def _finish(self, delivery: Delivery, delivered: bool):
+        delivery.delivered = delivered
+        with self._lock:
+            if delivered:
+                self.delivered += 1
+                self._rtt_total += delivery.rtt
+                self._rtt_max = max(self._rtt_max, delivery.rtt)
+                count, total = self._rtt_by_key.get(delivery.key, (0, 0.0))
+                self._rtt_by_key[delivery.key] = (count + 1, total + delivery.rtt)
+            else:
+                self.failed += 1
+        if not delivered:
+            status = TX_STATUS.get(delivery.status, "timeout")
+            logger.warning(
+                f"{delivery.data!r} not delivered after "
+                f"{delivery.attempts} attempts, {status}"
+            )
+        delivery.done.set()
+        if delivery.callback:
+            # noinspection PyBroadException
+            try:
+                delivery.callback(delivery)
+            except Exception:
+                logger.exception(f"Delivery callback {delivery.callback} failed")
+
+    def _run(self):
+        while self._running:
+            time.sleep(0.02)
+            now = time.monotonic()
+            with self._lock:
+                timed_out = [
+                    frame_id
+                    for frame_id, delivery in self._in_flight.items()
+                    if delivery.sent_at is not None
+                    and now - delivery.sent_at > self.timeout
+                ]
+                timed_out = [self._in_flight.pop(frame_id) for frame_id in timed_out]
+                self.timeouts += len(timed_out)
+            for delivery in timed_out:
+                delivery.status = None
+                self._retry_or_fail(delivery)
+
+
+deliveries = DeliveryTracker()
+
+
+class DriveScheduler:
+    """
+    Send the latest left/right motor target at a fixed maximum rate.
 
+    Values submitted between two ticks replace each other, only the newest one
+    is sent to the robot. The first value after an idle period goes out
+    immediately, following values are held back until the next tick.
+    """
+
+    def __init__(self, rate: float = DRIVE_RATE, sender: Optional[Callable] = None):
+        self.rate = rate
+        self._sender = sender
+
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._pending: Optional[tuple[int, int]] = None
+
+        self.submitted = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name="DriveScheduler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._event.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def submit(self, vals: Union[list[int, int], tuple[int, int]]):
+        with self._lock:
+            if self._pending is not None:
+                self.coalesced += 1
+            self._pending = (int(vals[0]), int(vals[1]))
+            self.submitted += 1
+        self._event.set()
+
+    def cancel(self):
+        # drop the pending value, waits for an in-flight send to finish
+        with self._send_lock:
+            with self._lock:
+                if self._pending is not None:
+                    self.cancelled += 1
+                self._pending = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "submitted": self.submitted,
+                "sent": self.sent,
+                "coalesced": self.coalesced,
+                "cancelled": self.cancelled,
+            }
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while self._running:
+            self._event.wait()
+            if not self._running:
+                break
+
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            with self._send_lock:
+                with self._lock:
+                    vals, self._pending = self._pending, None
+                    self._event.clear()
+                if vals is None:
+                    continue
+                # noinspection PyBroadException
+                try:
+                    (self._sender or txmot)(vals)
+                except Exception:
+                    logger.exception("Failed to send drive command")
+                with self._lock:
+                    self.sent += 1
+
+            next_tick = time.monotonic() + 1 / self.rate
+
+
+drive = DriveScheduler()
+
+
+class Message:
+    """
+    A single key=value command received from the robot.
+
+    The value may be given as bytes, it is decoded the first time a handler
+    reads it. Without a raw record, key=value is rebuilt on demand. The
+    comma separated fields of the value are split once, on first use, and
+    telemetry is decoded once for the store and every handler.
+    """
+
+    __slots__ = ("key", "_value", "_raw", "frame", "_fields", "_record")
+
+    def __init__(
+        self,
+        key: str,
+        value: Union[str, bytes],
+        raw: Optional[str] = None,
+        frame: Optional[dict] = None,
+    ):
+        self.key = key
+        self._value = value
+        self._raw = raw
+        self.frame = frame
+        self._fields: Optional[list[str]] = None
+        self._record: Optional[telemetry.Record] = None
+
+    @property
+    def value(self) -> str:
+        if not isinstance(self._value, str):
+            self._value = self._value.decode("utf-8")
+        return self._value
+
+    @property
+    def raw(self) -> str:
+        if self._raw is None:
+            self._raw = f"{self.key}={self.value}"
+        return self._raw
+
+    @property
+    def fields(self) -> list[str]:
+        if self._fields is None:
+            self._fields = self.value.split(",")
+        return self._fields
+
+    @property
+    def record(self) -> telemetry.Record:
+        # raises KeyError for keys without a schema, ValueError for bad values
+        if self._record is None:
+            self._record = telemetry.decode(self.key, self.value)
+        return self._record
+
+    def __repr__(self):
+        return f"Message({self.key!r}, {self.value!r})"
+
+
+class Reassembler:
+    """
+    Collect the parts of split messages until they are complete.
+
+    Parts are stored by index, so they may arrive in any order and
+    duplicates are ignored. Messages that don't complete within ``timeout``
+    are dropped, as is the oldest one when more than ``max_messages`` are in
+    flight or a message would go over ``max_size`` characters. Parts of a
+    message completed less than ``linger`` ago are late duplicates and
+    dropped too, so an id can't be reused sooner than that.
+    """
+
+    def __init__(
+        self,
+        timeout: float = FRAGMENT_TIMEOUT,
+        max_messages: int = 16,
+        max_size: int = 16384,
+        linger: float = 1.0,
+    ):
+        self.timeout = timeout
+        self.max_messages = max_messages
+        self.max_size = max_size
+        self.linger = linger
+
+        # id: (count, parts, size, first seen)
+        self._pending: dict[Any, tuple[int, dict[int, str], int, float]] = {}
+        # id: completed at, oldest first
+        self._completed: dict[Any, float] = {}
+        self._lock = threading.Lock()
+
+        self.completed = 0
+        self.duplicates = 0
+        self.expired = 0
+        self.dropped = 0
+        self.late = 0
+
+    def add(self, msg_id: Any, index: int, count: int, chunk: str) -> Optional[str]:
+        # returns the joined message once every part is in
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if not 0 <= index < count:
+                self.dropped += 1
+                return None
+            if msg_id in self._completed:
+                self.late += 1
+                return None
+
+            if msg_id in self._pending:
+                pending_count, parts, size, first_seen = self._pending[msg_id]
+                if pending_count != count:
+                    # a new message reusing the id, the old one is lost
+                    self.dropped += 1
+                    parts, size, first_seen = {}, 0, now
+            else:
+                parts, size, first_seen = {}, 0, now
+                while len(self._pending) >= self.max_messages:
+                    self._pending.pop(next(iter(self._pending)))
+                    self.dropped += 1
+
+            if index in parts:
+                self.duplicates += 1
+                return None
+            size += len(chunk)
+            if size > self.max_size:
+                self._pending.pop(msg_id, None)
+                self.dropped += 1
+                return None
+            parts[index] = chunk
+
+            if len(parts) < count:
+                self._pending[msg_id] = (count, parts, size, first_seen)
+                return None
+            self._pending.pop(msg_id, None)
+            self._completed[msg_id] = now
+            self.completed += 1
+        return "".join(parts[i] for i in range(count))
+
+    def missing(self, msg_id: Any) -> set[int]:
+        # indices still to come of a message in flight
+        with self._lock:
+            if msg_id not in self._pending:
+                return set()
+            count, parts, _, _ = self._pending[msg_id]
+            return set(range(count)) - set(parts)
+
+    def _expire(self, now: float):
+        for msg_id, (_, _, _, first_seen) in list(self._pending.items()):
+            if now - first_seen > self.timeout:
+                del self._pending[msg_id]
+                self.expired += 1
+        while self._completed:
+            msg_id, done = next(iter(self._completed.items()))
+            if now - done < self.linger:
+                break
+            del self._completed[msg_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._pending),
+                "completed": self.completed,
+                "duplicates": self.duplicates,
+                "expired": self.expired,
+                "dropped": self.dropped,
+                "late": self.late,
+            }
+
+
+class Router:
+    """
+    Dispatch received commands to handlers registered by key.
+
+    Exact keys are looked up in a dict. Namespaced keys such as
+    ``core.full_mesh:1:3`` fall back to the prefix table, which is keyed by
+    the part before the first ":". Monitors receive every message.
+    Frames without rf_data (tx status, at responses) go to frame handlers
+    registered by their xbee frame id name. Fragment frames are held in
+    ``reassembler`` and the joined payload is dispatched once complete.
+    """
+
+    def __init__(self):
+        self._handlers: dict[str, list[Callable[[Message], Any]]] = {}
+        self._prefix_handlers: dict[str, list[Callable[[Message], Any]]] = {}
+        self._frame_handlers: dict[str, list[Callable[[dict], Any]]] = {}
+        self._monitors: list[Callable[[Message], Any]] = []
+        self.reassembler = Reassembler()
+
+        self._lock = threading.Lock()
+        self._counts: dict[str, int] = {}
+        self._times: dict[str, float] = {}
+
+    def register(self, key: str, handler: Callable[[Message], Any]):
+        self._handlers[key] = self._handlers.get(key, []) + [handler]
+
+    def register_prefix(self, prefix: str, handler: Callable[[Message], Any]):
+        self._prefix_handlers[prefix] = self._prefix_handlers.get(prefix, []) + [
+            handler
+        ]
+
+    def register_frame(self, frame_id: str, handler: Callable[[dict], Any]):
+        self._frame_handlers[frame_id] = self._frame_handlers.get(frame_id, []) + [
+            handler
+        ]
+
+    def add_monitor(self, handler: Callable[[Message], Any]):
+        self._monitors = self._monitors + [handler]
+
+    def unregister(self, key: str, handler: Callable[[Message], Any]):
+        handlers = [h for h in self._handlers.get(key, []) if h != handler]
+        if handlers:
+            self._handlers[key] = handlers
+        else:
+            self._handlers.pop(key, None)
+
+    def remove_monitor(self, handler: Callable[[Message], Any]):
+        self._monitors = [h for h in self._monitors if h != handler]
+
+    def handlers_for(self, key: str) -> list[Callable[[Message], Any]]:
+        return self._lookup(key)[1]
+
+    def _lookup(self, key: str) -> tuple[str, list[Callable[[Message], Any]]]:
+        handlers = self._handlers.get(key)
+        if handlers is not None:
+            return key, handlers
+        prefix = key.split(":", 1)[0]
+        return prefix, self._prefix_handlers.get(prefix, [])
+
+    def dispatch(self, frame: dict):
+        # callback for xbee frames
+        if "rf_data" not in frame:
+            handlers = self._frame_handlers.get(frame.get("id"))
+            if not handlers:
+                logger.warning(f"Status message {frame}")
+            for handler in handlers or []:
+                self._call(handler, frame)
+            return
+
+        data = frame["rf_data"]
+        if data.startswith(_FRAGMENT_PREFIX):
+            text = self._reassemble(data.decode("utf-8"), frame)
+            if text is None:
+                return
+            data = text.encode("utf-8")
+        self._route_records(data, frame)
+
+    def dispatch_frame(self, data: memoryview):
+        # callback for xbee_frames.FrameReader views, skips the xbee library
+        api_id = data[0]
+        if api_id == xbee_frames.RX or api_id == xbee_frames.RX_LONG_ADDR:
+            header = 5 if api_id == xbee_frames.RX else 11
+            frame = {
+                "id": "rx" if api_id == xbee_frames.RX else "rx_long_addr",
+                "source_addr": bytes(data[1 : header - 2]),
+                "rf_data": bytes(data[header:]),
+            }
+        else:
+            frame = xbee_frames.parse(bytes(data))
+            if frame is None:
+                logger.warning(f"Unknown frame {bytes(data)!r}")
+                return
+        self.dispatch(frame)
+
+    def _route_records(self, data: bytes, frame: dict):
+        # split on bytes, only keys are decoded up front
+        end = len(data)
+        start = 0
+        while start < end:
+            stop = data.find(_DELIMITER, start)
+            if stop < 0:
+                stop = end
+            first, last = start, stop
+            start = stop + 1
+            # same as str.strip("\r\n")
+            while first < last and data[first] in _STRIP:
+                first += 1
+            while last > first and data[last - 1] in _STRIP:
+                last -= 1
+            if first == last:
+                continue
+            split = data.find(b"=", first, last)
+            if split < 0:
+                key = data[first:last].decode("utf-8")
+                self.route(Message(key, "", key, frame))
+            else:
+                key = data[first:split].decode("utf-8")
+                self.route(Message(key, data[split + 1 : last], None, frame))
+
+    def _reassemble(self, data: str, frame: dict) -> Optional[str]:
+        header, _, chunk = data.partition("=")
+        try:
+            _, msg_id, index, count = header.split(":")
+            index, count = int(index), int(count)
+        except ValueError:
+            logger.warning(f"Bad fragment header {header!r}")
+            return None
+        # ids are only unique per sender
+        return self.reassembler.add(
+            (frame.get("source_addr"), msg_id), index, count, chunk
+        )
+
+    def route(self, message: Message):
+        # formatted by loguru only when trace logging is on
+        logger.trace("Recieved: {}", message)
+        start = time.perf_counter()
+
+        # namespaced keys are counted under their prefix
+        key, handlers = self._lookup(message.key)
+        for monitor in self._monitors:
+            self._call(monitor, message)
+        for handler in handlers:
+            self._call(handler, message)
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+            self._times[key] = self._times.get(key, 0.0) + elapsed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                key: {"count": count, "time": self._times[key]}
+                for key, count in self._counts.items()
+            }
+
+    @staticmethod
+    def _call(handler: Callable, arg: Any):
+        # noinspection PyBroadException
+        try:
+            handler(arg)
+        except Exception:
+            logger.exception(f"Handler {handler} failed")
+
+
+router = Router()
+# registered first, so the store is up to date when other handlers run
+for _key in telemetry.store.channels:
+    router.register(_key, telemetry.store.on_message)
+
+# record every telemetry sample to logs/telemetry for after the session
+TELEMETRY_JOURNAL: bool = settings.get("telemetry_journal", True)
+# preallocated size of one journal segment and of all of them together, MiB
+JOURNAL_SEGMENT_MB: int = settings.get("journal_segment_mb", 8)
+JOURNAL_MAX_MB: int = settings.get("journal_max_mb", 512)
+
+telemetry_journal = journal.JournalWriter(
+    segment_size=JOURNAL_SEGMENT_MB * 1024 * 1024,
+    max_size=JOURNAL_MAX_MB * 1024 * 1024,
+)
+for _key in telemetry_journal.channels:
+    router.register(_key, telemetry_journal.on_message)
+
+# 16-bit address of the robot core, the PAN coordinator
+DEFAULT_ADDRESS = b"\x00\x00"
+# frames carrying rf data from a remote radio
+_RF_DATA = (xbee_frames.RX, xbee_frames.RX_LONG_ADDR)
+
+
+class RateLimiter:
+    """
+    Token bucket allowing ``rate`` frames per second in bursts of up to
+    ``burst`` frames. acquire() blocks the calling writer thread only.
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate / 10))
+        self.waited = 0.0
+        self._tokens = float(self.burst)
+        self._stamp = time.monotonic()
+
+    def acquire(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+        if self._tokens < 1:
+            wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            self.waited += wait
+            self._tokens = 1.0
+            self._stamp = time.monotonic()
+        self._tokens -= 1
+
+
+class Destination:
+    """
+    One robot on the PAN, addressed by its 16-bit or 64-bit address.
+
+    Commands are queued on the destination's own TxWriter, so a busy or rate
+    limited robot never holds up another one, and whatever the robot sends
+    is dispatched to its own ``router``. The module level tx functions are a
+    facade for the link's default destination.
+    """
+
+    def __init__(
+        self,
+        link: "Link",
+        address: bytes,
+        name: Optional[str] = None,
+        rate: Optional[float] = None,
+        router: Optional[Router] = None,
+    ):
+        if len(address) not in (2, 8):
+            raise ValueError("Addresses are 2 or 8 bytes long")
+        self.link = link
+        self.address = bytes(address)
+        self.name = name or self.address.hex()
+        self.router = router or Router()
+        self.limiter = RateLimiter(rate) if rate else None
+        self.writer = TxWriter(self._write)
+
+    def send(self, data: str, lane: Optional[Lane] = None, frame_id: int = 0):
+        # data is one or more delimited commands
+        if len(data.encode("utf-8")) > MAX_PAYLOAD:
+            if lane is None:
+                lane = lane_for(data)
+            for part in fragment(data):
+                self.send(part, lane)
+            return
+        # fall back to a blocking write while the writer thread isn't running
+        if self.writer.running:
+            self.writer.put(data, lane, frame_id)
+        else:
+            self._write(data, frame_id)
 
-def init(callback: Optional[Callable[[str], Any]] =None, qapp: QApplication=None):
-    global xb, ser
+    def txstr(self, data: str, lane: Optional[Lane] = None):
+        logger.trace(f"Sent to {self.name}: {data}")
+        self.send(data + DELIMITER, lane)
+
+    def txcv(self, cmd: str, val: Any, lane: Optional[Lane] = None):
+        self.txstr(_format_cv(cmd, val), lane)
+
+    def txbatch(
+        self, items: Iterable[Union[str, tuple[str, Any]]], lane: Optional[Lane] = None
+    ):
+        for payload in pack(items):
+            self.send(payload, lane)
+
+    def txmot(self, vals: Union[list[int, int], tuple[int, int]]):
+        self.txbatch([("left_motor", vals[0]), ("right_motor", vals[1])])
+
+    def txstop(self):
+        self.txstr("stop")
+
+    def stats(self) -> dict:
+        return {
+            "address": self.address.hex(),
+            "writer": self.writer.stats(),
+            "rate_limited": self.limiter.waited if self.limiter else 0.0,
+        }
+
+    def _write(self, data: str, frame_id: int = 0):
+        if self.limiter:
+            self.limiter.acquire()
+        if frame_id:
+            deliveries.mark_sent(frame_id)
+        self.link.write(self.address, data, frame_id)
+
+    def __repr__(self):
+        return f"Destination({self.name!r}, {self.address.hex()})"
+
+
+class Link:
+    """
+    The XBee port and the destinations reachable through it.
+
+    Every command is framed for its destination's address, 64-bit addresses
+    use the long address tx frame. Received rx frames are routed by source
+    address to the destination that sent them, frames from unknown addresses
+    and the radio's own status frames go to ``default``.
+    """
+
+    def __init__(self):
+        self.ser: Optional[Union[serial.Serial, broker.BrokerPort]] = None
+        self.xb: Optional[xbee_com.XBee] = None
+        self.default: Optional[Destination] = None
+
+        self.frames_out = 0
+        self.bytes_out = 0
+
+        # replaced, never mutated, so the rx thread can read it without a lock
+        self._destinations: dict[bytes, Destination] = {}
+        self._lock = threading.Lock()
+        # every destination's writer thread shares the port, a frame has to
+        # go out whole before the next one starts
+        self._write_lock = threading.Lock()
+        self._running = False
+
+    @property
+    def destinations(self) -> list[Destination]:
+        return list(self._destinations.values())
+
+    def add(
+        self,
+        address: bytes,
+        name: Optional[str] = None,
+        rate: Optional[float] = None,
+        router: Optional[Router] = None,
+    ) -> Destination:
+        # the first destination added becomes the default
+        if address in self._destinations:
+            raise ValueError(f"{address.hex()} is already a destination")
+        destination = Destination(self, address, name, rate, router)
+        self._destinations = {**self._destinations, destination.address: destination}
+        if self.default is None:
+            self.default = destination
+        if self._running:
+            destination.writer.start()
+        return destination
+
+    def remove(self, address: bytes):
+        destination = self._destinations[address]
+        if destination is self.default:
+            raise ValueError("The default destination can't be removed")
+        self._destinations = {
+            a: d for a, d in self._destinations.items() if a != address
+        }
+        destination.writer.stop()
+
+    def get(self, address: bytes) -> Optional[Destination]:
+        return self._destinations.get(address)
+
+    def start(self):
+        self._running = True
+        for destination in self.destinations:
+            destination.writer.start()
+
+    def stop(self):
+        # queued frames are written first
+        for destination in self.destinations:
+            destination.writer.stop()
+        self._running = False
+
+    def attach(self, port: Union[serial.Serial, broker.BrokerPort]):
+        self.ser = port
+        # xbee is only used to build tx frames, RxReader does the reading
+        self.xb = xbee_com.XBee(port, escaped=False)
+
+    def detach(self) -> Optional[Union[serial.Serial, broker.BrokerPort]]:
+        port, self.xb, self.ser = self.ser, None, None
+        return port
+
+    def write(self, address: bytes, data: str, frame_id: int = 0):
+        # the supervisor may swap xb out from under the writer threads
+        radio = self.xb
+        if not radio:
+            return
+        try:
+            with self._write_lock:
+                radio.send(
+                    "tx" if len(address) == 2 else "tx_long_addr",
+                    frame_id=bytes((frame_id,)),
+                    dest_addr=address,
+                    data=bytes(data, "utf-8"),
+                )
+        except (SerialException, OSError) as e:
+            supervisor.failed(e)
+            return
+        with self._lock:
+            self.frames_out += 1
+            self.bytes_out += len(data)
+
+    def dispatch_frame(self, data: memoryview):
+        # callback for the rx reader
+        api_id = data[0]
+        destination = self.default
+        if api_id == xbee_frames.RX:
+            destination = self._destinations.get(bytes(data[1:3]), destination)
+        elif api_id == xbee_frames.RX_LONG_ADDR:
+            destination = self._destinations.get(bytes(data[1:9]), destination)
+        if destination is self.default and api_id in _RF_DATA:
+            # only rf data proves the robot is there, tx_status and at
+            # responses come from the local radio even when it's gone
+            watchdog.feed()
+        destination.router.dispatch_frame(data)
+
+    def stats(self) -> dict:
+        return {
+            "frames_out": self.frames_out,
+            "bytes_out": self.bytes_out,
+            "destinations": {d.name: d.stats() for d in self.destinations},
+        }
+
+
+radio = Link()
+# the robot txstr, txcv and friends talk to
+robot = radio.add(DEFAULT_ADDRESS, "robot", settings.get("tx_rate_limit"), router)
+writer = robot.writer
+
+
+def _add_robots():
+    # more robots on the same PAN, "robots": [{"name": ..., "address": "0002"}]
+    for entry in settings.get("robots", []):
+        try:
+            radio.add(
+                bytes.fromhex(entry["address"]), entry.get("name"), entry.get("rate")
+            )
+        except (KeyError, ValueError) as e:
+            logger.error(f"Invalid robot in settings, {entry!r}, {e}")
+
+
+_add_robots()
+
+
+class RxReader:
+    """
+    Read frames off the port on a dedicated thread.
+
+    Replaces the xbee library's reader thread, which reads a byte per call
+    and sleeps 10 ms whenever the port is idle. Whatever is waiting is read
+    in one go and parsed in place by xbee_frames.FrameReader. A failed read
+    stops the reader and is passed to ``error_callback``.
+    """
+
+    def __init__(self, callback: Callable[[memoryview], Any]):
+        self.callback = callback
+        self.error_callback: Optional[Callable[[Exception], Any]] = None
+        self.frames = 0
+        self.bytes = 0
+        self._port = None
+        self._reader = xbee_frames.FrameReader()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self, port):
+        if self._running:
+            return
+        self._port = port
+        # wake up regularly to notice stop()
+        self._port.timeout = 0.1
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="RxReader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "frames": self.frames,
+            "bytes": self.bytes,
+            "bad_frames": self._reader.bad_frames,
+        }
+
+    def _run(self):
+        while self._running:
+            try:
+                data = self._port.read(max(1, self._port.in_waiting))
+            except Exception as e:
+                logger.error(f"Serial read failed, {e!r}")
+                self._running = False
+                if self.error_callback:
+                    self.error_callback(e)
+                return
+            if not data:
+                continue
+            self.bytes += len(data)
+            for frame in self._reader.views(data):
+                self.frames += 1
+                # noinspection PyBroadException
+                try:
+                    self.callback(frame)
+                except Exception:
+                    logger.exception("Failed to dispatch frame")
+
+
+rx_reader = RxReader(radio.dispatch_frame)
+router.register_frame("tx_status", deliveries.on_status)
+
+# seconds between link probes
+LINK_PROBE_INTERVAL: float = settings.get("link_probe_interval", 1.0)
+# telemetry the robot sends on a fixed period, used for jitter and late frames
+PERIODIC_KEYS = set(telemetry.SCHEMA)
+PROBE_KEY = "link.ping"
+
+
+class LinkMonitor:
+    """
+    Rolling link quality statistics.
+
+    Every ``interval`` a link.ping probe is sent with a frame id. Its tx
+    status gives the radio round trip and a probe that isn't acked counts as
+    lost. If the robot echoes the probe, the round trip through the robot is
+    kept as well. Frame and byte counters are sampled on the same tick and
+    the last ``window`` samples make up the snapshot.
+
+    Arrivals of PERIODIC_KEYS give the inter-arrival jitter, smoothed like
+    RFC 3550, and count frames that came over twice their usual interval
+    late.
+    """
+
+    def __init__(self, interval: float = LINK_PROBE_INTERVAL, window: int = 10):
+        self.interval = interval
+        self.window = window
+
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self._seq = itertools.count()
+
+        # (time, frames in, bytes in, frames out, bytes out)
+        self._samples: deque[tuple[float, int, int, int, int]] = deque(
+            maxlen=window + 1
+        )
+        # radio round trip of each probe, None if it was lost
+        self._probes: deque[Optional[float]] = deque(maxlen=window)
+        self._echoes: deque[float] = deque(maxlen=window)
+        # sequence number: time sent, of probes not echoed yet
+        self._probe_times: dict[str, float] = {}
+        # key: [last arrival, mean interval, jitter]
+        self._arrivals: dict[str, list[float]] = {}
+        self.late = 0
+        self.last_rx: Optional[float] = None
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name="LinkMonitor", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def on_message(self, message: Message):
+        # router monitor, runs on the rx thread for every message
+        now = time.monotonic()
+        self.last_rx = now
+        if message.key in PERIODIC_KEYS:
+            self._arrival(message.key, now)
+        elif message.key == PROBE_KEY:
+            with self._lock:
+                sent = self._probe_times.pop(message.value, None)
+                if sent is not None:
+                    self._echoes.append(now - sent)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = list(self._samples)
+            probes = list(self._probes)
+            echoes = list(self._echoes)
+            jitter = {key: arrival[2] for key, arrival in self._arrivals.items()}
+            late = self.late
+
+        rates = [0.0, 0.0, 0.0, 0.0]
+        if len(samples) > 1:
+            elapsed = samples[-1][0] - samples[0][0]
+            rates = [
+                (samples[-1][i] - samples[0][i]) / elapsed if elapsed else 0.0
+                for i in range(1, 5)
+            ]
+        acked = [rtt for rtt in probes if rtt is not None]
+        return {
+            "rtt": sum(acked) / len(acked) if acked else None,
+            "rtt_max": max(acked) if acked else None,
+            "echo_rtt": sum(echoes) / len(echoes) if echoes else None,
+            "loss": (len(probes) - len(acked)) / len(probes) if probes else 0.0,
+            "frames_in": rates[0],
+            "bytes_in": rates[1],
+            "frames_out": rates[2],
+            "bytes_out": rates[3],
+            "late": late,
+            "jitter": jitter,
+            "last_rx_age": (
+                time.monotonic() - self.last_rx if self.last_rx is not None else None
+            ),
+        }
+
+    def _arrival(self, key: str, now: float):
+        with self._lock:
+            arrival = self._arrivals.get(key)
+            if arrival is None:
+                self._arrivals[key] = [now, 0.0, 0.0]
+                return
+            interval = now - arrival[0]
+            arrival[0] = now
+            if not arrival[1]:
+                arrival[1] = interval
+                return
+            if interval > arrival[1] * 2:
+                # a gap, only nudge the usual interval and leave jitter alone
+                self.late += 1
+                arrival[1] += (interval - arrival[1]) / 16
+                return
+            arrival[2] += (abs(interval - arrival[1]) - arrival[2]) / 16
+            arrival[1] += (interval - arrival[1]) / 16
+
+    def _probe(self):
+        seq = str(next(self._seq))
+
+        def done(delivery: Delivery):
+            with self._lock:
+                self._probes.append(delivery.rtt if delivery.delivered else None)
+
+        with self._lock:
+            self._probe_times[seq] = time.monotonic()
+            # old probes the robot never echoed
+            while len(self._probe_times) > self.window:
+                self._probe_times.pop(next(iter(self._probe_times)))
+        deliveries.send(_format_cv(PROBE_KEY, seq), retries=0, callback=done)
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while self._running:
+            now = time.monotonic()
+            if now < next_tick:
+                time.sleep(min(next_tick - now, 0.05))
+                continue
+            next_tick = now + self.interval
+            with self._lock:
+                self._samples.append(
+                    (
+                        now,
+                        rx_reader.frames,
+                        rx_reader.bytes,
+                        radio.frames_out,
+                        radio.bytes_out,
+                    )
+                )
+            if radio.xb:
+                self._probe()
+
+
+link = LinkMonitor()
+router.add_monitor(link.on_message)
+
+# seconds without any frame from the robot before it is stopped
+LINK_DEADLINE: float = settings.get("link_deadline", 0.25)
+# "stop" halts the motors, "estop" also disables the robot
+LINK_LOSS_ACTION: str = settings.get("link_loss_action", "stop")
+
+
+class LinkState(enum.Enum):
+    UNKNOWN = "unknown"
+    CONNECTED = "connected"
+    LOST = "lost"
+
+
+class LinkWatchdog:
+    """
+    Stop the robot when nothing has been heard from it for ``deadline``.
+
+    Armed by the first rf data frame from the robot. The thread sleeps
+    exactly until the deadline of the last frame, on a trip the drive
+    scheduler is cancelled and a confirmed stop goes out on the safety lane,
+    ahead of anything already queued. Listeners get every state change on
+    the thread that caused it, the watchdog's or the rx reader's, in order
+    and only while it's still the current state.
+    """
+
+    def __init__(self, deadline: float = LINK_DEADLINE, action: str = LINK_LOSS_ACTION):
+        self.deadline = deadline
+        self.action = action
+        self.state = LinkState.UNKNOWN
+        self.last_rx: Optional[float] = None
+
+        self._listeners: list[Callable[[LinkState], Any]] = []
+        self._cond = threading.Condition()
+        # held while notifying, and the state listeners were last told
+        self._notify_lock = threading.RLock()
+        self._notified = LinkState.UNKNOWN
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.trips = 0
+        self.last_detection: Optional[float] = None
+        self.max_detection = 0.0
+
+    def add_listener(self, listener: Callable[[LinkState], Any]):
+        self._listeners = self._listeners + [listener]
+
+    def remove_listener(self, listener: Callable[[LinkState], Any]):
+        self._listeners = [l for l in self._listeners if l != listener]
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name="LinkWatchdog", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.state = LinkState.UNKNOWN
+        self._notified = LinkState.UNKNOWN
+        self.last_rx = None
+
+    def feed(self):
+        # called by the link whenever rf data from the robot arrives
+        self.last_rx = time.monotonic()
+        if self.state is not LinkState.CONNECTED:
+            with self._cond:
+                self.state = LinkState.CONNECTED
+                self._cond.notify()
+            self._changed(LinkState.CONNECTED)
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state.value,
+            "deadline": self.deadline,
+            "trips": self.trips,
+            "last_detection": self.last_detection,
+            "max_detection": self.max_detection,
+        }
+
+    def _run(self):
+        with self._cond:
+            while self._running:
+                if self.state is not LinkState.CONNECTED:
+                    self._cond.wait()
+                    continue
+                remaining = self.last_rx + self.deadline - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                self.state = LinkState.LOST
+                self._cond.release()
+                try:
+                    self._trip()
+                finally:
+                    self._cond.acquire()
+
+    def _trip(self):
+        detection = time.monotonic() - self.last_rx
+        drive.cancel()
+        # noinspection PyBroadException
+        try:
+            txstr(
+                "request.estop" if self.action == "estop" else "stop",
+                Lane.SAFETY,
+                confirm=True,
+            )
+        except Exception:
+            logger.exception("Failed to stop the robot")
+        self.trips += 1
+        self.last_detection = detection
+        self.max_detection = max(self.max_detection, detection)
+        logger.warning(f"No data from the robot for {detection * 1000:.0f} ms, stopped")
+        self._changed(LinkState.LOST)
+
+    def _changed(self, state: LinkState):
+        # a frame may have come in while tripping, don't report LOST after it
+        with self._notify_lock:
+            with self._cond:
+                current = self.state
+            if current is not state or self._notified is state:
+                return
+            self._notified = state
+            self._notify(state)
+
+    def _notify(self, state: LinkState):
+        for listener in self._listeners:
+            # noinspection PyBroadException
+            try:
+                listener(state)
+            except Exception:
+                logger.exception(f"Link listener {listener} failed")
+
+
+watchdog = LinkWatchdog()
+
+
+def init(
+    callback: Optional[Callable[[dict], Any]] = None,
+    qapp: QApplication = None,
+    port: Optional[str] = None,
+):
+    ser = None
     try:
-        ser = serial.Serial(PORT, BAUD)
+        ser = _open_broker() if port is None else None
+        if not ser:
+            ser = _open_serial(port)
     except (SerialException, FileNotFoundError):
         try:
             if not qapp:
@@ -80,38 +1681,470 @@ def init(callback: Optional[Callable[[str], Any]] =None, qapp: QApplication=None
         except ImportError:
             logger.error(f'Port "{PORT}" Not Found')
     if ser:
-        xb = xbee_com.XBee(ser, escaped=False, callback=callback)
+        if callback:
+            rx_reader.callback = _with_callback(callback)
+        _attach(ser)
+    radio.start()
+    drive.start()
+    deliveries.start()
+    link.start()
+    watchdog.start()
+    if TELEMETRY_JOURNAL:
+        try:
+            telemetry_journal.start()
+        except OSError as e:
+            logger.error(f"Can't start the telemetry journal, {e}")
+    if port is None and PORT_DISCOVERY and not isinstance(ser, broker.BrokerPort):
+        port_watcher.start()
+    supervisor.start(ser is not None)
 
 
-def _send_data(data: str):
-    # noinspection PyUnresolvedReferences
-    if xb:
-        xb.send("tx", dest_addr=b"\x00\x00", data=bytes("{}\r".format(data), "utf-8"))
+def _with_callback(callback: Callable[[dict], Any]) -> Callable[[memoryview], Any]:
+    # callback gets the frame dict the xbee library used to pass, after the
+    # link has dispatched the frame as usual
+    def dispatch(frame: memoryview):
+        radio.dispatch_frame(frame)
+        parsed = xbee_frames.parse(bytes(frame))
+        if parsed is not None:
+            callback(parsed)
 
+    return dispatch
 
-def txstr(data: str):
-    logger.trace("Sent: " + data)
-    _send_data(data)
 
+def _open_broker() -> Optional[broker.BrokerPort]:
+    if not USE_BROKER or not broker.available():
+        return None
+    try:
+        port = broker.BrokerPort()
+    except OSError as e:
+        logger.warning(f"Broker at {broker.SOCKET_PATH} is not responding, {e}")
+        return None
+    logger.info(f"Using serial broker at {broker.SOCKET_PATH}")
+    return port
+
+
+def _open_serial(port: Optional[str] = None) -> serial.Serial:
+    if port:
+        return serial.Serial(port, BAUD)
+    try:
+        return serial.Serial(PORT, BAUD)
+    except (SerialException, FileNotFoundError) as e:
+        if not PORT_DISCOVERY:
+            raise
+        logger.warning(f"Can't open {PORT}, looking for the XBee, {e}")
+    return _discover(discovery.candidates([PORT]))
+
+
+def _discover(ports: list[str]) -> serial.Serial:
+    found = discovery.discover(ports, BAUD)
+    if not found:
+        raise SerialException(f"No XBee found on {', '.join(ports) or 'any port'}")
+    _remember_port(*found)
+    return serial.Serial(PORT, BAUD)
+
+
+def _remember_port(port: str, baud: int):
+    global PORT, BAUD
+    PORT, BAUD = port, baud
+    logger.info(f"Found XBee on {port} at {baud} baud")
+    settings.setdefault("ports", {})["discovered"] = {"port": port, "baud": baud}
+    # merge into the file, other apps may have changed it since it was loaded
+    try:
+        with open("settings.json", "r") as file:
+            saved = json.load(file)
+        saved.setdefault("ports", {})["discovered"] = {"port": port, "baud": baud}
+        with open("settings.json", "w") as file:
+            json.dump(saved, file, indent=2)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Couldn't save the discovered port, {e}")
+
+
+def reopen(port: str, baud: Optional[int] = None):
+    # swap the serial port under a running link, queued frames are kept
+    _detach()
+    _attach(serial.Serial(port, baud or BAUD))
+    logger.info(f"Reopened XBee on {port}")
+
+
+def _detach():
+    rx_reader.stop()
+    old = radio.detach()
+    if old:
+        try:
+            old.close()
+        except (SerialException, OSError):
+            pass
+
+
+def _attach(port: Union[serial.Serial, broker.BrokerPort]):
+    radio.attach(port)
+    rx_reader.start(port)
+
+
+def _ports_changed(added: set[str], removed: set[str]):
+    # runs on the port watcher thread
+    if radio.ser and radio.ser.port in removed:
+        logger.warning(f"XBee port {radio.ser.port} went away")
+    if added and supervisor.state is not ConnectionState.CONNECTED:
+        # try the new device now instead of waiting out the backoff
+        supervisor.retry_now(added)
+
+
+port_watcher = discovery.PortWatcher(_ports_changed)
+
+# backoff between reconnect attempts, doubling from the first to the max
+RECONNECT_DELAY: float = settings.get("reconnect_delay", 0.25)
+RECONNECT_MAX_DELAY: float = settings.get("reconnect_max_delay", 8.0)
+# failed attempts before the link is reported offline, retries continue
+RECONNECT_ATTEMPTS: int = settings.get("reconnect_attempts", 6)
+# seconds between probing every serial port while the xbee's port is gone
+RECONNECT_DISCOVERY_INTERVAL: float = settings.get("reconnect_discovery_interval", 30)
+
+
+class ConnectionState(enum.Enum):
+    CONNECTED = "connected"
+    RECONNECTING = "reconnecting"
+    OFFLINE = "offline"
+
+
+class ConnectionSignals(QObject):
+    # ConnectionState value, emitted from the supervisor's threads
+    state_changed = Signal(str)
+
+
+class LinkSupervisor:
+    """
+    Bring the serial link back after an I/O error, e.g. an unplugged cable
+    or a reset USB XBee.
+
+    Read and write errors move the link to RECONNECTING and the supervisor
+    thread reopens the port (or broker connection), waiting ``delay``
+    doubled per failed attempt in between. After ``attempts`` failures the
+    link is OFFLINE, attempts go on at ``max_delay``. Once connected again
+    the robot is sent a stop and the latest value of every cached control
+    command.
+
+    Each attempt opens the last known port. While it's gone, devices the
+    port watcher reports are probed for the XBee, every port only once per
+    ``discovery_interval``.
+    """
+
+    def __init__(
+        self,
+        delay: float = RECONNECT_DELAY,
+        max_delay: float = RECONNECT_MAX_DELAY,
+        attempts: int = RECONNECT_ATTEMPTS,
+        discovery_interval: float = RECONNECT_DISCOVERY_INTERVAL,
+    ):
+        self.delay = delay
+        self.max_delay = max_delay
+        self.attempts = attempts
+        self.discovery_interval = discovery_interval
+        self.state = ConnectionState.OFFLINE
+        self.signals = ConnectionSignals()
+
+        self.attempt = 0
+        self.reconnects = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.outage = 0.0
+        self.discoveries = 0
 
-def txcv(cmd: str, val: str, delay: int=0):
+        self._lost_at: Optional[float] = None
+        self._discovered_at: Optional[float] = None
+        # devices added since the last attempt, probed before anything else
+        self._new_ports: set[str] = set()
+        self._lock = threading.Lock()
+        self._via_broker = False
+        self._retrying = False
+        self._wake = threading.Event()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, connected: bool):
+        self._via_broker = isinstance(radio.ser, broker.BrokerPort)
+        self._set(ConnectionState.CONNECTED if connected else ConnectionState.OFFLINE)
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name="LinkSupervisor", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def failed(self, error: Exception):
+        # called by the rx reader and writer on an I/O error
+        if self.state is not ConnectionState.CONNECTED:
+            return
+        self.errors += 1
+        self.last_error = repr(error)
+        self._lost_at = time.monotonic()
+        self._discovered_at = None
+        logger.error(f"Serial link failed, reconnecting, {error!r}")
+        self._reconnect_now()
+
+    def retry_now(self, ports: Iterable[str] = ()):
+        # skip the backoff, e.g. when a new serial device shows up
+        with self._lock:
+            self._new_ports.update(ports)
+        if self.state is not ConnectionState.CONNECTED:
+            self._reconnect_now()
+
+    def _reconnect_now(self):
+        self.attempt = 0
+        self._retrying = True
+        self._set(ConnectionState.RECONNECTING)
+        self._wake.set()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state.value,
+            "reconnects": self.reconnects,
+            "errors": self.errors,
+            "attempt": self.attempt,
+            "last_error": self.last_error,
+            "outage": self.outage,
+            "discoveries": self.discoveries,
+        }
+
+    def _set(self, state: ConnectionState):
+        if state is self.state:
+            return
+        self.state = state
+        self.signals.state_changed.emit(state.value)
+
+    def _run(self):
+        delay = None
+        while True:
+            self._wake.wait(delay)
+            self._wake.clear()
+            if not self._running:
+                return
+            if self.state is ConnectionState.CONNECTED or not self._retrying:
+                delay = None
+                continue
+            if self._reconnect():
+                self._retrying = False
+                self.reconnects += 1
+                if self._lost_at is not None:
+                    self.outage = time.monotonic() - self._lost_at
+                    self._lost_at = None
+                self._set(ConnectionState.CONNECTED)
+                logger.info(f"Serial link back after {self.attempt + 1} attempts")
+                self._replay()
+                delay = None
+                continue
+            self.attempt += 1
+            if self.attempt >= self.attempts:
+                self._set(ConnectionState.OFFLINE)
+            delay = min(self.delay * 2 ** (self.attempt - 1), self.max_delay)
+
+    def _reconnect(self) -> bool:
+        _detach()
+        # noinspection PyBroadException
+        try:
+            if self._via_broker:
+                port = _open_broker()
+                if not port:
+                    return False
+            else:
+                port = self._open_serial()
+            _attach(port)
+            return True
+        except Exception as e:
+            logger.debug(f"Reconnect attempt {self.attempt + 1} failed, {e!r}")
+            return False
+
+    def _open_serial(self) -> serial.Serial:
+        try:
+            return serial.Serial(PORT, BAUD)
+        except (SerialException, OSError):
+            if not PORT_DISCOVERY:
+                raise
+        with self._lock:
+            ports, self._new_ports = sorted(self._new_ports - {PORT}), set()
+        if ports:
+            return _discover(ports)
+        now = time.monotonic()
+        if (
+            self._discovered_at is not None
+            and now - self._discovered_at < self.discovery_interval
+        ):
+            raise SerialException(f"{PORT} is still gone")
+        self._discovered_at = now
+        self.discoveries += 1
+        logger.info(f"{PORT} is gone, looking for the XBee on every port")
+        return _discover(discovery.candidates([PORT]))
+
+    def _replay(self):
+        # the robot may have kept the last drive command, stop it first
+        drive.cancel()
+        txbatch(["stop"] + send_cache.latest())
+
+
+supervisor = LinkSupervisor()
+rx_reader.error_callback = supervisor.failed
+
+
+def halt():
+    supervisor.stop()
+    port_watcher.stop()
+    watchdog.stop()
+    link.stop()
+    drive.stop()
+    radio.stop()
+    deliveries.stop()
+    logger.debug(f"Drive scheduler stats: {drive.stats()}")
+    logger.debug(f"Link stats: {radio.stats()}")
+    logger.debug(f"Send cache stats: {send_cache.stats()}")
+    logger.debug(f"Reassembler stats: {router.reassembler.stats()}")
+    logger.debug(f"Delivery stats: {deliveries.stats()}")
+    logger.debug(f"Link monitor stats: {link.snapshot()}")
+    logger.debug(f"Watchdog stats: {watchdog.stats()}")
+    logger.debug(f"Supervisor stats: {supervisor.stats()}")
+    rx_reader.stop()
+    logger.debug(f"Rx reader stats: {rx_reader.stats()}")
+    telemetry_journal.close()
+    logger.debug(f"Telemetry journal stats: {telemetry_journal.stats()}")
+    if radio.xb:
+        radio.xb.halt()
+
+
+_fragment_ids = itertools.count()
+
+
+def fragment(data: str, size: Optional[int] = None) -> list[str]:
+    """
+    Split a payload into fragment frames of at most ``size`` bytes.
+    Chunks are cut on character boundaries so each frame decodes on its own.
+    """
+    size = size or MAX_PAYLOAD
+    msg_id = next(_fragment_ids) % 4096
+    chunks = []
+    chunk = ""
+    chunk_size = 0
+    # worst case header, counts stay well below 1000
+    room = size - len(f"{FRAGMENT_KEY}:{msg_id}:999:999=")
+    for char in data:
+        char_size = len(char.encode("utf-8"))
+        if chunk and chunk_size + char_size > room:
+            chunks.append(chunk)
+            chunk = ""
+            chunk_size = 0
+        chunk += char
+        chunk_size += char_size
+    if chunk:
+        chunks.append(chunk)
+    return [
+        f"{FRAGMENT_KEY}:{msg_id}:{index}:{len(chunks)}={chunk}"
+        for index, chunk in enumerate(chunks)
+    ]
+
+
+def _send_data(data: str, lane: Optional[Lane] = None, frame_id: int = 0):
+    robot.send(data, lane, frame_id)
+
+
+def _format_cv(cmd: str, val: Any) -> str:
     # see if val is a list or a string
     if isinstance(val, list) or isinstance(val, tuple):
         val = str(val).strip("[]()").replace(", ", ",")
 
-    txstr(cmd + "=" + str(val))
+    return cmd + "=" + str(val)
+
+
+def txstr(
+    data: str, lane: Optional[Lane] = None, force: bool = False, confirm: bool = False
+) -> Optional[Delivery]:
+    # confirmed sends always go out and are tracked until the radio acks them
+    if confirm:
+        send_cache.check(data)
+        logger.trace("Sent confirmed: " + data)
+        return deliveries.send(data, lane)
+    # repeated values of SEND_ON_CHANGE keys are dropped unless forced
+    if not force and not send_cache.check(data):
+        logger.trace("Suppressed: " + data)
+        return
+    logger.trace("Sent: " + data)
+    _send_data(data + DELIMITER, lane)
+
+
+def txcv(
+    cmd: str,
+    val: str,
+    delay: int = 0,
+    lane: Optional[Lane] = None,
+    force: bool = False,
+    confirm: bool = False,
+) -> Optional[Delivery]:
+    delivery = txstr(_format_cv(cmd, val), lane, force, confirm)
     time.sleep(delay)
+    return delivery
+
+
+def pack(items: Iterable[Union[str, tuple[str, Any]]]) -> list[str]:
+    """
+    Pack commands into as few frame payloads as MAX_PAYLOAD allows.
+    Items are either raw strings or (cmd, val) pairs, order is kept.
+    A single command larger than MAX_PAYLOAD gets a payload of its own and
+    is fragmented when sent.
+    """
+    payloads = []
+    payload = ""
+    size = 0
+    for item in items:
+        data = (item if isinstance(item, str) else _format_cv(*item)) + DELIMITER
+        data_size = len(data.encode("utf-8"))
+        if payload and size + data_size > MAX_PAYLOAD:
+            payloads.append(payload)
+            payload = ""
+            size = 0
+        payload += data
+        size += data_size
+    if payload:
+        payloads.append(payload)
+    return payloads
+
+
+def txbatch(
+    items: Iterable[Union[str, tuple[str, Any]]],
+    lane: Optional[Lane] = None,
+    confirm: bool = False,
+    retries: Optional[int] = None,
+) -> list[Delivery]:
+    # send several commands in as few frames as possible
+    sent = []
+    for payload in pack(items):
+        logger.trace("Sent: " + repr(payload))
+        if confirm:
+            sent.append(deliveries.send(payload[: -len(DELIMITER)], lane, retries))
+        else:
+            _send_data(payload, lane)
+    return sent
 
 
 def txmot(vals: Union[list[int, int], tuple[int, int]]):
     # send motor values to the xbee
-    txcv("left_motor", vals[0])
-    txcv("right_motor", vals[1])
+    txbatch([("left_motor", vals[0]), ("right_motor", vals[1])])
+
+
+def txdrive(vals: Union[list[int, int], tuple[int, int]]):
+    # queue motor values, only the latest is sent at DRIVE_RATE
+    drive.submit(vals)
 
 
 def txstop():
+    drive.cancel()
     txstr("stop")
 
 
 def tx_e_stop():
-    txstr("request.estop")
+    drive.cancel()
+    txstr("request.estop", confirm=True)
@@ -0,0 +1,169 @@
+#!/usr/bin/python
+
+"""
+XBee serial port discovery for Kevinbot v3
+Finds the port and baud rate an XBee in API mode answers on
+
+Every candidate port is probed on its own thread with an AT command frame,
+the first port to answer wins. Run it directly to see what would be found:
+    python3 discovery.py
+"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterable, Optional
+
+import serial
+from serial.tools import list_ports
+
+import xbee_frames
+
+# tried in this order after the preferred rate
+BAUDS = (460800, 230400, 115200, 57600, 9600)
+
+# AT command used to probe, the 16-bit address is harmless to read
+PROBE_COMMAND = b"MY"
+PROBE_FRAME_ID = 0x4B
+
+
+def candidates(preferred: Iterable[str] = ()) -> list[str]:
+    # preferred ports first, then everything the os lists
+    ports = [port for port in preferred if port]
+    for info in sorted(list_ports.comports(), key=lambda p: p.device):
+        if info.device not in ports:
+            ports.append(info.device)
+    return ports
+
+
+def probe(port: str, baud: int, timeout: float = 0.25) -> Optional[bytes]:
+    """
+    Ask ``port`` for the XBee's 16-bit address at ``baud``.
+    Returns the address, or None if nothing answered within ``timeout``.
+    """
+    try:
+        ser = serial.Serial(port, baud, timeout=timeout / 5)
+    except (serial.SerialException, OSError, ValueError):
+        return None
+    reader = xbee_frames.FrameReader()
+    try:
+        ser.reset_input_buffer()
+        ser.write(xbee_frames.at(PROBE_COMMAND, frame_id=PROBE_FRAME_ID))
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            data = ser.read(max(1, ser.in_waiting))
+            if not data:
+                continue
+            for raw in reader.feed(data):
+                frame = xbee_frames.parse(raw)
+                if (
+                    frame
+                    and frame["id"] == "at_response"
+                    and frame["frame_id"][0] == PROBE_FRAME_ID
+                    and frame["command"] == PROBE_COMMAND
+                ):
+                    return frame.get("parameter", b"")
+    except (serial.SerialException, OSError):
+        pass
+    finally:
+        ser.close()
+    return None
+
+
+def probe_port(
+    port: str, bauds: Iterable[int] = BAUDS, timeout: float = 0.25
+) -> Optional[int]:
+    # bauds of one port have to be tried one after another
+    for baud in bauds:
+        if probe(port, baud, timeout) is not None:
+            return baud
+    return None
+
+
+def discover(
+    ports: Optional[Iterable[str]] = None,
+    baud: Optional[int] = None,
+    timeout: float = 0.25,
+    workers: int = 8,
+) -> Optional[tuple[str, int]]:
+    """
+    Probe ``ports`` (all candidates by default) concurrently.
+    ``baud`` is tried first on every port. Returns (port, baud) of the first
+    XBee that answers, or None.
+    """
+    ports = candidates() if ports is None else list(ports)
+    if not ports:
+        return None
+    bauds = [baud] + [b for b in BAUDS if b != baud] if baud else list(BAUDS)
+    pool = ThreadPoolExecutor(min(workers, len(ports)), "PortProbe")
+    futures = {pool.submit(probe_port, port, bauds, timeout): port for port in ports}
+    try:
+        for future in as_completed(futures):
+            found = future.result()
+            if found:
+                return futures[future], found
+        return None
+    finally:
+        # don't wait for slower ports once one has answered
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+class PortWatcher:
+    """
+    Poll the os for serial ports coming and going, e.g. a USB XBee being
+    unplugged and enumerated again. ``on_change`` gets the sets of added
+    and removed devices on the watcher thread.
+    """
+
+    def __init__(
+        self,
+        on_change: Callable[[set[str], set[str]], None],
+        interval: float = 1.0,
+    ):
+        self.on_change = on_change
+        self.interval = interval
+        self._ports: set[str] = set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread:
+            return
+        self._ports = {info.device for info in list_ports.comports()}
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="PortWatcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            ports = {info.device for info in list_ports.comports()}
+            added, removed = ports - self._ports, self._ports - ports
+            self._ports = ports
+            if added or removed:
+                self.on_change(added, removed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kevinbot v3 XBee port discovery")
+    parser.add_argument(
+        "ports", nargs="*", help="ports to probe (default: every serial port)"
+    )
+    parser.add_argument("--timeout", type=float, default=0.25)
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    result = discover(args.ports or None, timeout=args.timeout)
+    elapsed = time.monotonic() - start
+    if result:
+        print(f"XBee on {result[0]} at {result[1]} baud ({elapsed:.2f} s)")
+    else:
+        raise SystemExit(f"No XBee found ({elapsed:.2f} s)")
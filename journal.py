@@ -0,0 +1,494 @@
+#!/usr/bin/python
+
+"""
+Binary telemetry journal for Kevinbot v3
+Records every telemetry sample of a drive session to logs/telemetry
+
+Samples are fixed size records appended through mmap to segment files that
+are preallocated up front, so the SD card sees long sequential writes and
+no file growth. Each segment header holds a time index with the time of
+every ``block``-th record, a time range query binary searches it and only
+touches the blocks that overlap. Full segments are rotated, the oldest are
+deleted once the journal is over its size limit. Only one process writes
+to a journal, the others sharing the broker leave it to the first.
+
+Print what a journal holds, or one channel of it:
+    python3 journal.py
+    python3 journal.py bms.voltages --last 600
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Any, Optional
+
+import numpy as np
+from loguru import logger
+
+import telemetry
+
+try:
+    import fcntl
+except ImportError:
+    # no locking on windows, where there's no broker to share the port
+    fcntl = None
+
+DIRECTORY = "logs/telemetry"
+SUFFIX = ".kbj"
+# held by the process writing the journal
+LOCK_NAME = "journal.lock"
+
+MAGIC = b"KBTJ"
+VERSION = 1
+# magic, version, record size, values per record, table size, header size,
+# records per index entry, capacity
+HEADER = struct.Struct("<4sHHHHIII")
+# records written, times of the first and last one, rewritten on every append
+STATE = struct.Struct("<Idd")
+STATE_OFFSET = HEADER.size
+TABLE_OFFSET = STATE_OFFSET + STATE.size
+INDEX_ENTRY = struct.Struct("<d")
+
+SEGMENT_SIZE = 8 * 1024 * 1024
+MAX_SIZE = 512 * 1024 * 1024
+BLOCK = 256
+FLUSH_INTERVAL = 5.0
+
+
+def _align(size: int, to: int) -> int:
+    return -(-size // to) * to
+
+
+def _record_dtype(fields: int) -> np.dtype:
+    return np.dtype(
+        [
+            ("time", "<f8"),
+            ("channel", "<u2"),
+            ("pad", "V2"),
+            ("values", "<f4", (fields,)),
+        ]
+    )
+
+
+class JournalWriter:
+    """
+    Appends telemetry to the current segment, one writer thread at a time.
+
+    Times are wall clock seconds advanced with time.monotonic(). They are
+    synced to the wall clock again for every segment but never go back, so
+    an ntp step while driving can't put records out of order.
+    """
+
+    def __init__(
+        self,
+        directory: str = DIRECTORY,
+        schema: Optional[dict] = None,
+        segment_size: int = SEGMENT_SIZE,
+        max_size: int = MAX_SIZE,
+        block: int = BLOCK,
+        flush_interval: float = FLUSH_INTERVAL,
+    ):
+        self.directory = directory
+        self.schema = telemetry.SCHEMA if schema is None else schema
+        self.segment_size = segment_size
+        self.max_size = max_size
+        self.block = block
+        self.flush_interval = flush_interval
+
+        self.channels = {
+            key: (number, tuple(field[0] for field in fields))
+            for number, (key, fields) in enumerate(self.schema.items())
+        }
+        self.fields = max(len(fields) for _, fields in self.channels.values())
+        self._record = struct.Struct(f"<dHxx{self.fields}f")
+        # zeros to pad short records to the fixed size
+        self._padding = {
+            key: (0.0,) * (self.fields - len(fields))
+            for key, (_, fields) in self.channels.items()
+        }
+        self._table = json.dumps(
+            {key: fields for key, (_, fields) in self.channels.items()}
+        ).encode()
+
+        # header, then the index, then records from a page boundary on
+        estimate = (segment_size - TABLE_OFFSET) // self._record.size
+        self._index_offset = _align(TABLE_OFFSET + len(self._table), 8)
+        self.header_size = _align(
+            self._index_offset + INDEX_ENTRY.size * -(-estimate // block),
+            mmap.ALLOCATIONGRANULARITY,
+        )
+        self.capacity = (segment_size - self.header_size) // self._record.size
+        if self.capacity < 1:
+            raise ValueError(f"Segment size {segment_size} leaves no room for records")
+
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        self.path: Optional[str] = None
+        self._count = 0
+        self._start = 0.0
+        self._offset = 0.0
+        self._last = 0.0
+        self._flushed = 0
+        self._flushed_at = 0.0
+
+        self.records = 0
+        self.segments = 0
+        self.bad_values = 0
+        self.deleted = 0
+
+    @property
+    def open(self) -> bool:
+        return self._map is not None
+
+    def start(self):
+        with self._lock:
+            if self._map is None:
+                os.makedirs(self.directory, exist_ok=True)
+                if not self._claim():
+                    return
+                self._last = 0.0
+                self._open_segment()
+
+    def close(self):
+        with self._lock:
+            self._close_segment()
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+    def _claim(self) -> bool:
+        # another writer would record everything twice and trim our segments
+        if fcntl is None or self._lock_file is not None:
+            return True
+        file = open(os.path.join(self.directory, LOCK_NAME), "a")
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            file.close()
+            logger.info(f"{self.directory} is recorded by another process")
+            return False
+        self._lock_file = file
+        return True
+
+    def on_message(self, message: Any):
+        # com router handler, shares the decode with the telemetry store
+        if self._map is None:
+            return
+        try:
+            record = message.record
+        except (KeyError, ValueError, IndexError):
+            self.bad_values += 1
+            return
+        self.append(message.key, record.astuple())
+
+    def append(self, key: str, values: tuple, t: Optional[float] = None):
+        channel = self.channels[key][0]
+        with self._lock:
+            if self._map is None:
+                return
+            if self._count == self.capacity:
+                self._rotate()
+            if t is None:
+                t = self._offset + time.monotonic()
+            count = self._count
+            if not count % self.block:
+                INDEX_ENTRY.pack_into(
+                    self._map,
+                    self._index_offset + INDEX_ENTRY.size * (count // self.block),
+                    t,
+                )
+            self._record.pack_into(
+                self._map,
+                self.header_size + count * self._record.size,
+                t,
+                channel,
+                *values,
+                *self._padding[key],
+            )
+            if not count:
+                self._start = t
+            self._count = count + 1
+            STATE.pack_into(self._map, STATE_OFFSET, self._count, self._start, t)
+            self._last = t
+            self.records += 1
+            if t - self._flushed_at >= self.flush_interval:
+                self._flush()
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "records": self.records,
+            "segments": self.segments,
+            "segment_records": self._count,
+            "capacity": self.capacity,
+            "bad_values": self.bad_values,
+            "deleted": self.deleted,
+        }
+
+    def _open_segment(self):
+        self.path = os.path.join(
+            self.directory,
+            time.strftime("telemetry-%Y%m%d-%H%M%S", time.localtime())
+            + f"-{os.getpid()}-{self.segments:04d}{SUFFIX}",
+        )
+        # never truncate a segment that exists, it may still be mapped
+        self._file = open(self.path, "x+b")
+        try:
+            # reserve the blocks now, the card doesn't fragment the file later
+            os.posix_fallocate(self._file.fileno(), 0, self.segment_size)
+        except (AttributeError, OSError):
+            self._file.truncate(self.segment_size)
+        self._map = mmap.mmap(self._file.fileno(), self.segment_size)
+        # follow the wall clock, but never back before the last segment ended
+        self._offset = time.time() - time.monotonic()
+        self._offset = max(self._offset, self._last - time.monotonic())
+        HEADER.pack_into(
+            self._map,
+            0,
+            MAGIC,
+            VERSION,
+            self._record.size,
+            self.fields,
+            len(self._table),
+            self.header_size,
+            self.block,
+            self.capacity,
+        )
+        STATE.pack_into(self._map, STATE_OFFSET, 0, 0.0, 0.0)
+        self._map[TABLE_OFFSET : TABLE_OFFSET + len(self._table)] = self._table
+        self._count = 0
+        self._flushed = 0
+        self._flushed_at = self._last
+        self.segments += 1
+        logger.info(f"Telemetry journal segment {self.path}")
+        self._trim()
+
+    def _close_segment(self):
+        if self._map is None:
+            return
+        self._flush()
+        self._map.close()
+        self._map = None
+        # a short session shouldn't keep the whole preallocation
+        self._file.truncate(self.header_size + self._count * self._record.size)
+        self._file.close()
+        self._file = None
+
+    def _rotate(self):
+        self._close_segment()
+        self._open_segment()
+
+    def _flush(self):
+        # write back the header and the pages appended since the last flush
+        end = self.header_size + self._count * self._record.size
+        first = self._flushed - self._flushed % mmap.PAGESIZE
+        self._map.flush(0, self.header_size)
+        if end > first:
+            self._map.flush(first, end - first)
+        self._flushed = end
+        self._flushed_at = self._last
+
+    def _trim(self):
+        # oldest segments go first once the journal is over max_size
+        paths = segment_paths(self.directory)
+        sizes = [os.path.getsize(path) for path in paths]
+        total = sum(sizes)
+        for path, size in zip(paths, sizes):
+            if total <= self.max_size or path == self.path:
+                break
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Can't delete journal segment {path}, {e}")
+                continue
+            total -= size
+            self.deleted += 1
+            logger.info(f"Deleted journal segment {path}")
+
+
+def segment_paths(directory: str = DIRECTORY) -> list[str]:
+    # oldest first
+    try:
+        names = [name for name in os.listdir(directory) if name.endswith(SUFFIX)]
+    except FileNotFoundError:
+        return []
+    paths = [os.path.join(directory, name) for name in names]
+    return sorted(paths, key=lambda path: (os.path.getmtime(path), path))
+
+
+class Segment:
+    """
+    Read-only view of one segment file. Only the records written when it
+    was opened are mapped, open it again to see newer ones.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            head = file.read(TABLE_OFFSET)
+            if len(head) < TABLE_OFFSET or head[:4] != MAGIC:
+                raise ValueError(f"{path} is not a telemetry journal segment")
+            (
+                _,
+                version,
+                record_size,
+                fields,
+                table_size,
+                header_size,
+                self.block,
+                self.capacity,
+            ) = HEADER.unpack_from(head)
+            if version != VERSION:
+                raise ValueError(f"{path} is journal version {version}")
+            self.count, self.start, self.end = STATE.unpack_from(head, STATE_OFFSET)
+            table = json.loads(file.read(table_size))
+            self.channels = {
+                key: (number, tuple(names))
+                for number, (key, names) in enumerate(table.items())
+            }
+            dtype = _record_dtype(fields)
+            if dtype.itemsize != record_size:
+                raise ValueError(f"{path} has {record_size} byte records")
+            self._map = None
+            self.index = np.empty(0)
+            self.records = np.empty(0, dtype)
+            if not self.count:
+                return
+            self._map = mmap.mmap(
+                file.fileno(),
+                header_size + self.count * record_size,
+                access=mmap.ACCESS_READ,
+            )
+        # both are views of the map, nothing is read until a query needs it
+        self.index = np.frombuffer(
+            self._map,
+            "<f8",
+            -(-self.count // self.block),
+            _align(TABLE_OFFSET + table_size, 8),
+        )
+        self.records = np.frombuffer(self._map, dtype, self.count, header_size)
+
+    def read(
+        self, key: str, start: float = -np.inf, end: float = np.inf
+    ) -> tuple[np.ndarray, np.ndarray]:
+        number, names = self.channels[key]
+        if not self.count or self.end < start or self.start > end:
+            return np.empty(0), np.empty((0, len(names)))
+        # blocks that can hold records between start and end
+        first = max(int(np.searchsorted(self.index, start, "right")) - 1, 0)
+        last = int(np.searchsorted(self.index, end, "right"))
+        rows = self.records[first * self.block : last * self.block]
+        times = rows["time"]
+        picked = rows[(rows["channel"] == number) & (times >= start) & (times <= end)]
+        return picked["time"], picked["values"][:, : len(names)].astype(float)
+
+    def close(self):
+        # views have to go before the map can close
+        self.index = self.records = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class JournalReader:
+    """
+    Every segment of a journal, oldest first. read() pulls one channel for
+    a time range out of the segments that overlap it.
+    """
+
+    def __init__(self, directory: str = DIRECTORY):
+        self.directory = directory
+        self.segments: list[Segment] = []
+        self.refresh()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def refresh(self):
+        # reopen everything, picks up records and segments written since
+        self.close()
+        for path in segment_paths(self.directory):
+            try:
+                self.segments.append(Segment(path))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping journal segment {path}, {e}")
+        self.segments.sort(key=lambda segment: segment.start)
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+
+    @property
+    def start(self) -> Optional[float]:
+        return min((s.start for s in self.segments if s.count), default=None)
+
+    @property
+    def end(self) -> Optional[float]:
+        return max((s.end for s in self.segments if s.count), default=None)
+
+    def channels(self) -> dict[str, tuple[str, ...]]:
+        channels = {}
+        for segment in self.segments:
+            for key, (_, names) in segment.channels.items():
+                channels.setdefault(key, names)
+        return channels
+
+    def read(
+        self, key: str, start: Optional[float] = None, end: Optional[float] = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Wall clock times and values (one column per field) of ``key``
+        between ``start`` and ``end``, both inclusive and open if None.
+        """
+        start = -np.inf if start is None else start
+        end = np.inf if end is None else end
+        parts = [
+            segment.read(key, start, end)
+            for segment in self.segments
+            if key in segment.channels
+        ]
+        parts = [part for part in parts if len(part[0])]
+        if not parts:
+            names = self.channels().get(key, ())
+            return np.empty(0), np.empty((0, len(names)))
+        return (
+            np.concatenate([times for times, _ in parts]),
+            np.concatenate([values for _, values in parts]),
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kevinbot v3 telemetry journal")
+    parser.add_argument("key", nargs="?", help="channel to print")
+    parser.add_argument("--directory", default=DIRECTORY)
+    parser.add_argument(
+        "--last", type=float, help="only the last LAST seconds of the journal"
+    )
+    args = parser.parse_args()
+
+    with JournalReader(args.directory) as reader:
+        if reader.start is None:
+            raise SystemExit(f"No telemetry in {args.directory}")
+        if not args.key:
+            for segment in reader.segments:
+                print(
+                    f"{segment.path}: {segment.count} records, "
+                    f"{time.ctime(segment.start)} - {time.ctime(segment.end)}"
+                )
+            print(f"channels: {', '.join(reader.channels())}")
+        else:
+            since = reader.end - args.last if args.last else None
+            times, values = reader.read(args.key, since)
+            print("time," + ",".join(reader.channels()[args.key]))
+            for t, row in zip(times.tolist(), values.tolist()):
+                print(f"{t:.3f}," + ",".join(f"{v:g}" for v in row))
@@ -6,6 +6,7 @@ By: Kevin Ahr
 """
 
 import datetime
+import threading
 import time
 import json
 import platform
@@ -36,8 +37,11 @@ import qtawesome as qta
 
 import Joystick.Joystick as Joystick
 import SlidingStackedWidget as SlidingStackedWidget
+import alarms
 import com
 import strings
+import telemetry
+import viewmodel
 from colorpicker.colorpicker import ColorPicker
 from palette import PaletteGrid, PALETTES
 from utils import *
@@ -50,7 +54,6 @@ DEVEL_OPTIONS = True
 ENABLE_BATT2 = True
 THEME_FILE = "theme.qss"
 CURRENT_ARM_POS = [0, 0, 0, 0, 0, 0, 0, 0, 0, 0]  # two 5dof arms
-HIGH_INSIDE_TEMP = 45
 
 EYE_SKINS = {
     "Simple": (3, "icons/eye.svg"),
@@ -75,7 +78,6 @@ window = None
 disable_batt_modal = False
 disable_temp_modal = False
 enabled = False
-last_alive_message = datetime.datetime.now()
 
 # load settings from file
 with open("settings.json", "r") as f:
@@ -109,21 +111,16 @@ else:
         ANALOG_STICK = True
     save_settings()
 
-# load voltage warning settings
-if "warning_voltage" in settings:
-    warning_voltage = settings["warning_voltage"]
-else:
-    settings["warning_voltage"] = 10  # save default
-    warning_voltage = settings["warning_voltage"]
+# load alarm rules, the defaults take the old warning settings
+if "alarms" not in settings:
+    settings["alarms"] = alarms.default_rules(settings)  # save default
     save_settings()
 
-# load temp warning settings
-if "motor_temp_warning" in settings:
-    HIGH_MOTOR_TEMP = settings["motor_temp_warning"]
-else:
-    settings["motor_temp_warning"] = 50  # save default
-    HIGH_MOTOR_TEMP = settings["motor_temp_warning"]
-    save_settings()
+# alarm colors by severity
+ALARM_COLORS = {alarms.WARNING: "#eebc2a", alarms.CRITICAL: "#df574d"}
+
+# ms to wait for a missing full mesh part 0 before taking parts to count from 1
+FULL_MESH_WAIT = 500
 
 try:
     remote_name = settings["name"]
@@ -143,8 +140,14 @@ class RemoteUI(KBMainWindow):
         self.setWindowIcon(QIcon("icons/icon.svg"))
 
         # start coms
-        com.init(callback=self.serial_callback, qapp=app)
-        init_robot()
+        self.last_telemetry: dict[str, telemetry.Record] = {}
+        # telemetry handlers write widget state here, applied once per frame
+        self.view = viewmodel.ViewModel(parent=self)
+        self.alarms = alarms.load(settings["alarms"])
+        self.register_handlers()
+        com.init(qapp=app)
+        # keep a port found by discovery when settings are saved later
+        settings["ports"] = com.settings.get("ports", settings["ports"])
 
         if EMULATE_REAL_REMOTE:
             self.setWindowFlags(Qt.Window | Qt.FramelessWindowHint)
@@ -163,15 +166,24 @@ class RemoteUI(KBMainWindow):
         # vars
         self.modal_count = 0
         self.modals = []
-        self.full_mesh = []
+        self.full_mesh = com.Reassembler()
         self.full_mesh_last_part = 0
+        # first part number of core.full_mesh, None until it's known
+        self.full_mesh_base = None
+        self.full_mesh_count = 0
+        self.full_mesh_timer = QTimer(self)
+        self.full_mesh_timer.setSingleShot(True)
+        self.full_mesh_timer.setInterval(FULL_MESH_WAIT)
+        self.full_mesh_timer.timeout.connect(self.full_mesh_timeout)
         self.eye_skin = 3
         self.eye_neon_left_color = "#ffffff"
         self.eye_neon_right_color = "#ffffff"
 
         self.init_ui()
+        self.init_alarms()
 
-        com.txcv("eye.get_settings", True)
+        # queued to the gui thread by qt, needs the debug page
+        com.supervisor.signals.state_changed.connect(self.show_serial_state)
 
         if settings["dev_mode"]:
             self.createDevTools()
@@ -180,359 +192,330 @@ class RemoteUI(KBMainWindow):
             remote_version = open("version.txt", "r").read()
         except FileNotFoundError:
             remote_version = "UNKNOWN"
-        com.txcv("core.remotes.add", f"{remote_name}|{remote_version}|kevinbot.remote")
 
         if START_FULL_SCREEN:
             self.showFullScreen()
         else:
             self.show()
 
-    def serial_callback(self, message):
-        # noinspection PyBroadException
-        try:
-            if not "rf_data" in message:
-                # TODO: Add a more permanant solution for the 0x74 error
-                # 0x74 = Message to long
-                logger.warning(f"Status message", message)
-                return
-
-            data = message["rf_data"].decode("utf-8").strip("\r\n")
-            data = data.split("=", maxsplit=1)
-            logger.trace(f"Recieved: {data}")
-
-            if data[0] == "handshake.end" and data[1] == remote_name:
-                get_updater().call_latest(window.widget.setCurrentIndex, 1)
-            elif data[0] == "bms.voltages":
-                if window is not None:
-                    volt1, volt2 = data[1].split(",")
-                    get_updater().call_latest(
-                        window.batt_volt1.setText,
-                        strings.BATT_VOLT1.format(float(volt1) / 10) + "V",
-                    )
-                    get_updater().call_latest(
-                        window.battery1_label.setText,
-                        strings.BATT_VOLT1.format(float(volt1) / 10),
-                    )
-
-                    if float(volt1) / 10 < warning_voltage:
-                        get_updater().call_latest(
-                            window.battery1_label.setStyleSheet,
-                            "background-color: #df574d;",
-                        )
-                    else:
-                        get_updater().call_latest(
-                            window.battery1_label.setStyleSheet, ""
-                        )
-
-                    if ENABLE_BATT2:
-                        get_updater().call_latest(
-                            window.batt_volt2.setText,
-                            strings.BATT_VOLT2.format(float(volt2) / 10) + "V",
-                        )
-                        get_updater().call_latest(
-                            window.battery2_label.setText,
-                            strings.BATT_VOLT2.format(float(volt2) / 10),
-                        )
-                        if float(volt2) / 10 < warning_voltage:
-                            get_updater().call_latest(
-                                window.battery2_label.setStyleSheet,
-                                "background-color: #df574d;",
-                            )
-                        else:
-                            get_updater().call_latest(
-                                window.battery2_label.setStyleSheet, ""
-                            )
-
-                    if not disable_batt_modal:
-                        if float(volt1) / 10 < 11:
-                            if enabled:
-                                get_updater().call_latest(window.request_enabled, False)
-                            get_updater().call_latest(
-                                window.battModalText.setText, strings.BATT_LOW
-                            )
-                            get_updater().call_latest(window.batt_modal.show)
-                        elif float(volt2) / 10 < 11:
-                            if enabled:
-                                get_updater().call_latest(window.request_enabled, False)
-                            get_updater().call_latest(
-                                window.battModalText.setText, strings.BATT_LOW
-                            )
-                            get_updater().call_latest(window.batt_modal.show)
-            # bme280 sensor
-            elif data[0] == "bme":
-                if window is not None:
-                    get_updater().call_latest(
-                        window.outside_temp.setText,
-                        strings.OUTSIDE_TEMP.format(
-                            str(data[1].split(",")[0])
-                            + "℃ ("
-                            + str(data[1].split(",")[1])
-                            + "℉)"
-                        ),
-                    )
-                    get_updater().call_latest(
-                        window.outside_humi.setText,
-                        strings.OUTSIDE_HUMI.format(data[1].split(",")[2]),
-                    )
-                    get_updater().call_latest(
-                        window.outside_hpa.setText,
-                        strings.OUTSIDE_PRES.format(data[1].split(",")[3]),
-                    )
-            # motor, body temps
-            elif data[0] == "temps":
-                if window is not None:
-                    get_updater().call_latest(
-                        window.left_temp.setText,
-                        strings.LEFT_TEMP.format(
-                            rstr(data[1].split(",")[0])
-                            + "℃ ("
-                            + rstr(convert_c_to_f(float(data[1].split(",")[0])))
-                            + "℉)"
-                        ),
+        # the window paints while the robot is brought up
+        threading.Thread(
+            target=init_robot,
+            args=(remote_version, self.robot_initialized),
+            name="InitRobot",
+            daemon=True,
+        ).start()
+
+    def register_handlers(self):
+        com.router.register("handshake.end", self.rx_handshake_end)
+        com.router.register("bms.voltages", self.rx_bms_voltages)
+        com.router.register("bme", self.rx_bme)
+        com.router.register("temps", self.rx_temps)
+        com.router.register("imu", self.rx_imu)
+        com.router.register("core.uptime", self.rx_core_uptime)
+        com.router.register("os_uptime", self.rx_os_uptime)
+        com.router.register("remote.disableui", self.rx_remote_disableui)
+        com.router.register("core.enabled", self.rx_core_enabled)
+        com.router.register("core.enablefailed", self.rx_core_enablefailed)
+        com.router.register("core.speech-engine", self.rx_core_speech_engine)
+        com.router.register("core.service.init", self.rx_core_service_init)
+        com.router.register_prefix("core.full_mesh", self.rx_core_full_mesh)
+        com.router.register("core.ping", self.rx_core_ping)
+        com.router.register("eye_settings.states.page", self.rx_eye_page)
+        com.router.register(
+            "eye_settings.skins.simple.iris_size", self.rx_eye_simple_iris_size
+        )
+        com.router.register(
+            "eye_settings.skins.simple.pupil_size", self.rx_eye_simple_pupil_size
+        )
+        com.router.register(
+            "eye_settings.skins.neon.fg_color_start", self.rx_eye_neon_color_start
+        )
+        com.router.register(
+            "eye_settings.skins.neon.fg_color_end", self.rx_eye_neon_color_end
+        )
+        com.router.register("eye_settings.display.backlight", self.rx_eye_backlight)
+        com.router.register("eye.set_backlight", self.rx_eye_backlight)
+        com.router.register("eye_settings.motions.speed", self.rx_eye_speed)
+        com.router.register("eye.set_speed", self.rx_eye_speed)
+        com.router.register("eye_settings.states.motion", self.rx_eye_motion)
+        com.router.register("eye.set_motion", self.rx_eye_motion)
+        com.watchdog.add_listener(self.link_state_changed)
+
+    def rx_handshake_end(self, msg: com.Message):
+        # may arrive before the window global is set
+        if msg.value == remote_name:
+            get_updater().call_latest(self.widget.setCurrentIndex, 1)
+
+    def rx_bms_voltages(self, msg: com.Message):
+        if window is not None:
+            bms = msg.record
+            if bms != self.last_telemetry.get(msg.key):
+                window.view.set(
+                    window.batt_volt1.setText,
+                    strings.BATT_VOLT1.format(bms.volt1) + "V",
+                )
+                window.view.set(
+                    window.battery1_label.setText,
+                    strings.BATT_VOLT1.format(bms.volt1),
+                )
+                if ENABLE_BATT2:
+                    window.view.set(
+                        window.batt_volt2.setText,
+                        strings.BATT_VOLT2.format(bms.volt2) + "V",
                     )
-                    get_updater().call_latest(
-                        window.right_temp.setText,
-                        strings.RIGHT_TEMP.format(
-                            rstr(data[1].split(",")[1])
-                            + "℃ ("
-                            + rstr(convert_c_to_f(float(data[1].split(",")[1])))
-                            + "℉)"
-                        ),
+                    window.view.set(
+                        window.battery2_label.setText,
+                        strings.BATT_VOLT2.format(bms.volt2),
                     )
+            self.last_telemetry[msg.key] = bms
 
-                    get_updater().call_latest(
-                        window.robot_temp.setText,
-                        strings.INSIDE_TEMP.format(
-                            rstr(data[1].split(",")[2])
-                            + "℃ ("
-                            + rstr(convert_c_to_f(float(data[1].split(",")[2])))
-                            + "℉)"
-                        ),
-                    )
+    # bme280 sensor
+    def rx_bme(self, msg: com.Message):
+        if window is not None:
+            bme = msg.record
+            if bme == self.last_telemetry.get(msg.key):
+                return
+            self.last_telemetry[msg.key] = bme
 
-                    if float(data[1].split(",")[0]) > HIGH_MOTOR_TEMP:
-                        get_updater().call_latest(
-                            window.left_temp.setStyleSheet, "background-color: #df574d;"
-                        )
-                        get_updater().call_latest(window.motor_stick.setDisabled, True)
-                        if not disable_temp_modal:
-                            com.txmot([1500, 1500])
-                            get_updater().call_latest(
-                                window.motTempModalText.setText, strings.MOT_TEMP_HIGH
-                            )
-                            get_updater().call_latest(window.motTemp_modal.show)
-                    else:
-                        get_updater().call_latest(window.left_temp.setStyleSheet, "")
-
-                    if float(data[1].split(",")[1]) > HIGH_MOTOR_TEMP:
-                        get_updater().call_latest(
-                            window.right_temp.setStyleSheet,
-                            "background-color: #df574d;",
-                        )
-                        get_updater().call_latest(window.motor_stick.setDisabled, True)
-                        if not disable_temp_modal:
-                            com.txmot([1500, 1500])
-                            get_updater().call_latest(
-                                window.motTempModalText.setText, strings.MOT_TEMP_HIGH
-                            )
-                            get_updater().call_latest(window.motTemp_modal.show)
-                    else:
-                        get_updater().call_latest(window.right_temp.setStyleSheet, "")
-
-                    if float(data[1].split(",")[2]) > HIGH_INSIDE_TEMP:
-                        get_updater().call_latest(
-                            window.robot_temp.setStyleSheet,
-                            "background-color: #df574d;",
-                        )
-                    else:
-                        get_updater().call_latest(window.robot_temp.setStyleSheet, "")
-            # yaw, pitch, roll
-            elif data[0] == "imu":
-                roll, pitch, yaw = data[1].split(",")
-                if window is not None:
-                    get_updater().call_latest(
-                        window.level.setAngles, (float(roll), float(pitch), float(yaw))
-                    )
-                    if abs(float(roll)) > 18:
-                        get_updater().call_latest(
-                            window.level.setLineColor, QColor("#df574d")
-                        )
-                    elif abs(float(roll)) > 10:
-                        get_updater().call_latest(
-                            window.level.setLineColor, QColor("#eebc2a")
-                        )
-                    else:
-                        get_updater().call_latest(window.level.setLineColor, Qt.white)
-            # core alive message
-            elif data[0] == "core.uptime":
-                if window:
-                    delta = datetime.timedelta(seconds=int(data[1]))
-                    get_updater().call_latest(
-                        self.debug_uptime.setText,
-                        strings.CORE_UPTIME.format(delta, data[1] + "s"),
-                    )
-            # sys uptime
-            elif data[0] == "os_uptime":
-                if window:
-                    delta = datetime.timedelta(seconds=int(data[1]))
-                    get_updater().call_latest(
-                        self.debug_sys_uptime.setText,
-                        strings.SYS_UPTIME.format(delta, data[1] + "s"),
-                    )
-            # remote disable
-            elif data[0] == "remote.disableui":
-                if str(data[1]).lower() == "true":
-                    get_updater().call_latest(window.arm_group.setDisabled, True)
-                    get_updater().call_latest(window.led_group.setDisabled, True)
-                    get_updater().call_latest(window.main_group.setDisabled, True)
-
-                    if settings["window_properties"]["ui_style"] == "modern":
-                        get_updater().call_latest(
-                            window.bottom_base_led_button.setDisabled, True
-                        )
-                        get_updater().call_latest(
-                            window.bottom_body_led_button.setDisabled, True
-                        )
-                        get_updater().call_latest(
-                            window.bottom_head_led_button.setDisabled, True
-                        )
-                        get_updater().call_latest(
-                            window.bottom_eye_button.setDisabled, True
-                        )
+            window.view.set(
+                window.outside_temp.setText,
+                strings.OUTSIDE_TEMP.format(
+                    rstr(bme.temp_c) + "℃ (" + rstr(bme.temp_f) + "℉)"
+                ),
+            )
+            window.view.set(
+                window.outside_humi.setText,
+                strings.OUTSIDE_HUMI.format(rstr(bme.humidity)),
+            )
+            window.view.set(
+                window.outside_hpa.setText,
+                strings.OUTSIDE_PRES.format(rstr(bme.pressure)),
+            )
 
-                else:
-                    get_updater().call_latest(window.arm_group.setDisabled, False)
-                    get_updater().call_latest(window.led_group.setDisabled, False)
-                    get_updater().call_latest(window.main_group.setDisabled, False)
-
-                    if settings["window_properties"]["ui_style"] == "modern":
-                        get_updater().call_latest(
-                            window.bottom_base_led_button.setDisabled, False
-                        )
-                        get_updater().call_latest(
-                            window.bottom_body_led_button.setDisabled, False
-                        )
-                        get_updater().call_latest(
-                            window.bottom_head_led_button.setDisabled, False
-                        )
-                        get_updater().call_latest(
-                            window.bottom_eye_button.setDisabled, False
-                        )
-            # old remote enable
-            elif data[0] == "core.enabled":
-                while not window:
-                    time.sleep(0.02)
-
-                get_updater().call_latest(window.set_enabled, data[1].lower() == "true")
-            elif data[0] == "core.enablefailed":
-                get_updater().call_latest(window.show_enabled_fail, int(data[1]))
-            elif data[0] == "core.speech-engine":
-                while not window:
-                    time.sleep(0.02)
-
-                if data[1] == "festival":
-                    get_updater().call_latest(window.festival_radio.blockSignals, True)
-                    get_updater().call_latest(window.festival_radio.setChecked, True)
-                    get_updater().call_latest(window.festival_radio.blockSignals, False)
-                else:
-                    get_updater().call_latest(window.espeak_radio.blockSignals, True)
-                    get_updater().call_latest(window.espeak_radio.setChecked, True)
-                    get_updater().call_latest(window.espeak_radio.blockSignals, False)
-            elif data == ["core.service.init", "kevinbot.com"]:
-                get_updater().call_latest(window.pop_com_service_modal)
-                try:
-                    remote_version = open("version.txt", "r").read()
-                except FileNotFoundError:
-                    remote_version = "UNKNOWN"
-                com.txcv(
-                    "core.remotes.add",
-                    f"{remote_name}|{remote_version}|kevinbot.remote",
+    # motor, body temps
+    def rx_temps(self, msg: com.Message):
+        if window is not None:
+            temps = msg.record
+            if temps != self.last_telemetry.get(msg.key):
+                window.view.set(
+                    window.left_temp.setText,
+                    strings.LEFT_TEMP.format(
+                        rstr(temps.left)
+                        + "℃ ("
+                        + rstr(convert_c_to_f(temps.left))
+                        + "℉)"
+                    ),
+                )
+                window.view.set(
+                    window.right_temp.setText,
+                    strings.RIGHT_TEMP.format(
+                        rstr(temps.right)
+                        + "℃ ("
+                        + rstr(convert_c_to_f(temps.right))
+                        + "℉)"
+                    ),
                 )
-            elif data[0].startswith("core.full_mesh"):
-                cmd_part = data[0].split(":")[1]
-                cmd_parts = data[0].split(":")[2]
+                window.view.set(
+                    window.robot_temp.setText,
+                    strings.INSIDE_TEMP.format(
+                        rstr(temps.inside)
+                        + "℃ ("
+                        + rstr(convert_c_to_f(temps.inside))
+                        + "℉)"
+                    ),
+                )
+            self.last_telemetry[msg.key] = temps
 
-                self.full_mesh.insert(int(cmd_part), data[1])
+    # yaw, pitch, roll
+    @staticmethod
+    def rx_imu(msg: com.Message):
+        imu = msg.record
+        if window is not None:
+            # every sample goes into the graph, it redraws on its own timer
+            window.level.setAngles((imu.roll, imu.pitch, imu.yaw))
+
+    # core alive message
+    def rx_core_uptime(self, msg: com.Message):
+        if window:
+            uptime = msg.record
+            self.view.set(
+                self.debug_uptime.setText,
+                strings.CORE_UPTIME.format(
+                    datetime.timedelta(seconds=uptime.seconds), f"{uptime.seconds}s"
+                ),
+            )
 
-                if int(cmd_parts) == int(cmd_part):
-                    get_updater().call_latest(
-                        window.add_mesh_devices, "".join(self.full_mesh)
-                    )
-                    self.full_mesh = []
-            elif data[0] == "core.ping":
-                src_dest = data[1].split(",", maxsplit=1)
-                get_updater().call_latest(window.ping, src_dest[0])
-            elif data[0] == "eye_settings.states.page":
-                if window:
-                    get_updater().call_latest(
-                        self.eye_config_stack.setCurrentIndex, int(data[1]) - 3
-                    )
-            elif data[0] == "eye_settings.skins.simple.iris_size":
-                if window:
-                    get_updater().call_latest(
-                        self.eye_simple_iris_size_slider.blockSignals, True
-                    )
-                    get_updater().call_latest(
-                        self.eye_simple_iris_size_slider.setValue, int(data[1])
-                    )
-                    get_updater().call_latest(
-                        self.eye_simple_iris_size_slider.blockSignals, False
-                    )
-            elif data[0] == "eye_settings.skins.simple.pupil_size":
-                if window:
-                    get_updater().call_latest(
-                        self.eye_simple_pupil_size_slider.blockSignals, True
-                    )
-                    get_updater().call_latest(
-                        self.eye_simple_pupil_size_slider.setValue, int(data[1])
-                    )
-                    get_updater().call_latest(
-                        self.eye_simple_pupil_size_slider.blockSignals, False
-                    )
-            elif data[0] == "eye_settings.skins.neon.fg_color_start":
-                if window:
-                    self.eye_neon_left_color = data[1].strip('"')
-            elif data[0] == "eye_settings.skins.neon.fg_color_end":
-                if window:
-                    self.eye_neon_right_color = data[1].strip('"')
-            elif (
-                data[0] == "eye_settings.display.backlight"
-                or data[0] == "eye.set_backlight"
-            ):
-                if window:
-                    get_updater().call_latest(
-                        self.eye_config_light_slider.blockSignals, True
-                    )
-                    get_updater().call_latest(
-                        self.eye_config_light_slider.setValue, int(data[1])
-                    )
-                    get_updater().call_latest(
-                        self.eye_config_light_slider.blockSignals, False
-                    )
-            elif data[0] == "eye_settings.motions.speed" or data[0] == "eye.set_speed":
-                if window:
-                    get_updater().call_latest(
-                        self.eye_config_speed_slider.setValue, int(data[1])
-                    )
-            elif data[0] == "eye_settings.states.motion" or data[0] == "eye.set_motion":
-                if window:
-                    if data[1] == "3":
-                        get_updater().call_latest(
-                            self.eye_joystick_group.setEnabled, True
-                        )
-                        get_updater().call_latest(
-                            self.eye_joystick.setColor, self.fg_color
-                        )
-                    else:
-                        get_updater().call_latest(
-                            self.eye_joystick_group.setEnabled, False
-                        )
-                        get_updater().call_latest(
-                            self.eye_joystick.setColor, QColor("#9E9E9E")
-                        )
-
-        except Exception:
-            traceback.print_exc()
+    # sys uptime
+    def rx_os_uptime(self, msg: com.Message):
+        if window:
+            uptime = msg.record
+            self.view.set(
+                self.debug_sys_uptime.setText,
+                strings.SYS_UPTIME.format(
+                    datetime.timedelta(seconds=uptime.seconds), f"{uptime.seconds}s"
+                ),
+            )
+
+    # remote disable
+    @staticmethod
+    def rx_remote_disableui(msg: com.Message):
+        disable = msg.value.lower() == "true"
+        window.view.set(window.arm_group.setDisabled, disable)
+        window.view.set(window.led_group.setDisabled, disable)
+        window.view.set(window.main_group.setDisabled, disable)
+
+        if settings["window_properties"]["ui_style"] == "modern":
+            # set_enabled changes these too, always apply
+            window.view.call(window.bottom_base_led_button.setDisabled, disable)
+            window.view.call(window.bottom_body_led_button.setDisabled, disable)
+            window.view.call(window.bottom_head_led_button.setDisabled, disable)
+            window.view.call(window.bottom_eye_button.setDisabled, disable)
+
+    # old remote enable
+    @staticmethod
+    def rx_core_enabled(msg: com.Message):
+        while not window:
+            time.sleep(0.02)
+
+        get_updater().call_latest(window.set_enabled, msg.value.lower() == "true")
+
+    @staticmethod
+    def rx_core_enablefailed(msg: com.Message):
+        get_updater().call_latest(window.show_enabled_fail, int(msg.value))
+
+    @staticmethod
+    def rx_core_speech_engine(msg: com.Message):
+        com.send_cache.record("core.speech-engine", msg.value)
+        while not window:
+            time.sleep(0.02)
+
+        if msg.value == "festival":
+            get_updater().call_latest(window.festival_radio.blockSignals, True)
+            get_updater().call_latest(window.festival_radio.setChecked, True)
+            get_updater().call_latest(window.festival_radio.blockSignals, False)
+        else:
+            get_updater().call_latest(window.espeak_radio.blockSignals, True)
+            get_updater().call_latest(window.espeak_radio.setChecked, True)
+            get_updater().call_latest(window.espeak_radio.blockSignals, False)
+
+    @staticmethod
+    def rx_core_service_init(msg: com.Message):
+        if msg.value != "kevinbot.com":
+            return
+
+        # the robot lost its state, the next value of every key has to go out
+        com.send_cache.forget()
+        get_updater().call_latest(window.pop_com_service_modal)
+        try:
+            remote_version = open("version.txt", "r").read()
+        except FileNotFoundError:
+            remote_version = "UNKNOWN"
+        com.txcv(
+            "core.remotes.add",
+            f"{remote_name}|{remote_version}|kevinbot.remote",
+        )
+
+    def rx_core_full_mesh(self, msg: com.Message):
+        # core.full_mesh:<part>:<last part>, in any order. Parts are numbered
+        # from 0 or 1, a part 0 (or a last part 0) means 0. They're buffered
+        # as numbered, 0 to last, counting from 1 the empty part 0 is filled
+        # in once everything else is there.
+        _, cmd_part, cmd_parts = msg.key.split(":")
+        part, last = int(cmd_part), int(cmd_parts)
+        if part == 0 or last == 0:
+            self.full_mesh_base = 0
+        self.full_mesh_count = last + 1
+
+        mesh = self.full_mesh.add("core.full_mesh", part, last + 1, msg.value)
+        if mesh is None and self.full_mesh.missing("core.full_mesh") == {0}:
+            if self.full_mesh_base == 1:
+                mesh = self.full_mesh.add("core.full_mesh", 0, last + 1, "")
+            elif self.full_mesh_base is None:
+                # part 0 may still be on its way
+                get_updater().call_latest(self.full_mesh_timer.start)
+        if mesh is not None:
+            get_updater().call_latest(window.add_mesh_devices, mesh)
+
+    def full_mesh_timeout(self):
+        # everything but part 0 arrived and it never came, parts count from 1
+        if self.full_mesh.missing("core.full_mesh") != {0}:
+            return
+        self.full_mesh_base = 1
+        mesh = self.full_mesh.add("core.full_mesh", 0, self.full_mesh_count, "")
+        if mesh is not None:
+            self.add_mesh_devices(mesh)
+
+    @staticmethod
+    def rx_core_ping(msg: com.Message):
+        src_dest = msg.value.split(",", maxsplit=1)
+        get_updater().call_latest(window.ping, src_dest[0])
+
+    def rx_eye_page(self, msg: com.Message):
+        if window:
+            get_updater().call_latest(
+                self.eye_config_stack.setCurrentIndex, int(msg.value) - 3
+            )
+
+    def rx_eye_simple_iris_size(self, msg: com.Message):
+        if window:
+            get_updater().call_latest(
+                self.eye_simple_iris_size_slider.blockSignals, True
+            )
+            get_updater().call_latest(
+                self.eye_simple_iris_size_slider.setValue, int(msg.value)
+            )
+            get_updater().call_latest(
+                self.eye_simple_iris_size_slider.blockSignals, False
+            )
+
+    def rx_eye_simple_pupil_size(self, msg: com.Message):
+        if window:
+            get_updater().call_latest(
+                self.eye_simple_pupil_size_slider.blockSignals, True
+            )
+            get_updater().call_latest(
+                self.eye_simple_pupil_size_slider.setValue, int(msg.value)
+            )
+            get_updater().call_latest(
+                self.eye_simple_pupil_size_slider.blockSignals, False
+            )
+
+    def rx_eye_neon_color_start(self, msg: com.Message):
+        if window:
+            self.eye_neon_left_color = msg.value.strip('"')
+
+    def rx_eye_neon_color_end(self, msg: com.Message):
+        if window:
+            self.eye_neon_right_color = msg.value.strip('"')
+
+    def rx_eye_backlight(self, msg: com.Message):
+        com.send_cache.record("eye.set_backlight", msg.value)
+        if window:
+            get_updater().call_latest(self.eye_config_light_slider.blockSignals, True)
+            get_updater().call_latest(
+                self.eye_config_light_slider.setValue, int(msg.value)
+            )
+            get_updater().call_latest(self.eye_config_light_slider.blockSignals, False)
+
+    def rx_eye_speed(self, msg: com.Message):
+        com.send_cache.record("eye.set_speed", msg.value)
+        if window:
+            get_updater().call_latest(
+                self.eye_config_speed_slider.setValue, int(msg.value)
+            )
+
+    def rx_eye_motion(self, msg: com.Message):
+        com.send_cache.record("eye.set_motion", msg.value)
+        if window:
+            if msg.value == "3":
+                get_updater().call_latest(self.eye_joystick_group.setEnabled, True)
+                get_updater().call_latest(self.eye_joystick.setColor, self.fg_color)
+            else:
+                get_updater().call_latest(self.eye_joystick_group.setEnabled, False)
+                get_updater().call_latest(
+                    self.eye_joystick.setColor, QColor("#9E9E9E")
+                )
 
     # noinspection PyUnresolvedReferences
     def init_ui(self):
@@ -1814,6 +1797,39 @@ class RemoteUI(KBMainWindow):
         self.debug_sys_uptime.setIcon(qta.icon("mdi.timer", color="#F44336"))
         self.debug_scroll_layout.addWidget(self.debug_sys_uptime)
 
+        self.debug_connection = KBDebugDataEntry()
+        self.debug_connection.setText(strings.CONNECTION.format(strings.UNKNOWN))
+        self.debug_connection.setIcon(qta.icon("mdi.lan-pending", color="#FF9800"))
+        self.debug_scroll_layout.addWidget(self.debug_connection)
+
+        self.debug_serial = KBDebugDataEntry()
+        self.debug_serial.setText(
+            strings.SERIAL_LINK.format(com.supervisor.state.value.capitalize())
+        )
+        self.debug_serial.setIcon(qta.icon("mdi.serial-port", color="#9C27B0"))
+        self.debug_scroll_layout.addWidget(self.debug_serial)
+
+        self.debug_link = KBDebugDataEntry()
+        self.debug_link.setIcon(qta.icon("mdi.access-point-network", color="#4CAF50"))
+        self.debug_scroll_layout.addWidget(self.debug_link)
+        self.update_link_status()
+
+        self.debug_view = KBDebugDataEntry()
+        self.debug_view.setIcon(qta.icon("mdi.monitor-dashboard", color="#3F51B5"))
+        self.debug_scroll_layout.addWidget(self.debug_view)
+        self.update_view_status()
+
+        self.debug_alarms = KBDebugDataEntry()
+        self.debug_alarms.setText(strings.ALARMS.format(strings.NONE))
+        self.debug_alarms.setIcon(qta.icon("mdi.alarm-light", color="#FFC107"))
+        self.debug_scroll_layout.addWidget(self.debug_alarms)
+
+        # link stats are polled on the gui thread, nothing is pushed from the rx thread
+        self.link_status_timer = QTimer(self)
+        self.link_status_timer.timeout.connect(self.update_link_status)
+        self.link_status_timer.timeout.connect(self.update_view_status)
+        self.link_status_timer.start(1000)
+
         # Page Flip 1
         self.page_flip_layout_1 = QHBoxLayout()
         self.layout.addLayout(self.page_flip_layout_1)
@@ -2011,8 +2027,10 @@ class RemoteUI(KBMainWindow):
             self.bottom_eye_button.setEnabled(False)
 
     def closeEvent(self, event):
-        if com.ser:
-            com.xb.halt()
+        self.view.stop()
+        logger.debug(f"View model stats: {self.view.stats()}")
+        logger.debug(f"Alarm stats: {self.alarms.stats()}")
+        com.halt()
 
         event.accept()
 
@@ -2214,7 +2232,7 @@ class RemoteUI(KBMainWindow):
     @staticmethod
     def arm_action(index):
         global CURRENT_ARM_POS
-        com.txcv("arms", settings["arm_prog"][index])
+        com.txcv("arms", settings["arm_prog"][index], confirm=True)
         CURRENT_ARM_POS = settings["arm_prog"][index]
 
     def led_action(self, index):
@@ -2262,7 +2280,7 @@ class RemoteUI(KBMainWindow):
 
     def arm_preset_action(self, index):
         global CURRENT_ARM_POS
-        com.txcv("arms", settings["arm_prog"][index])
+        com.txcv("arms", settings["arm_prog"][index], confirm=True)
         CURRENT_ARM_POS = settings["arm_prog"][index]
 
         # suppress events on knobs
@@ -2497,33 +2515,36 @@ class RemoteUI(KBMainWindow):
     def eye_set_neon_style(value):
         com.txstr(f"eye.set_skin_option=neon:style:{value}")
 
+    def eye_neon_tx_colors(self):
+        com.txbatch(
+            [
+                f"eye.set_skin_option=neon:fg_color_start:{self.eye_neon_left_color}",
+                f"eye.set_skin_option=neon:fg_color_end:{self.eye_neon_right_color}",
+            ]
+        )
+
     def eye_neon_left_changed(self, value):
         self.eye_neon_left_color = value
-        com.txstr(f"eye.set_skin_option=neon:fg_color_start:{self.eye_neon_left_color}")
-        com.txstr(f"eye.set_skin_option=neon:fg_color_end:{self.eye_neon_right_color}")
+        self.eye_neon_tx_colors()
 
     def eye_neon_right_changed(self, value):
         self.eye_neon_right_color = value
-        com.txstr(f"eye.set_skin_option=neon:fg_color_start:{self.eye_neon_left_color}")
-        com.txstr(f"eye.set_skin_option=neon:fg_color_end:{self.eye_neon_right_color}")
+        self.eye_neon_tx_colors()
 
     def eye_neon_swap_colors(self):
         self.eye_neon_left_color, self.eye_neon_right_color = (
             self.eye_neon_right_color,
             self.eye_neon_left_color,
         )
-        com.txstr(f"eye.set_skin_option=neon:fg_color_start:{self.eye_neon_left_color}")
-        com.txstr(f"eye.set_skin_option=neon:fg_color_end:{self.eye_neon_right_color}")
+        self.eye_neon_tx_colors()
 
     def eye_neon_copy_ltr(self):
         self.eye_neon_right_color = self.eye_neon_left_color
-        com.txstr(f"eye.set_skin_option=neon:fg_color_start:{self.eye_neon_left_color}")
-        com.txstr(f"eye.set_skin_option=neon:fg_color_end:{self.eye_neon_right_color}")
+        self.eye_neon_tx_colors()
 
     def eye_neon_copy_rtl(self):
         self.eye_neon_left_color = self.eye_neon_right_color
-        com.txstr(f"eye.set_skin_option=neon:fg_color_start:{self.eye_neon_left_color}")
-        com.txstr(f"eye.set_skin_option=neon:fg_color_end:{self.eye_neon_right_color}")
+        self.eye_neon_tx_colors()
 
     @staticmethod
     def eye_config_neon_bg_selected(value):
@@ -2554,7 +2575,7 @@ class RemoteUI(KBMainWindow):
             distance = round(math.dist((0, 0), (x, y)))
 
             if direction == "N":
-                com.txmot(
+                com.txdrive(
                     (
                         map_range(
                             distance,
@@ -2573,7 +2594,7 @@ class RemoteUI(KBMainWindow):
                     )
                 )
             elif direction == "S":
-                com.txmot(
+                com.txdrive(
                     (
                         map_range(
                             distance,
@@ -2592,7 +2613,7 @@ class RemoteUI(KBMainWindow):
                     )
                 )
             elif direction == "W":
-                com.txmot(
+                com.txdrive(
                     (
                         map_range(
                             distance,
@@ -2611,7 +2632,7 @@ class RemoteUI(KBMainWindow):
                     )
                 )
             elif direction == "E":
-                com.txmot(
+                com.txdrive(
                     (
                         map_range(
                             distance,
@@ -2635,7 +2656,7 @@ class RemoteUI(KBMainWindow):
             # get values
             x, y = self.motor_stick.getXY()
             if x == 0 and y == 0:
-                com.txmot((1500, 1500))
+                com.txdrive((1500, 1500))
                 return
 
             x, y = (
@@ -2662,7 +2683,7 @@ class RemoteUI(KBMainWindow):
             left = map_range_limit(left, -1, 1, 1000 + us_change, 2000 - us_change)
             right = map_range_limit(right, -1, 1, 1000 + us_change, 2000 - us_change)
 
-            com.txmot((int(right), int(left)))
+            com.txdrive((int(right), int(left)))
 
     def show_enabled_fail(self, ena: int):
         def close_modal():
@@ -2736,7 +2757,7 @@ class RemoteUI(KBMainWindow):
             self.arm_preset8.setEnabled(enabled)
             self.arm_preset9.setEnabled(enabled)
 
-            self.motor_stick.setEnabled(enabled)
+            self.update_motor_stick()
             self.head_stick.setEnabled(enabled)
 
             self.head_led.setEnabled(enabled)
@@ -2751,10 +2772,17 @@ class RemoteUI(KBMainWindow):
                 self.bottom_head_led_button.setEnabled(enabled)
                 self.bottom_eye_button.setEnabled(enabled)
 
+    def update_motor_stick(self):
+        # driving needs the robot enabled, a live link and no alarm stopping it
+        self.motor_stick.setEnabled(
+            enabled
+            and com.watchdog.state is not com.LinkState.LOST
+            and not self.alarms.active("stop_motors")
+        )
 
     @staticmethod
     def request_enabled(ena: bool):
-        com.txcv("request.enabled", str(ena))
+        com.txcv("request.enabled", str(ena), confirm=True)
 
     def e_stop_action(self):
         """EMERGENCY STOP CODE"""
@@ -2817,6 +2845,233 @@ class RemoteUI(KBMainWindow):
                 )
             self.devices_layout.addWidget(objects[count])
 
+    def robot_initialized(self, delivered: bool, elapsed: float):
+        get_updater().call_latest(self.show_robot_initialized, delivered, elapsed)
+
+    def show_robot_initialized(self, delivered: bool, elapsed: float):
+        def close_modal():
+            # close this modal, move other modals
+            modal_bar.closeToast()
+            self.modal_count -= 1
+
+            self.modals.remove(modal_bar)
+
+            for modal in self.modals:
+                modal.changeIndex(modal.getIndex() - 1, moveSpeed=600)
+
+        if self.modal_count < 6:
+            modal_bar = KBModalBar(self)
+            self.modals.append(modal_bar)
+            self.modal_count += 1
+            if delivered:
+                modal_bar.setTitle(strings.ROBOT_READY)
+                modal_bar.setDescription(
+                    strings.ROBOT_READY_DESC.format(round(elapsed * 1000))
+                )
+            else:
+                modal_bar.setTitle(strings.ROBOT_INIT_FAILED)
+                modal_bar.setDescription(strings.ROBOT_INIT_FAILED_DESC)
+            modal_bar.setPixmap(
+                qta.icon(
+                    "mdi.robot" if delivered else "mdi.robot-dead",
+                    color=self.fg_color if delivered else "#F44336",
+                ).pixmap(36)
+            )
+
+            modal_bar.popToast(pop_speed=500, pos_index=self.modal_count)
+
+            modal_timeout = QTimer()
+            modal_timeout.singleShot(1500 if delivered else 4000, close_modal)
+
+    def link_state_changed(self, state: com.LinkState):
+        # called from the watchdog or rx thread, the robot is already stopped
+        get_updater().call_latest(self.show_link_state, state)
+
+    def show_link_state(self, state: com.LinkState):
+        def close_modal():
+            # close this modal, move other modals
+            modal_bar.closeToast()
+            self.modal_count -= 1
+
+            self.modals.remove(modal_bar)
+
+            for modal in self.modals:
+                modal.changeIndex(modal.getIndex() - 1, moveSpeed=600)
+
+        lost = state is com.LinkState.LOST
+        self.update_motor_stick()
+
+        self.debug_connection.setText(
+            strings.CONNECTION.format(state.value.capitalize())
+        )
+        self.debug_connection.setIcon(
+            qta.icon("mdi.lan-disconnect", color="#F44336")
+            if lost
+            else qta.icon("mdi.lan-connect", color="#4CAF50")
+        )
+
+        # the first frame after startup isn't worth a toast
+        if (lost or com.watchdog.trips) and self.modal_count < 6:
+            modal_bar = KBModalBar(self)
+            self.modals.append(modal_bar)
+            self.modal_count += 1
+            modal_bar.setTitle(strings.LINK_LOST if lost else strings.LINK_REGAINED)
+            modal_bar.setDescription(
+                strings.LINK_LOST_DESC if lost else strings.LINK_REGAINED_DESC
+            )
+            modal_bar.setPixmap(
+                qta.icon(
+                    "mdi.lan-disconnect" if lost else "mdi.lan-connect",
+                    color="#F44336" if lost else self.fg_color,
+                ).pixmap(36)
+            )
+
+            modal_bar.popToast(pop_speed=500, pos_index=self.modal_count)
+
+            modal_timeout = QTimer()
+            modal_timeout.singleShot(4000 if lost else 1500, close_modal)
+
+    def show_serial_state(self, state: str):
+        def close_modal():
+            # close this modal, move other modals
+            modal_bar.closeToast()
+            self.modal_count -= 1
+
+            self.modals.remove(modal_bar)
+
+            for modal in self.modals:
+                modal.changeIndex(modal.getIndex() - 1, moveSpeed=600)
+
+        self.debug_serial.setText(strings.SERIAL_LINK.format(state.capitalize()))
+
+        title, description, icon, color = {
+            "reconnecting": (
+                strings.SERIAL_RECONNECTING,
+                strings.SERIAL_RECONNECTING_DESC,
+                "mdi.lan-pending",
+                "#FF9800",
+            ),
+            "offline": (
+                strings.SERIAL_OFFLINE,
+                strings.SERIAL_OFFLINE_DESC,
+                "mdi.lan-disconnect",
+                "#F44336",
+            ),
+            "connected": (
+                strings.SERIAL_CONNECTED,
+                strings.SERIAL_CONNECTED_DESC,
+                "mdi.lan-connect",
+                self.fg_color,
+            ),
+        }[state]
+
+        # nothing to report for the first connect
+        if state == "connected" and not com.supervisor.reconnects:
+            return
+
+        if self.modal_count < 6:
+            modal_bar = KBModalBar(self)
+            self.modals.append(modal_bar)
+            self.modal_count += 1
+            modal_bar.setTitle(title)
+            modal_bar.setDescription(description)
+            modal_bar.setPixmap(qta.icon(icon, color=color).pixmap(36))
+
+            modal_bar.popToast(pop_speed=500, pos_index=self.modal_count)
+
+            modal_timeout = QTimer()
+            modal_timeout.singleShot(
+                1500 if state == "connected" else 4000, close_modal
+            )
+
+    def update_link_status(self):
+        link = com.link.snapshot()
+        jitter = max(link["jitter"].values(), default=None)
+        self.debug_link.setText(
+            strings.LINK_STATUS.format(
+                strings.UNKNOWN if link["rtt"] is None else f"{link['rtt'] * 1000:.1f}",
+                round(link["loss"] * 100),
+                round(link["frames_in"]),
+                round(link["bytes_in"]),
+                strings.UNKNOWN if jitter is None else f"{jitter * 1000:.1f}",
+            )
+        )
+
+    def init_alarms(self):
+        self.alarms.add_action("stop_motors", self.alarm_stop_motors)
+        self.alarms.add_action("disable", self.alarm_disable)
+        self.alarms.add_action("modal", self.alarm_modal)
+        self.alarms.add_action("style", self.alarm_style)
+        self.alarms.add_listener(self.alarm_changed)
+        # evaluated from now on, the actions need the widgets
+        for key in self.alarms.keys():
+            com.router.register(key, self.alarms.on_message)
+
+    # alarm actions run on the rx thread, once per raise or clear, com calls
+    # are fine there, anything touching widgets goes through the view
+    @staticmethod
+    def alarm_dismissed(alarm: alarms.Alarm) -> bool:
+        # the user closed this alarm's modal for good, its actions are off too
+        return (alarm.has_action("modal", "battery") and disable_batt_modal) or (
+            alarm.has_action("modal", "motor_temp") and disable_temp_modal
+        )
+
+    def alarm_stop_motors(self, alarm: alarms.Alarm, active: bool, _):
+        if active and not self.alarm_dismissed(alarm):
+            com.txstop()
+        self.view.call(self.update_motor_stick)
+
+    def alarm_disable(self, alarm: alarms.Alarm, active: bool, _):
+        if active and enabled and not self.alarm_dismissed(alarm):
+            self.view.call(self.request_enabled, False)
+
+    def alarm_modal(self, alarm: alarms.Alarm, active: bool, name: str):
+        if not active or self.alarm_dismissed(alarm):
+            return
+        if name == "battery":
+            self.view.set(self.battModalText.setText, strings.BATT_LOW)
+            self.view.call(self.batt_modal.show)
+        elif name == "motor_temp":
+            self.view.set(self.motTempModalText.setText, strings.MOT_TEMP_HIGH)
+            self.view.call(self.motTemp_modal.show)
+        else:
+            logger.error(f"Unknown alarm modal {name}")
+
+    def alarm_style(self, _, __, target: str):
+        # the worst alarm still raised on the widget picks its color
+        severities = {
+            alarm.severity
+            for alarm in self.alarms.active("style")
+            if alarm.has_action("style", target)
+        }
+        color = None
+        if severities:
+            color = ALARM_COLORS[max(severities, key=alarms.SEVERITIES.index)]
+        if target == "level":
+            self.view.set(self.level.setLineColor, QColor(color) if color else Qt.white)
+        else:
+            self.view.set(
+                getattr(self, target).setStyleSheet,
+                f"background-color: {color};" if color else "",
+            )
+
+    def alarm_changed(self, _):
+        active = self.alarms.active()
+        self.view.set(
+            self.debug_alarms.setText,
+            strings.ALARMS.format(
+                ", ".join(alarm.name for alarm in active) if active else strings.NONE
+            ),
+        )
+
+    def update_view_status(self):
+        view = self.view.stats()
+        self.debug_view.setText(
+            strings.VIEW_STATUS.format(
+                view["applied"], view["coalesced"], view["unchanged"], view["frames"]
+            )
+        )
+
     def ping(self, transmitter):
         def close_modal():
             # close this modal, move other modals
@@ -2848,13 +3103,31 @@ class RemoteUI(KBMainWindow):
         com.txcv("core.ping", f"{source},{remote_name}")
 
 
-def init_robot():
-    com.txcv("arms", CURRENT_ARM_POS, delay=0.02)
-    com.txcv("core.speech-engine", "espeak", delay=0.02)
-    com.txcv("head_effect", "color1", delay=0.02)
-    com.txcv("body_effect", "color1", delay=0.02)
-    com.txcv("base_effect", "color1", delay=0.02)
-    com.txcv("cam_brightness", 0, delay=0.02)
+def init_robot(remote_version: str, callback=None):
+    # send the initial state in as few frames as possible and wait for the
+    # robot's radio to ack all of them, runs off the gui thread
+    start = time.monotonic()
+    sent = com.txbatch(
+        [
+            ("arms", CURRENT_ARM_POS),
+            ("core.speech-engine", "espeak"),
+            ("head_effect", "color1"),
+            ("body_effect", "color1"),
+            ("base_effect", "color1"),
+            ("cam_brightness", 0),
+            ("eye.get_settings", True),
+            ("core.remotes.add", f"{remote_name}|{remote_version}|kevinbot.remote"),
+        ],
+        confirm=True,
+    )
+    delivered = all([delivery.wait() for delivery in sent])
+    elapsed = time.monotonic() - start
+    if delivered:
+        logger.info(f"Robot acknowledged initial state in {elapsed * 1000:.0f} ms")
+    else:
+        logger.warning("Robot did not acknowledge initial state")
+    if callback:
+        callback(delivered, elapsed)
 
 
 if __name__ == "__main__":
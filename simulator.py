@@ -0,0 +1,336 @@
+#!/usr/bin/python
+
+"""
+Kevinbot v3 robot simulator
+Stands in for the robot's XBee on a local pseudo-terminal
+
+Run it, then start the remote with KEVINBOT_PORT set to the printed port:
+    python3 simulator.py --rate imu=50
+    KEVINBOT_PORT=/dev/pts/5 python3 remote-ui.py
+"""
+
+import argparse
+import errno
+import heapq
+import math
+import os
+import pty
+import random
+import select
+import threading
+import time
+import tty
+from typing import Callable, Optional
+
+import xbee_frames
+
+# telemetry streams and their default rates in Hz
+DEFAULT_RATES = {
+    "bms.voltages": 1,
+    "temps": 1,
+    "imu": 10,
+    "bme": 1,
+    "core.uptime": 1,
+    "os_uptime": 0.2,
+}
+
+
+class RobotSimulator:
+    """
+    Fake robot on the master side of a pty pair.
+
+    Open ``port`` (the slave side) with pyserial the same way as the real
+    XBee. Incoming tx frames are split into commands and answered like the
+    robot core would, tx frames with a frame id get a tx_status ack, AT
+    commands get an AT response and telemetry is streamed at ``rates``.
+    A ``loss`` fraction of tx frames is dropped and answered with a no ack
+    status, like a frame the robot's radio never heard. While ``muted`` the
+    robot still obeys commands but nothing it sends reaches the remote, a
+    one-way link drop: the remote's own radio keeps answering, tx frames get
+    a no ack status and AT commands their response.
+    """
+
+    def __init__(
+        self,
+        rates: Optional[dict[str, float]] = None,
+        echo: bool = False,
+        address: bytes = b"\x00\x01",
+        loss: float = 0.0,
+    ):
+        self.rates = dict(DEFAULT_RATES if rates is None else rates)
+        self.echo = echo
+        self.address = address
+        self.loss = loss
+        self.muted = False
+
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.port = os.ttyname(self.slave)
+
+        self.enabled = False
+        self.motors = (1500, 1500)
+        self.remotes: list[str] = []
+        self.started = time.monotonic()
+
+        self.frames_in = 0
+        self.frames_out = 0
+        self.frames_dropped = 0
+        self.frames_lost = 0
+        self.commands: dict[str, int] = {}
+        self.on_command: Optional[Callable[[str, str], None]] = None
+
+        self._reader = xbee_frames.FrameReader()
+        self._write_lock = threading.Lock()
+        self._running = False
+        self._threads: list[threading.Thread] = []
+
+        self._handlers = {
+            "core.remotes.add": self._remotes_add,
+            "core.remotes.remove": self._remotes_remove,
+            "core.remotes.get_full": self._remotes_get_full,
+            "request.enabled": self._request_enabled,
+            "request.estop": self._request_estop,
+            "left_motor": self._left_motor,
+            "right_motor": self._right_motor,
+            "stop": self._stop,
+            "core.ping": self._ping,
+            "link.ping": self._link_ping,
+            "eye.get_settings": self._eye_get_settings,
+        }
+
+    def start(self):
+        self._running = True
+        self.started = time.monotonic()
+        for target, name in (
+            (self._read_loop, "SimulatorReader"),
+            (self._telemetry_loop, "SimulatorTelemetry"),
+        ):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._running = False
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def close(self):
+        self.stop()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def send(self, data: str):
+        # send a key=value command to the remote
+        if self.muted:
+            self.frames_lost += 1
+            return
+        self.send_frame(xbee_frames.rx(bytes(data + "\r", "utf-8"), self.address))
+
+    def send_frame(self, frame: bytes):
+        with self._write_lock:
+            try:
+                os.write(self.master, frame)
+                self.frames_out += 1
+            except OSError as e:
+                # nobody is reading the port, drop instead of blocking
+                if e.errno not in (errno.EAGAIN, errno.EIO):
+                    raise
+                self.frames_dropped += 1
+
+    def stats(self) -> dict:
+        return {
+            "frames_in": self.frames_in,
+            "frames_out": self.frames_out,
+            "frames_dropped": self.frames_dropped,
+            "frames_lost": self.frames_lost,
+            "bad_frames": self._reader.bad_frames,
+            "commands": dict(self.commands),
+        }
+
+    def _read_loop(self):
+        while self._running:
+            ready, _, _ = select.select([self.master], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                # EIO until the slave side is opened
+                time.sleep(0.01)
+                continue
+            for frame in self._reader.feed(data):
+                self.frames_in += 1
+                self._handle_frame(frame)
+
+    def _handle_frame(self, frame: bytes):
+        api_id = frame[0]
+        if api_id in (xbee_frames.TX, xbee_frames.TX_LONG_ADDR):
+            frame_id = frame[1]
+            if self.loss and random.random() < self.loss:
+                self.frames_lost += 1
+                if frame_id:
+                    self.send_frame(xbee_frames.tx_status(frame_id, 0x01))
+                return
+            header = 5 if api_id == xbee_frames.TX else 11
+            for record in frame[header:].decode("utf-8").split("\r"):
+                if record:
+                    self._handle_command(record)
+            if frame_id:
+                # the ack from the robot's radio is lost too
+                self.send_frame(
+                    xbee_frames.tx_status(frame_id, 0x01 if self.muted else 0)
+                )
+        elif api_id == xbee_frames.AT:
+            frame_id, command = frame[1], frame[2:4]
+            self.send_frame(
+                xbee_frames.at_response(frame_id, command, 0, self._at_value(command))
+            )
+
+    def _at_value(self, command: bytes) -> bytes:
+        return {
+            b"MY": self.address,
+            b"ID": b"\x33\x32",
+            b"CH": b"\x0c",
+            b"SH": b"\x00\x13\xa2\x00",
+            b"SL": b"\x4b\x65\x76\x62",
+        }.get(command, b"")
+
+    def _handle_command(self, record: str):
+        key, _, value = record.partition("=")
+        self.commands[key] = self.commands.get(key, 0) + 1
+        if self.echo:
+            self.send(record)
+        handler = self._handlers.get(key)
+        if handler:
+            handler(value)
+        if self.on_command:
+            self.on_command(key, value)
+
+    def _remotes_add(self, value: str):
+        if value not in self.remotes:
+            self.remotes.append(value)
+        self.send(f"handshake.end={value.split('|')[0]}")
+        self.send(f"core.enabled={str(self.enabled).lower()}")
+        self.send("core.speech-engine=espeak")
+
+    def _remotes_remove(self, value: str):
+        if value in self.remotes:
+            self.remotes.remove(value)
+
+    def _remotes_get_full(self, _):
+        self.send(
+            "core.full_mesh:0:0="
+            + ",".join(self.remotes + ["KEVINBOT|v3|kevinbot.kevinbot"])
+        )
+
+    def _request_enabled(self, value: str):
+        self.enabled = value.lower() == "true"
+        self.send(f"core.enabled={str(self.enabled).lower()}")
+
+    def _request_estop(self, _):
+        self.enabled = False
+        self.motors = (1500, 1500)
+        self.send("core.enabled=false")
+
+    def _left_motor(self, value: str):
+        self.motors = (int(value), self.motors[1])
+
+    def _right_motor(self, value: str):
+        self.motors = (self.motors[0], int(value))
+
+    def _stop(self, _):
+        self.motors = (1500, 1500)
+
+    def _ping(self, value: str):
+        self.send(f"core.ping={value}")
+
+    def _link_ping(self, value: str):
+        self.send(f"link.ping={value}")
+
+    def _eye_get_settings(self, _):
+        self.send("eye_settings.states.page=3")
+        self.send("eye_settings.skins.simple.iris_size=100")
+        self.send("eye_settings.skins.simple.pupil_size=50")
+        self.send("eye_settings.display.backlight=100")
+        self.send("eye_settings.motions.speed=20")
+        self.send("eye_settings.states.motion=1")
+
+    def _telemetry(self, key: str) -> str:
+        t = time.monotonic() - self.started
+        if key == "bms.voltages":
+            # batteries sag while the motors run
+            load = abs(self.motors[0] - 1500) + abs(self.motors[1] - 1500)
+            volts = 124 - load // 100 - int(t / 60)
+            return f"{volts},{volts - 2}"
+        if key == "temps":
+            left = 25 + abs(self.motors[0] - 1500) / 50 + random.random()
+            right = 25 + abs(self.motors[1] - 1500) / 50 + random.random()
+            return f"{left:.1f},{right:.1f},{30 + random.random():.1f}"
+        if key == "imu":
+            return (
+                f"{math.sin(t) * 5:.2f},{math.cos(t / 2) * 3:.2f},{(t * 10) % 360:.2f}"
+            )
+        if key == "bme":
+            celsius = 21 + math.sin(t / 30)
+            return f"{celsius:.1f},{celsius * 9 / 5 + 32:.1f},45,1013"
+        if key in ("core.uptime", "os_uptime"):
+            return str(int(t))
+        return "0"
+
+    def _telemetry_loop(self):
+        now = time.monotonic()
+        schedule = [(now, key) for key, rate in self.rates.items() if rate > 0]
+        heapq.heapify(schedule)
+        while self._running and schedule:
+            due, key = schedule[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(min(delay, 0.05))
+                continue
+            heapq.heapreplace(schedule, (due + 1 / self.rates[key], key))
+            self.send(f"{key}={self._telemetry(key)}")
+
+
+def parse_rates(values: list[str]) -> dict[str, float]:
+    rates = dict(DEFAULT_RATES)
+    for value in values:
+        key, _, rate = value.partition("=")
+        rates[key] = float(rate)
+    return rates
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kevinbot v3 robot simulator")
+    parser.add_argument(
+        "--rate",
+        action="append",
+        default=[],
+        metavar="KEY=HZ",
+        help="telemetry rate, e.g. imu=50 (0 disables a stream)",
+    )
+    parser.add_argument("--echo", action="store_true", help="echo every command back")
+    parser.add_argument(
+        "--loss", type=float, default=0.0, help="fraction of tx frames to drop"
+    )
+    args = parser.parse_args()
+
+    simulator = RobotSimulator(parse_rates(args.rate), echo=args.echo, loss=args.loss)
+    simulator.start()
+    print(f"Simulated robot on {simulator.port}")
+    try:
+        while True:
+            time.sleep(5)
+            print(simulator.stats())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.close()
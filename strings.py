@@ -80,6 +80,23 @@ SAVE_WARN_1: Final[str] = "Please Select a Preset before saving"
 COM_REOPEN: Final[str] = "Kevinbot Services"
 COM_REOPEN_DESC: Final[str] = "Kevinbot Com Service has Started"
 
+ROBOT_READY: Final[str] = "Kevinbot Ready"
+ROBOT_READY_DESC: Final[str] = "Initial state acknowledged in {0} ms"
+ROBOT_INIT_FAILED: Final[str] = "Kevinbot Not Responding"
+ROBOT_INIT_FAILED_DESC: Final[str] = "Initial state was not acknowledged"
+
+SERIAL_RECONNECTING: Final[str] = "Reconnecting"
+SERIAL_RECONNECTING_DESC: Final[str] = "Lost the XBee, trying to reconnect"
+SERIAL_OFFLINE: Final[str] = "XBee Offline"
+SERIAL_OFFLINE_DESC: Final[str] = "Still trying, check the XBee connection"
+SERIAL_CONNECTED: Final[str] = "XBee Reconnected"
+SERIAL_CONNECTED_DESC: Final[str] = "Last settings sent to Kevinbot again"
+
+LINK_LOST: Final[str] = "Connection Lost"
+LINK_LOST_DESC: Final[str] = "No data from Kevinbot, motors stopped"
+LINK_REGAINED: Final[str] = "Connection Restored"
+LINK_REGAINED_DESC: Final[str] = "Kevinbot is responding again"
+
 ESTOP_TITLE: Final[str] = "E-Stop"
 ESTOP: Final[str] = "Kevinbot is shutting down"
 
@@ -129,6 +146,11 @@ DEBUG_TITLE: Final[str] = "Debug Data"
 
 CORE_UPTIME: Final[str] = "Core Uptime: {0} ({1})"
 SYS_UPTIME: Final[str] = "System Uptime: {0} ({1})"
+CONNECTION: Final[str] = "Connection: {0}"
+SERIAL_LINK: Final[str] = "Serial Link: {0}"
+LINK_STATUS: Final[str] = "Link: {0} ms RTT, {1}% loss, {2} frames/s in, {3} B/s in, {4} ms jitter"
+ALARMS: Final[str] = "Alarms: {0}"
+VIEW_STATUS: Final[str] = "UI Updates: {0} applied, {1} coalesced, {2} unchanged, {3} frames"
 
 # -- Settings -- #
 
@@ -203,6 +225,7 @@ PING: Final[str] = "Ping"
 KICK: Final[str] = "Kick"
 REFRESH: Final[str] = "Refresh"
 UNKNOWN: Final[str] = "Unknown"
+NONE: Final[str] = "None"
 DEV_OFF: Final[str] = "Dev Options Disabled"
 SKINS: Final[str] = "Skins"
 PROPERTIES: Final[str] = "Properties"
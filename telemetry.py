@@ -0,0 +1,280 @@
+# Telemetry message schema and codec for Kevinbot v3
+import time
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+
+class Record:
+    """
+    Base class for decoded telemetry records.
+    Subclasses are generated from SCHEMA by compile_record.
+    """
+
+    __slots__ = ()
+    key: str = ""
+
+    def astuple(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def asdict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.astuple() == other.astuple()
+
+    __hash__ = None
+
+    def __repr__(self):
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({values})"
+
+
+# key: ((field name, type, scale), ...)
+# wire values are converted with type, then divided by scale
+SCHEMA: dict[str, tuple[tuple[str, type, float], ...]] = {
+    "bms.voltages": (("volt1", float, 10), ("volt2", float, 10)),
+    "temps": (("left", float, 1), ("right", float, 1), ("inside", float, 1)),
+    "imu": (("roll", float, 1), ("pitch", float, 1), ("yaw", float, 1)),
+    "bme": (
+        ("temp_c", float, 1),
+        ("temp_f", float, 1),
+        ("humidity", float, 1),
+        ("pressure", float, 1),
+    ),
+    "core.uptime": (("seconds", int, 1),),
+    "os_uptime": (("seconds", int, 1),),
+}
+
+
+def compile_record(
+    key: str, fields: tuple[tuple[str, type, float], ...]
+) -> tuple[type, Callable[[str], Record]]:
+    """
+    Build the record class and parser for one message type.
+
+    The parser is generated source, so a frame is split once and every field
+    is converted with a single expression, the same way namedtuple builds
+    its methods.
+    """
+    names = tuple(field[0] for field in fields)
+    class_name = (
+        "".join(part.capitalize() for part in key.replace("_", ".").split("."))
+        + "Record"
+    )
+
+    namespace = {}
+    exec(
+        f"def __init__(self, {', '.join(names)}):\n"
+        + "".join(f"    self.{name} = {name}\n" for name in names),
+        namespace,
+    )
+    cls = type(
+        class_name,
+        (Record,),
+        {"__slots__": names, "key": key, "__init__": namespace["__init__"]},
+    )
+
+    namespace = {"cls": cls}
+    args = []
+    for index, (_, kind, scale) in enumerate(fields):
+        namespace[f"t{index}"] = kind
+        expr = f"t{index}(f[{index}])"
+        if scale != 1:
+            expr += f" / {scale!r}"
+        args.append(expr)
+    exec(
+        "def parse(value):\n"
+        "    f = value.split(',')\n"
+        f"    return cls({', '.join(args)})\n",
+        namespace,
+    )
+    return cls, namespace["parse"]
+
+
+class TelemetryCodec:
+    def __init__(self, schema: Optional[dict] = None):
+        self.schema = SCHEMA if schema is None else schema
+        self.records: dict[str, type] = {}
+        self._parsers: dict[str, Callable[[str], Record]] = {}
+        for key, fields in self.schema.items():
+            self.records[key], self._parsers[key] = compile_record(key, fields)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._parsers
+
+    def decode(self, key: str, value: str) -> Record:
+        # raises KeyError for unknown keys and ValueError/IndexError for bad values
+        return self._parsers[key](value)
+
+
+codec = TelemetryCodec()
+
+
+def decode(key: str, value: str) -> Record:
+    return codec.decode(key, value)
+
+
+# samples kept per channel, about 13 minutes of imu at 10 Hz
+CAPACITY = 8192
+
+
+class Channel:
+    """
+    Ring buffer of one telemetry stream, preallocated as a timestamp column
+    and one float column per record field.
+
+    One writer appends in O(1). Readers never lock: they copy, then check
+    the write count again and drop whatever the writer overwrote meanwhile.
+    Timestamps are time.monotonic() seconds.
+    """
+
+    def __init__(self, key: str, fields: tuple[str, ...], capacity: int = CAPACITY):
+        self.key = key
+        self.fields = fields
+        self.capacity = capacity
+        # one spare slot, the one the writer fills next is never read
+        self._slots = capacity + 1
+        self.times = np.zeros(self._slots)
+        self.values = np.zeros((self._slots, len(fields)))
+        # samples ever appended, the next one goes to count % slots
+        self.count = 0
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def append(self, values: tuple, t: Optional[float] = None):
+        index = self.count % self._slots
+        self.times[index] = time.monotonic() if t is None else t
+        self.values[index] = values
+        self.count += 1
+
+    def snapshot(self, last: Optional[int] = None) -> tuple[np.ndarray, np.ndarray]:
+        # copies of the newest ``last`` samples, oldest first
+        count = self.count
+        size = min(count, self.capacity if last is None else last)
+        return self._copy(count - size, count)
+
+    def latest(self) -> Optional[tuple[float, np.ndarray]]:
+        times, values = self.snapshot(1)
+        if not len(times):
+            return None
+        return times[0], values[0]
+
+    def window(
+        self, seconds: float, now: Optional[float] = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # samples from the last ``seconds``, binary searched in place
+        since = (time.monotonic() if now is None else now) - seconds
+        count = self.count
+        low, high = count - min(count, self.capacity), count
+        while low < high:
+            middle = (low + high) // 2
+            if self.times[middle % self._slots] < since:
+                low = middle + 1
+            else:
+                high = middle
+        return self._copy(low, count)
+
+    def stats(self, seconds: float) -> dict[str, dict[str, float]]:
+        _, values = self.window(seconds)
+        if not len(values):
+            return {}
+        # one contiguous row per field, reducing down columns is far slower
+        rows = values.T.copy()
+        return {
+            name: {"min": low, "max": high, "mean": mean}
+            for name, low, high, mean in zip(
+                self.fields,
+                rows.min(axis=1).tolist(),
+                rows.max(axis=1).tolist(),
+                rows.mean(axis=1).tolist(),
+            )
+        }
+
+    def decimated(self, seconds: float, points: int) -> tuple[np.ndarray, np.ndarray]:
+        # the window averaged down to at most ``points`` samples for display
+        times, values = self.window(seconds)
+        if len(times) <= points:
+            return times, values
+        edges = np.linspace(0, len(times), points + 1).astype(int)[:-1]
+        sizes = np.diff(np.append(edges, len(times)))
+        return (
+            np.add.reduceat(times, edges) / sizes,
+            np.add.reduceat(values, edges) / sizes[:, None],
+        )
+
+    def _copy(self, first: int, end: int) -> tuple[np.ndarray, np.ndarray]:
+        start, stop = first % self._slots, end % self._slots
+        if start <= stop:
+            times = self.times[start:stop].copy()
+            values = self.values[start:stop].copy()
+        else:
+            times = np.concatenate((self.times[start:], self.times[:stop]))
+            values = np.concatenate((self.values[start:], self.values[:stop]))
+        # the writer may have overwritten the oldest samples while copying
+        valid = self.count - self.capacity
+        if valid > first:
+            times, values = times[valid - first :], values[valid - first :]
+        return times, values
+
+
+class TelemetryStore:
+    """
+    One Channel per message type of the schema. Filled from the rx thread
+    by on_message, read by graphs, alarms and exports from any thread.
+    """
+
+    def __init__(self, schema: Optional[dict] = None, capacity: int = CAPACITY):
+        self.codec = codec if schema is None else TelemetryCodec(schema)
+        self.channels: dict[str, Channel] = {
+            key: Channel(key, tuple(field[0] for field in fields), capacity)
+            for key, fields in self.codec.schema.items()
+        }
+        self.bad_values = 0
+
+    def __getitem__(self, key: str) -> Channel:
+        return self.channels[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.channels
+
+    def append(self, record: Record, t: Optional[float] = None):
+        self.channels[record.key].append(record.astuple(), t)
+
+    def on_message(self, message: Any):
+        # com router handler, decodes through the message so it happens once
+        try:
+            record = message.record
+        except (KeyError, ValueError, IndexError):
+            self.bad_values += 1
+            return
+        self.channels[message.key].append(record.astuple())
+
+    def latest(self, key: str) -> Optional[Record]:
+        sample = self.channels[key].latest()
+        if sample is None:
+            return None
+        # back to the schema's types, uptimes are ints
+        return self.codec.records[key](
+            *(
+                field[1](value)
+                for field, value in zip(self.codec.schema[key], sample[1].tolist())
+            )
+        )
+
+    def window(self, key: str, seconds: float) -> tuple[np.ndarray, np.ndarray]:
+        return self.channels[key].window(seconds)
+
+    def stats(self, key: str, seconds: float) -> dict[str, dict[str, float]]:
+        return self.channels[key].stats(seconds)
+
+    def decimated(
+        self, key: str, seconds: float, points: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        return self.channels[key].decimated(seconds, points)
+
+
+store = TelemetryStore()
@@ -11,13 +11,11 @@ import qtawesome as qta
 import sys
 
 # Import xbee stuff
-from xbee.backend.base import TimeoutException as XBee_Timeout
 import com
 
 # Import Misc
 from utils import load_theme, detect_dark
 from queue import Queue
-import threading
 import strings
 import json
 
@@ -125,9 +123,7 @@ class Window(KBMainWindow):
         self.update_timer.timeout.connect(self.add_to_textbox)
         self.update_timer.start(10)
 
-        if com.ser:
-            self.serial_th = threading.Thread(target=self.target, daemon=True)
-            self.serial_th.start()
+        com.router.add_monitor(self.rx_message)
 
         if settings["dev_mode"]:
             self.createDevTools()
@@ -151,28 +147,17 @@ class Window(KBMainWindow):
     def ser_in(self, s):  # Write incoming serial data to screen
         self.display(s)
 
-    def target(self):  # Run serial reader thread
-
-        while True:
-            try:
-                data = com.xb.wait_read_frame(1)
-            except XBee_Timeout:
-                continue
-            red = '<span style=" font-size:12pt; color:#ef0000;" >'
-            val = (
-                red + "RX ⇒  " + data["rf_data"].decode("UTF-8").strip("\r") + "<span>"
+    def rx_message(self, message: com.Message):  # Runs on the xbee reader thread
+        red = '<span style=" font-size:12pt; color:#ef0000;" >'
+        if not self.hex_mode:
+            self.display(red + "RX ⇒  " + message.raw + "<span>")
+        else:
+            self.display(
+                red
+                + "RX ⇒  "
+                + " ".join("{:02x}".format(ord(c)) for c in message.raw + "\r")
+                + "<span>"
             )
-            if not self.hex_mode:
-                self.display(val)
-            else:
-                self.display(
-                    red
-                    + "RX ⇒  "
-                    + " ".join(
-                        "{:02x}".format(ord(c)) for c in data["rf_data"].decode("UTF-8")
-                    )
-                    + "<span>"
-                )
 
     def tx_data(self):
         blue = '<span style=" font-size:12pt; color:#0000ef;" >'
@@ -188,6 +173,10 @@ class Window(KBMainWindow):
                 + "<span>"
             )
 
+    def closeEvent(self, event):
+        com.halt()
+        event.accept()
+
     def enable_utf8(self):
         self.hex_mode = False
         self.textbox.clear()
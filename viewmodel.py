@@ -0,0 +1,97 @@
+# Frame batched gui updates for Kevinbot v3
+import threading
+from typing import Any, Callable, Hashable
+
+# noinspection PyUnresolvedReferences,PyPackageRequirements
+from qtpy.QtCore import QObject, QTimer
+from loguru import logger
+
+# display frames per second, rx handlers can run far more often than this
+FRAME_RATE = 30
+
+_UNSET = object()
+
+
+class ViewModel(QObject):
+    """
+    Widget state written from any thread and applied on the gui thread
+    once per display frame.
+
+    set() keeps the latest value for a setter, e.g. ``label.setText``, and
+    marks it dirty. Values overwritten before the frame are never applied,
+    neither are values equal to what the setter was last given. Only use
+    it for properties nothing else changes, the widget isn't read back.
+
+    call() queues an action for the next frame, like get_updater's
+    call_latest: it runs once with the latest arguments even if they are
+    unchanged. Everything pending is applied in the order it was first
+    written since the last frame.
+    """
+
+    def __init__(self, rate: float = FRAME_RATE, parent: QObject = None):
+        super().__init__(parent)
+        self._lock = threading.Lock()
+        # setter or func -> (is a call, args), the dirty state
+        self._pending: dict[Hashable, tuple[bool, tuple]] = {}
+        # setter -> value it was last given
+        self._applied: dict[Hashable, Any] = {}
+
+        self.writes = 0
+        self.coalesced = 0
+        self.unchanged = 0
+        self.applied = 0
+        self.frames = 0
+
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.apply)
+        self._timer.start(round(1000 / rate))
+
+    def set(self, setter: Callable[[Any], Any], value: Any):
+        with self._lock:
+            self.writes += 1
+            if setter in self._pending:
+                self.coalesced += 1
+            elif self._applied.get(setter, _UNSET) == value:
+                self.unchanged += 1
+                return
+            self._pending[setter] = (False, (value,))
+
+    def call(self, func: Callable, *args):
+        with self._lock:
+            self.writes += 1
+            if func in self._pending:
+                self.coalesced += 1
+            self._pending[func] = (True, args)
+
+    def apply(self):
+        # timer slot, gui thread only
+        if not self._pending:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        self.frames += 1
+        for func, (call, args) in pending.items():
+            if not call:
+                if self._applied.get(func, _UNSET) == args[0]:
+                    # set back to the shown value before the frame
+                    self.unchanged += 1
+                    continue
+                self._applied[func] = args[0]
+            self.applied += 1
+            # noinspection PyBroadException
+            try:
+                func(*args)
+            except Exception:
+                logger.exception(f"View update {func} failed")
+
+    def stop(self):
+        self._timer.stop()
+
+    def stats(self) -> dict:
+        return {
+            "writes": self.writes,
+            "coalesced": self.coalesced,
+            "unchanged": self.unchanged,
+            "applied": self.applied,
+            "frames": self.frames,
+        }
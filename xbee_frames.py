@@ -0,0 +1,167 @@
+# XBee API frame helpers for Kevinbot v3
+# Matches the xbee library's XBee class: 802.15.4 firmware, API mode 1 (unescaped)
+import struct
+from typing import Iterator, Optional
+
+START_BYTE = 0x7E
+# anything longer is a stray start byte, real frames stay well below this
+MAX_FRAME_LENGTH = 512
+
+# api ids
+TX_LONG_ADDR = 0x00
+TX = 0x01
+AT = 0x08
+AT_RESPONSE = 0x88
+TX_STATUS = 0x89
+RX_LONG_ADDR = 0x80
+RX = 0x81
+
+
+def checksum(data: bytes) -> int:
+    return 0xFF - (sum(data) & 0xFF)
+
+
+def build(data: bytes) -> bytes:
+    # wrap frame data with start byte, length and checksum
+    return (
+        bytes((START_BYTE,))
+        + struct.pack(">H", len(data))
+        + data
+        + bytes((checksum(data),))
+    )
+
+
+def tx(
+    data: bytes, dest_addr: bytes = b"\x00\x00", frame_id: int = 0, options: int = 0
+) -> bytes:
+    return build(bytes((TX, frame_id)) + dest_addr + bytes((options,)) + data)
+
+
+def rx(
+    data: bytes, source_addr: bytes = b"\x00\x00", rssi: int = 40, options: int = 0
+) -> bytes:
+    return build(bytes((RX,)) + source_addr + bytes((rssi, options)) + data)
+
+
+def tx_status(frame_id: int, status: int = 0) -> bytes:
+    return build(bytes((TX_STATUS, frame_id, status)))
+
+
+def at(command: bytes, parameter: bytes = b"", frame_id: int = 1) -> bytes:
+    return build(bytes((AT, frame_id)) + command + parameter)
+
+
+def at_response(
+    frame_id: int, command: bytes, status: int = 0, parameter: bytes = b""
+) -> bytes:
+    return build(
+        bytes((AT_RESPONSE, frame_id)) + command + bytes((status,)) + parameter
+    )
+
+
+def parse(data: bytes) -> Optional[dict]:
+    """
+    Decode frame data into the same dict the xbee library builds.
+    Returns None for api ids the remote doesn't use.
+    """
+    api_id = data[0]
+    if api_id in (RX, RX_LONG_ADDR):
+        # like the xbee library, empty trailing fields are left out
+        addr = 3 if api_id == RX else 9
+        frame = {
+            "id": "rx" if api_id == RX else "rx_long_addr",
+            "source_addr": data[1:addr],
+            "rssi": data[addr : addr + 1],
+            "options": data[addr + 1 : addr + 2],
+        }
+        if len(data) > addr + 2:
+            frame["rf_data"] = data[addr + 2 :]
+        return frame
+    if api_id == TX_STATUS:
+        return {"id": "tx_status", "frame_id": data[1:2], "status": data[2:3]}
+    if api_id == AT_RESPONSE:
+        response = {
+            "id": "at_response",
+            "frame_id": data[1:2],
+            "command": data[2:4],
+            "status": data[4:5],
+        }
+        if len(data) > 5:
+            response["parameter"] = data[5:]
+        return response
+    return None
+
+
+class FrameReader:
+    """
+    Incremental frame parser over a preallocated buffer.
+
+    Bytes are copied into the buffer once as they arrive. Complete frames
+    with a valid checksum are returned as their frame data (api id first),
+    either as memoryview slices of the buffer by views() or as bytes by
+    feed(). Bad frames are skipped.
+
+    Views are only valid until the next call. When the end of the buffer is
+    reached the unparsed tail is moved back to the front, so a frame is
+    always contiguous. The buffer grows if a single frame doesn't fit.
+    """
+
+    def __init__(self, size: int = 4096):
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self.bad_frames = 0
+
+    def feed(self, data: bytes) -> list[bytes]:
+        return [bytes(frame) for frame in self.views(data)]
+
+    def views(self, data: bytes) -> list[memoryview]:
+        self._write(data)
+        return list(self._frames())
+
+    def _write(self, data: bytes):
+        size = len(data)
+        if self._start == self._end:
+            self._start = self._end = 0
+        if self._end + size > len(self._buffer):
+            pending = self._end - self._start
+            if pending + size > len(self._buffer):
+                buffer = bytearray(max(len(self._buffer) * 2, pending + size))
+                buffer[:pending] = self._view[self._start : self._end]
+                self._buffer = buffer
+                self._view = memoryview(buffer)
+            else:
+                self._view[:pending] = self._view[self._start : self._end]
+            self._start = 0
+            self._end = pending
+        self._view[self._end : self._end + size] = data
+        self._end += size
+
+    def _frames(self) -> Iterator[memoryview]:
+        buffer = self._buffer
+        view = self._view
+        while True:
+            start = buffer.find(START_BYTE, self._start, self._end)
+            if start < 0:
+                self._start = self._end = 0
+                return
+            self._start = start
+            if self._end - start < 3:
+                return
+            length = (buffer[start + 1] << 8) | buffer[start + 2]
+            if length > MAX_FRAME_LENGTH:
+                self.bad_frames += 1
+                self._start = start + 1
+                continue
+            if self._end - start < length + 4:
+                return
+            data = view[start + 3 : start + 3 + length]
+            if checksum(data) != buffer[start + 3 + length]:
+                # resync on the next start byte
+                self.bad_frames += 1
+                self._start = start + 1
+                continue
+            self._start = start + length + 4
+            if length:
+                yield data